@@ -0,0 +1,140 @@
+"""
+Benchmark throughput pesan grup yang ramai.
+
+Membandingkan dua cara menyaring pesan grup lewat Application.process_update:
+  - lama: setiap pesan teks menjalankan coroutine handler yang me-lowercase pesan dan
+    mengulang GROUP_TRIGGER_COMMANDS (seperti handle_message sebelumnya)
+  - baru: filter trigger_matcher.ADDRESSED_TO_BOT menolak pesan di check_update,
+    jadi coroutine handler hanya dijadwalkan untuk pesan yang memang untuk bot
+
+Versi lama tidak mengenali "/ai@namabot", jadi jumlah pesan yang dibalas lebih sedikit.
+
+Pemakaian:
+    python benchmarks/bench_group_triggers.py --messages 50000 --addressed-ratio 0.02
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Update
+from telegram.ext import Application, MessageHandler, filters
+import config
+import fakes
+import trigger_matcher
+
+BOT_ID = 999000
+BOT_USERNAME = "benchbot"
+GROUP_CHAT_ID = -100123
+
+logger = logging.getLogger("bench_group_triggers")
+
+
+def build_updates(count: int, addressed_ratio: float, bot) -> list[Update]:
+    rng = random.Random(42)
+    words = ["halo", "semua", "besok", "rapat", "jam", "berapa", "oke", "siap", "makan", "siang", "dimana", "link"]
+    updates = []
+    for update_id in range(count):
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(3, 25)))
+        if rng.random() < addressed_ratio:
+            trigger = rng.choice(config.GROUP_TRIGGER_COMMANDS)
+            text = f"{trigger}@{BOT_USERNAME} {text}" if rng.random() < 0.5 else f"{trigger} {text}"
+        data = {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": 0,
+                "chat": {"id": GROUP_CHAT_ID, "type": "supergroup", "title": "Grup Ramai"},
+                "from": {"id": 1000 + rng.randint(0, 500), "is_bot": False, "first_name": "User"},
+                "text": text,
+            },
+        }
+        updates.append(Update.de_json(data, bot))
+    return updates
+
+
+def legacy_should_respond(message) -> bool:
+    """Logika penyaringan grup versi lama di dalam handler."""
+    user_message = message.text
+    logger.debug(f"Pesan di grup {message.chat_id}. Mengecek kondisi respon...")
+    if message.reply_to_message and message.reply_to_message.from_user.id == BOT_ID:
+        return True
+    msg_lower = user_message.lower()
+    for trigger_command_config in config.GROUP_TRIGGER_COMMANDS:
+        trigger = trigger_command_config.lower()
+        if msg_lower.startswith(trigger):
+            if len(msg_lower) == len(trigger):
+                return True
+            if len(msg_lower) > len(trigger) and msg_lower[len(trigger)].isspace():
+                return True
+    logger.debug(f"Pesan di grup {message.chat_id} bukan reply ke bot dan tidak menggunakan trigger command yang valid. Bot tidak merespon.")
+    return False
+
+
+def build_application() -> Application:
+    return Application.builder()\
+        .token(f"{BOT_ID}:bench")\
+        .request(fakes.FakeTelegramRequest(bot_id=BOT_ID, bot_username=BOT_USERNAME))\
+        .get_updates_request(fakes.FakeTelegramRequest(bot_id=BOT_ID, bot_username=BOT_USERNAME))\
+        .build()
+
+
+async def run_case(name: str, handler_filter, callback, updates: list[Update]) -> dict:
+    application = build_application()
+    await application.initialize()
+    application.add_handler(MessageHandler(handler_filter, callback))
+    started_at = time.perf_counter()
+    for update in updates:
+        await application.process_update(update)
+    elapsed = time.perf_counter() - started_at
+    await application.shutdown()
+    return {"name": name, "elapsed": elapsed, "per_second": len(updates) / elapsed}
+
+
+async def main_async(args) -> None:
+    application = build_application()
+    updates = build_updates(args.messages, args.addressed_ratio, application.bot)
+    trigger_matcher.set_bot_identity(BOT_ID, BOT_USERNAME)
+
+    handled = {"legacy": 0, "baru": 0}
+
+    async def legacy_handler(update, context):
+        if legacy_should_respond(update.message):
+            handled["legacy"] += 1
+
+    async def new_handler(update, context):
+        handled["baru"] += 1
+
+    base_filter = filters.TEXT & (~filters.UpdateType.EDITED_MESSAGE)
+    results = [
+        await run_case("legacy", base_filter, legacy_handler, updates),
+        await run_case("baru", base_filter & trigger_matcher.ADDRESSED_TO_BOT, new_handler, updates),
+    ]
+
+    print(f"{args.messages} pesan grup, {args.addressed_ratio:.0%} ditujukan ke bot (log level {logging.getLevelName(logging.getLogger().level)}):")
+    for result in results:
+        print(f"  {result['name']:<7} {result['elapsed'] * 1000:9.1f} ms  {result['per_second']:10.0f} pesan/detik  dibalas: {handled[result['name']]}")
+    print(f"  percepatan: {results[0]['elapsed'] / results[1]['elapsed']:.1f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--addressed-ratio", type=float, default=0.02)
+    parser.add_argument("--debug-logging", action="store_true", help="Aktifkan log DEBUG seperti di main.py (ditulis ke os.devnull)")
+    args = parser.parse_args()
+
+    if args.debug_logging:
+        logging.basicConfig(level=logging.DEBUG, stream=open(os.devnull, "w"))
+    else:
+        logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Benchmark memori untuk riwayat dan buffer album.
+
+Yang tinggal di memori per chat hanya state album (bot_data['media_groups'] dan
+bot_data['recent_albums']). Riwayat tidak di-cache per chat: riwayat diambil dari backend
+di setiap permintaan dan dilepas setelah permintaan selesai, jadi yang berada di memori
+sekaligus hanya riwayat permintaan yang sedang berjalan (dibatasi GEMINI_MAX_CONCURRENT_REQUESTS).
+Angka riwayat di bawah adalah byte per permintaan yang berjalan, bukan per chat.
+
+Membandingkan (dengan tracemalloc) format lama dan format records.py:
+  - riwayat: list dict {"role", "parts": [{"text"}]} vs records.HistoryTurn dengan role yang di-intern,
+    dibangun dari baris database seperti di supabase_manager._format_history_rows
+  - album tertunda: list dict per gambar di bot_data['media_groups'] vs records.AlbumImage
+  - album terakhir untuk /td: list dict vs tuple records.AlbumImage
+
+Teks pesan dan file_id ikut dihitung di kedua format, jadi selisihnya murni overhead struktur.
+Juga mengukur biaya records.to_sdk_history(), yang sekarang dijalankan sekali per permintaan ke Gemini.
+
+Pemakaian:
+    python benchmarks/bench_memory.py --chats 20000 --album-size 4
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import records
+import supabase_manager
+
+
+def legacy_format_history_rows(rows: list) -> list:
+    """Format riwayat versi lama (sebelum records.HistoryTurn), tanpa gambar."""
+    formatted_history = []
+    for item in rows:
+        parts = [{"text": item["content"]}]
+        formatted_history.append({"role": item["role"], "parts": parts})
+    formatted_history.reverse()
+    return formatted_history
+
+
+def legacy_album_image(file_id: str, file_unique_id: str, caption: str | None, message_id: int) -> dict:
+    return {'file_id': file_id, 'file_unique_id': file_unique_id, 'caption': caption, 'message_id': message_id}
+
+
+def new_album_image(file_id: str, file_unique_id: str, caption: str | None, message_id: int) -> records.AlbumImage:
+    return records.AlbumImage(file_id, file_unique_id, caption, message_id)
+
+
+def legacy_recent_album(images: list) -> list:
+    return [{'file_id': img['file_id'], 'file_unique_id': img.get('file_unique_id'), 'caption': img.get('caption')} for img in images]
+
+
+def new_recent_album(images: list) -> tuple:
+    return tuple(images)
+
+
+def fresh(text: str) -> str:
+    # Salinan string baru, seperti string yang dibuat driver database/JSON untuk setiap baris
+    return "".join([text[:1], text[1:]])
+
+
+def build_rows(rng: random.Random, count: int) -> list:
+    return [
+        {
+            "role": fresh("user" if i % 2 else "model"),
+            "content": fresh("x" * rng.randint(20, 400)),
+            "image_refs": None,
+        }
+        for i in range(count)
+    ]
+
+
+def measure(build) -> tuple[int, object]:
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    return used, result
+
+
+def bench_history(chats: int, turns: int, format_rows) -> int:
+    rng = random.Random(42)
+
+    def build():
+        histories = []
+        for _ in range(chats):
+            rows = build_rows(rng, turns)
+            histories.append(format_rows(rows))
+            del rows
+        return histories
+
+    used, _ = measure(build)
+    return used
+
+
+def bench_albums(chats: int, album_size: int, make_image, make_recent) -> tuple[int, int]:
+    rng = random.Random(42)
+
+    def build_pending():
+        media_groups = {}
+        for chat_index in range(chats):
+            chat_id = 1000 + chat_index
+            images = [
+                make_image(fresh(f"AgACAgUAAxkBAAI{rng.getrandbits(160):040x}"), fresh(f"AQAD{rng.getrandbits(64):016x}"),
+                           fresh("caption album") if i == 0 else None, 10 + i)
+                for i in range(album_size)
+            ]
+            media_groups.setdefault(chat_id, {})[fresh(str(rng.getrandbits(60)))] = images
+        return media_groups
+
+    pending_used, media_groups = measure(build_pending)
+
+    def build_recent():
+        return {f"{chat_id}_{mgid}": make_recent(images) for chat_id, groups in media_groups.items() for mgid, images in groups.items()}
+
+    recent_used, _ = measure(build_recent)
+    return pending_used, recent_used
+
+
+def bench_conversion(turns: int, repeat: int = 20000) -> float:
+    rng = random.Random(7)
+    history = supabase_manager._format_history_rows(build_rows(rng, turns))
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        records.to_sdk_history(history)
+    return (time.perf_counter() - started_at) / repeat
+
+
+def print_row(label: str, legacy_bytes: int, new_bytes: int, chats: int) -> None:
+    legacy_per_chat = legacy_bytes / chats
+    new_per_chat = new_bytes / chats
+    saved = 1 - new_bytes / legacy_bytes if legacy_bytes else 0.0
+    print(f"  {label:<28} {legacy_per_chat:>10.0f} {new_per_chat:>10.0f} {saved:>8.0%}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=20000)
+    parser.add_argument("--turns", type=int, default=config.CHAT_HISTORY_MESSAGES_LIMIT, help="Giliran riwayat per chat")
+    parser.add_argument("--album-size", type=int, default=4)
+    args = parser.parse_args()
+
+    legacy_history = bench_history(args.chats, args.turns, legacy_format_history_rows)
+    new_history = bench_history(args.chats, args.turns, supabase_manager._format_history_rows)
+    legacy_pending, legacy_recent = bench_albums(args.chats, args.album_size, legacy_album_image, legacy_recent_album)
+    new_pending, new_recent = bench_albums(args.chats, args.album_size, new_album_image, new_recent_album)
+
+    print(f"{args.chats} chat aktif dengan album {args.album_size} gambar (state yang tinggal di memori)")
+    print(f"  {'byte per chat':<28} {'lama':>10} {'baru':>10} {'hemat':>8}")
+    print_row("album tertunda", legacy_pending, new_pending, args.chats)
+    print_row("album terakhir (/td)", legacy_recent, new_recent, args.chats)
+    print_row("total", legacy_pending + legacy_recent, new_pending + new_recent, args.chats)
+    print(f"\nRiwayat {args.turns} giliran, hanya selama permintaan berjalan (tidak di-cache per chat)")
+    print(f"  {'byte per permintaan':<28} {'lama':>10} {'baru':>10} {'hemat':>8}")
+    print_row("riwayat", legacy_history, new_history, args.chats)
+    print(f"\nrecords.to_sdk_history() untuk {args.turns} giliran: {bench_conversion(args.turns) * 1e6:.1f} µs per permintaan")
+
+
+if __name__ == "__main__":
+    main()
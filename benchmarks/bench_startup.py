@@ -0,0 +1,76 @@
+"""
+Benchmark waktu startup bot.
+
+Setiap percobaan menjalankan interpreter baru, lalu mengukur:
+  - import: waktu `import main` (semua modul bot, tanpa SDK berat)
+  - warm_up: waktu inisialisasi Supabase, model Gemini, dan SQLite secara bersamaan
+  - ready: waktu dari awal proses sampai bot siap memproses update
+
+Tidak ada request jaringan: kunci API dan URL Supabase diisi nilai palsu.
+
+Pemakaian:
+    python benchmarks/bench_startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD_SCRIPT = """
+import time
+started_at = time.perf_counter()
+import asyncio, json, logging
+logging.disable(logging.CRITICAL)
+import main
+import startup
+import_time = time.perf_counter() - started_at
+asyncio.run(startup.warm_up())
+print(json.dumps({
+    "import": import_time,
+    "warm_up": startup.startup_timings["warm_up"],
+    "ready": time.perf_counter() - started_at,
+    "steps": {name: startup.startup_timings[name] for name in ("supabase", "gemini", "sqlite")},
+}))
+"""
+
+
+def run_once(env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", CHILD_SCRIPT],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--backend", choices=("supabase", "sqlite"), default="supabase")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.update({
+        "TELEGRAM_TOKEN": env.get("TELEGRAM_TOKEN", "123456:bench"),
+        "GEMINI_API_KEY": "bench-key",
+        "SUPABASE_URL": "https://bench.supabase.co",
+        "SUPABASE_KEY": "bench-key",
+        "HISTORY_BACKEND": args.backend,
+        "SQLITE_HISTORY_PATH": os.path.join(ROOT_DIR, "data", "bench_startup.sqlite3"),
+    })
+
+    results = [run_once(env) for _ in range(args.runs)]
+    print(f"Startup ({args.runs} percobaan, backend {args.backend}), median dalam milidetik:")
+    for key in ("import", "warm_up", "ready"):
+        values = [result[key] * 1000 for result in results]
+        print(f"  {key:<10} {statistics.median(values):8.1f}  (min {min(values):.1f}, maks {max(values):.1f})")
+    for step in ("supabase", "gemini", "sqlite"):
+        values = [result["steps"][step] * 1000 for result in results]
+        print(f"    {step:<8} {statistics.median(values):8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""
+Replay beban dari rekaman update Telegram (update_recorder.py).
+
+Update rekaman dimasukkan ke Application yang dibangun dengan main.build_application() dan
+main.register_handlers(), jadi melewati filter dan handler yang sama dengan produksi, tetapi
+Telegram, Gemini, dan Supabase diganti backend palsu dari fakes.py. Jeda antar update mengikuti
+rekaman dan dipercepat dengan --speed (0 = secepat mungkin).
+
+Yang dilaporkan: throughput, latensi per update (p50/p95/p99) per jenis update, durasi job album,
+jumlah error (exception handler, log ERROR, error Gemini palsu), serta jumlah panggilan ke backend.
+
+Tanpa rekaman, --synthetic N membuat campuran trafik (chat pribadi, obrolan grup, trigger grup,
+/td, foto, dan album) ke file rekaman lalu me-replay-nya.
+
+Pemakaian:
+    python benchmarks/replay_updates.py data/updates.jsonl --speed 10 --concurrency 16
+    python benchmarks/replay_updates.py data/synthetic.jsonl --synthetic 2000 --speed 0 --gemini-latency 0.5
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Update
+import config
+import bot_handlers
+import fakes
+import main as bot_main
+import pipeline
+import sqlite_history
+import startup
+import supabase_manager
+import trigger_matcher
+import update_recorder
+import usage_log
+
+logger = logging.getLogger("replay_updates")
+
+DEFAULT_BOT_ID = 999000
+DEFAULT_BOT_USERNAME = "fakebot"
+
+
+class ErrorLogCounter(logging.Handler):
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+def classify_update(update: Update) -> str:
+    message = update.message
+    if message is None:
+        return "edited" if update.edited_message else "lainnya"
+    if message.photo:
+        return "album" if message.media_group_id else "foto"
+    if not message.text:
+        return "lainnya"
+    is_group = message.chat.type in trigger_matcher.GROUP_CHAT_TYPES
+    if message.text.startswith("/"):
+        command = message.text.split(None, 1)[0][1:].split("@", 1)[0].lower()
+        if command in config.COMMANDS:
+            return f"/{command}"
+        if is_group and trigger_matcher.match(message.text):
+            return "trigger_grup"
+    if is_group:
+        return "reply_grup" if trigger_matcher.is_reply_to_bot(message) else "obrolan_grup"
+    return "teks_pribadi"
+
+
+def build_synthetic_trace(path: str, count: int, seed: int = 42) -> None:
+    """Menulis rekaman sintetis dengan campuran trafik yang umum di produksi."""
+    rng = random.Random(seed)
+    words = ["halo", "tolong", "jelaskan", "apa", "itu", "besok", "rapat", "kode", "error", "python", "gambar", "ini"]
+    bot_user = {"id": DEFAULT_BOT_ID, "is_bot": True, "first_name": "Fake Bot", "username": DEFAULT_BOT_USERNAME}
+    group_chats = [{"id": -1000000000 - i, "type": "supergroup", "title": "Chat"} for i in range(5)]
+    users = [{"id": 1000 + i, "is_bot": False, "first_name": "User"} for i in range(200)]
+    trigger = (config.GROUP_TRIGGER_COMMANDS or ["/ai"])[0]
+
+    ts = time.time()
+    message_id = 0
+    update_id = 0
+    records = []
+
+    def add(message: dict, gap: float) -> None:
+        nonlocal ts, update_id, message_id
+        ts += gap
+        update_id += 1
+        message_id += 1
+        records.append({"ts": ts, "update": {"update_id": update_id, "message": {
+            "message_id": message_id, "date": int(ts), **message}}})
+
+    def sentence() -> str:
+        return " ".join(rng.choice(words) for _ in range(rng.randint(3, 30)))
+
+    def photo(file_key: str) -> list:
+        return [{"file_id": f"{file_key}_{size}", "file_unique_id": f"{file_key}_{size}"[-16:], "width": size, "height": size}
+                for size in (90, 320, 1280)]
+
+    while update_id < count:
+        user = rng.choice(users)
+        private_chat = {"id": user["id"], "type": "private", "first_name": "User"}
+        group_chat = rng.choice(group_chats)
+        gap = rng.expovariate(5.0)
+        kind = rng.random()
+        if kind < 0.35:
+            add({"chat": private_chat, "from": user, "text": sentence()}, gap)
+        elif kind < 0.65:
+            add({"chat": group_chat, "from": user, "text": sentence()}, gap)
+        elif kind < 0.75:
+            text = f"{trigger} {sentence()}"
+            add({"chat": group_chat, "from": user, "text": text,
+                 "entities": [{"type": "bot_command", "offset": 0, "length": len(trigger)}]}, gap)
+        elif kind < 0.80:
+            reply = {"message_id": message_id, "date": int(ts), "chat": group_chat, "from": bot_user, "text": sentence()}
+            add({"chat": group_chat, "from": user, "text": sentence(), "reply_to_message": reply}, gap)
+        elif kind < 0.87:
+            text = f"/td {sentence()}"
+            add({"chat": private_chat, "from": user, "text": text,
+                 "entities": [{"type": "bot_command", "offset": 0, "length": 3}]}, gap)
+        elif kind < 0.93:
+            add({"chat": private_chat, "from": user, "photo": photo(f"p{update_id}"), "caption": sentence()}, gap)
+        else:
+            media_group_id = f"mg{update_id}"
+            for index in range(rng.randint(2, 5)):
+                message = {"chat": private_chat, "from": user, "photo": photo(f"a{update_id}_{index}"),
+                           "media_group_id": media_group_id}
+                if index == 0:
+                    message["caption"] = sentence()
+                add(message, gap if index == 0 else 0.05)
+
+    with open(path, "w", encoding="utf-8") as trace_file:
+        trace_file.write(json.dumps({"meta": {"bot_id": DEFAULT_BOT_ID, "bot_username": DEFAULT_BOT_USERNAME, "synthetic": True}}) + "\n")
+        for record in records[:count]:
+            trace_file.write(json.dumps(record) + "\n")
+
+
+def configure_backends(args, work_dir: str) -> None:
+    """Mengarahkan semua penulisan ke folder sementara dan mematikan fitur yang tidak relevan untuk replay."""
+    config.IMAGE_CACHE_DIR = os.path.join(work_dir, "image_cache")
+    config.PENDING_ALBUMS_SNAPSHOT_PATH = os.path.join(work_dir, "pending_albums.json")
+    config.THROTTLE_STATE_PATH = None
+    config.USAGE_LOG_ENABLED = False
+    config.UPDATE_RECORDER_ENABLED = False
+    config.SQLITE_REPLICATE_TO_SUPABASE = False
+    config.THROTTLE_ENABLED = config.THROTTLE_ENABLED and not args.no_throttle
+    config.HISTORY_BACKEND = args.backend
+    if args.backend == "sqlite":
+        config.SQLITE_HISTORY_PATH = os.path.join(work_dir, "chat_history.sqlite3")
+
+
+async def replay(args, meta: dict, entries: list[dict]) -> dict:
+    bot_id = meta.get("bot_id") or DEFAULT_BOT_ID
+    bot_username = meta.get("bot_username") or DEFAULT_BOT_USERNAME
+    telegram_request = fakes.FakeTelegramRequest(bot_id=bot_id, bot_username=bot_username, latency=args.telegram_latency)
+    application = bot_main.build_application(
+        token=f"{bot_id}:replay",
+        request=telegram_request,
+        get_updates_request=fakes.FakeTelegramRequest(bot_id=bot_id, bot_username=bot_username),
+    )
+    bot_main.register_handlers(application)
+
+    handler_errors = Counter()
+
+    async def count_error(update, context):
+        handler_errors[type(context.error).__name__] += 1
+
+    application.add_error_handler(count_error)
+
+    fake_models = fakes.install_fake_gemini(
+        latency=args.gemini_latency, latency_jitter=args.gemini_jitter, error_rate=args.gemini_error_rate, seed=args.seed
+    )
+    fake_supabase = None
+    if args.backend == "supabase":
+        fake_supabase = fakes.FakeSupabaseClient(latency=args.supabase_latency)
+        supabase_manager.supabase_client = fake_supabase
+
+    # Album diukur dari job dijalankan sampai selesai (setelah MEDIA_GROUP_PROCESSING_DELAY)
+    album_durations = []
+    process_media_group_callback = bot_handlers.process_media_group_callback
+
+    async def timed_media_group_callback(context):
+        started_at = time.perf_counter()
+        try:
+            await process_media_group_callback(context)
+        finally:
+            album_durations.append(time.perf_counter() - started_at)
+
+    bot_handlers.process_media_group_callback = timed_media_group_callback
+
+    await application.initialize()
+    await application.start()
+    trigger_matcher.set_bot_identity(application.bot.id, application.bot.username)
+    startup.ready_event.set()
+
+    latencies = defaultdict(list)
+    process_errors = Counter()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    tasks = set()
+
+    async def process(update: Update, kind: str) -> None:
+        started_at = time.perf_counter()
+        try:
+            await application.process_update(update)
+        except Exception as e:
+            process_errors[type(e).__name__] += 1
+        finally:
+            latencies[kind].append(time.perf_counter() - started_at)
+            semaphore.release()
+
+    started_at = time.perf_counter()
+    replay_offset = 0.0
+    previous_ts = entries[0]["ts"] if entries else 0.0
+    for entry in entries:
+        replay_offset += min(max(entry["ts"] - previous_ts, 0.0), args.max_gap)
+        previous_ts = entry["ts"]
+        if args.speed > 0:
+            delay = started_at + replay_offset / args.speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        update = Update.de_json(entry["update"], application.bot)
+        await semaphore.acquire()
+        task = asyncio.create_task(process(update, classify_update(update)))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.gather(*tasks)
+    # Tunggu album yang masih menunggu jadwal job dan permintaan AI yang masih berjalan
+    while any(job.name.startswith("process_media_group_") for job in application.job_queue.jobs()) or pipeline.in_flight_count():
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started_at
+
+    await application.stop()
+    await application.shutdown()
+    bot_handlers.process_media_group_callback = process_media_group_callback
+    sqlite_history.close_store()
+
+    return {
+        "updates": len(entries),
+        "elapsed": elapsed,
+        "latencies": latencies,
+        "album_durations": album_durations,
+        "handler_errors": handler_errors,
+        "process_errors": process_errors,
+        "gemini_calls": sum(model.calls for model in fake_models.values()),
+        "gemini_failures": sum(model.failures for model in fake_models.values()),
+        "telegram_calls": Counter(telegram_request.calls),
+        "supabase_calls": fake_supabase.calls if fake_supabase else Counter(),
+    }
+
+
+def print_summary(result: dict, error_logs: int) -> None:
+    all_latencies = [latency for values in result["latencies"].values() for latency in values]
+    print(f"{result['updates']} update dalam {result['elapsed']:.2f} detik ({result['updates'] / result['elapsed']:.1f} update/detik)")
+
+    print("\nLatensi per update (ms):")
+    print(f"  {'jenis':<16} {'jumlah':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'maks':>9}")
+    rows = sorted(result["latencies"].items()) + [("semua", all_latencies)]
+    for kind, values in rows:
+        if not values:
+            continue
+        print(f"  {kind:<16} {len(values):>7} {usage_log.percentile(values, 0.50) * 1000:>9.1f} "
+              f"{usage_log.percentile(values, 0.95) * 1000:>9.1f} {usage_log.percentile(values, 0.99) * 1000:>9.1f} "
+              f"{max(values) * 1000:>9.1f}")
+    album_durations = result["album_durations"]
+    if album_durations:
+        print(f"  {'job album':<16} {len(album_durations):>7} {usage_log.percentile(album_durations, 0.50) * 1000:>9.1f} "
+              f"{usage_log.percentile(album_durations, 0.95) * 1000:>9.1f} {usage_log.percentile(album_durations, 0.99) * 1000:>9.1f} "
+              f"{max(album_durations) * 1000:>9.1f}")
+
+    print("\nError:")
+    print(f"  exception di handler: {sum(result['handler_errors'].values())} {dict(result['handler_errors']) or ''}")
+    print(f"  exception di process_update: {sum(result['process_errors'].values())} {dict(result['process_errors']) or ''}")
+    print(f"  log ERROR: {error_logs}")
+    print(f"  error Gemini palsu: {result['gemini_failures']} dari {result['gemini_calls']} panggilan")
+
+    print("\nPanggilan backend:")
+    print(f"  Telegram: {dict(result['telegram_calls'].most_common())}")
+    if result["supabase_calls"]:
+        print(f"  Supabase: {dict(result['supabase_calls'])}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace", help="File rekaman dari update_recorder (UPDATE_RECORDER_PATH)")
+    parser.add_argument("--synthetic", type=int, default=0, help="Buat N update sintetis ke file trace sebelum replay")
+    parser.add_argument("--speed", type=float, default=1.0, help="Pengali kecepatan replay (0 = secepat mungkin)")
+    parser.add_argument("--max-gap", type=float, default=5.0, help="Jeda maksimal antar update dari rekaman (detik, sebelum --speed)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Maksimal update yang diproses bersamaan")
+    parser.add_argument("--limit", type=int, default=0, help="Hanya replay N update pertama")
+    parser.add_argument("--backend", choices=("supabase", "sqlite"), default="supabase",
+                        help="Riwayat di Supabase palsu (memori) atau SQLite sementara")
+    parser.add_argument("--gemini-latency", type=float, default=0.5)
+    parser.add_argument("--gemini-jitter", type=float, default=0.5)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--supabase-latency", type=float, default=0.02, help="Latensi (memblokir) per query Supabase palsu")
+    parser.add_argument("--telegram-latency", type=float, default=0.03, help="Latensi per panggilan Bot API palsu")
+    parser.add_argument("--no-throttle", action="store_true", help="Matikan rate limit dan kuota selama replay")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--debug-logging", action="store_true", help="Aktifkan log DEBUG seperti di main.py (ditulis ke os.devnull)")
+    args = parser.parse_args()
+
+    # main.py memasang log DEBUG ke stderr saat diimpor
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    if args.debug_logging:
+        logging.basicConfig(level=logging.DEBUG, stream=open(os.devnull, "w"))
+    else:
+        logging.basicConfig(level=logging.WARNING)
+    error_counter = ErrorLogCounter()
+    root_logger.addHandler(error_counter)
+
+    if args.synthetic:
+        build_synthetic_trace(args.trace, args.synthetic, seed=args.seed)
+    meta, entries = update_recorder.read_trace(args.trace)
+    if args.limit:
+        entries = entries[:args.limit]
+    if not entries:
+        sys.exit(f"Tidak ada update di {args.trace}.")
+
+    with tempfile.TemporaryDirectory(prefix="replay_") as work_dir:
+        configure_backends(args, work_dir)
+        result = asyncio.run(replay(args, meta, entries))
+    print_summary(result, error_counter.count)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,19 @@
+import asyncio
 import logging
 from telegram import Update, Message
-from telegram.constants import ChatAction, ParseMode, ChatType
+from telegram.constants import ParseMode, ChatType
 from telegram.ext import ContextTypes, CallbackContext
-from telegram.error import BadRequest, RetryAfter
+from telegram.error import BadRequest, RetryAfter, TelegramError
+import config
+import chat_action
 import gemini_client
-from config import (
-    GROUP_TRIGGER_COMMANDS,
-    IMAGE_UNDERSTANDING_ENABLED,
-    MAX_IMAGE_INPUT,
-    MEDIA_GROUP_PROCESSING_DELAY,
-    DEFAULT_PROMPT_FOR_IMAGE_IF_NO_CAPTION
-)
+import http_pool
+import image_cache
+import lifecycle
+import records
+import supabase_manager
+import throttle
+import trigger_matcher
 
 
 logger = logging.getLogger(__name__)
@@ -18,7 +21,7 @@ logger = logging.getLogger(__name__)
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = update.effective_user
     chat_id = update.message.chat_id
-    if gemini_client.reset_chat_history(chat_id): # Modifikasi untuk cek return value reset
+    if await gemini_client.reset_chat_history(chat_id): # Modifikasi untuk cek return value reset
         logger.info(f"Riwayat chat untuk {chat_id} direset karena perintah /start.")
     else:
         logger.info(f"Tidak ada riwayat chat aktif untuk {chat_id} untuk direset saat /start.")
@@ -52,32 +55,21 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         logger.debug(f"Pesan di private chat {chat_id}. Bot akan merespon.")
     elif chat_type in [ChatType.GROUP, ChatType.SUPERGROUP]:
         logger.debug(f"Pesan di grup {chat_id}. Mengecek kondisi respon...")
-        bot_id = context.bot.id
-
-        if message.reply_to_message and message.reply_to_message.from_user.id == bot_id:
+        if trigger_matcher.is_reply_to_bot(message):
             should_respond = True
             actual_message_to_process = user_message
-            logger.info(f"Pesan di grup {chat_id} adalah reply ke bot (ID: {bot_id}). Bot akan merespon dengan: \"{actual_message_to_process}\"")
+            logger.info(f"Pesan di grup {chat_id} adalah reply ke bot. Bot akan merespon dengan: \"{actual_message_to_process}\"")
         else:
-            msg_lower = user_message.lower()
-            for trigger_command_config in GROUP_TRIGGER_COMMANDS:
-                trigger = trigger_command_config.lower()
-                if msg_lower.startswith(trigger):
-                    if len(msg_lower) == len(trigger):
-                        should_respond = True
-                        actual_message_to_process = ""
-                        trigger_command_used = trigger_command_config
-                        logger.info(f"Pesan di grup {chat_id} adalah trigger command '{trigger_command_config}' saja. Bot akan merespon.")
-                        break
-                    elif len(msg_lower) > len(trigger) and msg_lower[len(trigger)].isspace():
-                        should_respond = True
-                        actual_message_to_process = user_message[len(trigger):].strip()
-                        trigger_command_used = trigger_command_config
-                        logger.info(f"Pesan di grup {chat_id} menggunakan trigger command '{trigger_command_config}'. Teks diproses: \"{actual_message_to_process}\". Bot akan merespon.")
-                        break
-
-            if not should_respond:
-                 logger.debug(f"Pesan di grup {chat_id} bukan reply ke bot dan tidak menggunakan trigger command yang valid. Bot tidak merespon.")
+            trigger_match = trigger_matcher.match(user_message)
+            if trigger_match:
+                should_respond = True
+                trigger_command_used, actual_message_to_process = trigger_match
+                if actual_message_to_process:
+                    logger.info(f"Pesan di grup {chat_id} menggunakan trigger command '{trigger_command_used}'. Teks diproses: \"{actual_message_to_process}\". Bot akan merespon.")
+                else:
+                    logger.info(f"Pesan di grup {chat_id} adalah trigger command '{trigger_command_used}' saja. Bot akan merespon.")
+            else:
+                logger.debug(f"Pesan di grup {chat_id} bukan reply ke bot dan tidak menggunakan trigger command yang valid. Bot tidak merespon.")
 
     if not should_respond:
         logger.debug(f"Kondisi respon tidak terpenuhi untuk pesan di chat {chat_id}. Bot tidak mengirim balasan.")
@@ -89,17 +81,18 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
              await message.reply_text(f"Mohon sertakan pertanyaan Anda setelah `{trigger_command_used}` atau periksa /help.", parse_mode=ParseMode.MARKDOWN)
         return
 
-    await context.bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
-
+    if await reject_if_throttled(context, "text", user.id, chat_id, message):
+        return
 
     text_parts = [actual_message_to_process] if actual_message_to_process else []
 
-
-    gemini_reply = await gemini_client.generate_multimodal_response(
-        chat_id=chat_id,
-        prompt_parts=text_parts,
-        text_prompt_for_history=actual_message_to_process if actual_message_to_process else None
-    )
+    async with chat_action.keep_typing(context.bot, chat_id):
+        gemini_reply = await gemini_client.generate_multimodal_response(
+            chat_id=chat_id,
+            prompt_parts=text_parts,
+            text_prompt_for_history=actual_message_to_process if actual_message_to_process else None,
+            user_id=user.id
+        )
 
     if gemini_reply:
         try:
@@ -129,7 +122,7 @@ async def reset_chat(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     """Menangani perintah /reset."""
     chat_id = update.message.chat_id
     user = update.effective_user
-    if gemini_client.reset_chat_history(chat_id): # Memanggil reset dari gemini_client
+    if await gemini_client.reset_chat_history(chat_id): # Memanggil reset dari gemini_client
         await update.message.reply_text("Oke, saya telah melupakan percakapan kita sebelumnya di chat ini.")
         logger.info(f"User {user.id} ({user.first_name}) mereset riwayat di chat {chat_id}.")
     else:
@@ -142,13 +135,13 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     user = update.effective_user
     logger.info(f"User {user.id} ({user.first_name}) memanggil /help di chat {update.message.chat_id}.")
 
-    trigger_commands_text_list = [f"`{cmd}`" for cmd in GROUP_TRIGGER_COMMANDS]
+    trigger_commands_text_list = [f"`{cmd}`" for cmd in config.GROUP_TRIGGER_COMMANDS]
     trigger_commands_text = ", ".join(trigger_commands_text_list)
-    if not GROUP_TRIGGER_COMMANDS:
+    if not config.GROUP_TRIGGER_COMMANDS:
         trigger_commands_text = "(tidak ada yang diatur di config.py)"
         example_command = "/ai"
     else:
-        example_command = GROUP_TRIGGER_COMMANDS[0]
+        example_command = config.GROUP_TRIGGER_COMMANDS[0]
 
     help_text = (
         "Butuh bantuan? Berikut beberapa perintah yang bisa Anda gunakan:\n\n"
@@ -157,7 +150,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "`/help` - Menampilkan pesan bantuan ini.\n\n"
         f"**Cara Berinteraksi dengan AI:**\n"
         f"- Di chat pribadi dengan saya, Anda bisa langsung mengirimkan pesan atau pertanyaan.\n"
-        f"- Anda juga bisa mengirim gambar (dengan atau tanpa caption) untuk dijelaskan oleh AI (maks {MAX_IMAGE_INPUT} gambar per album).\n"
+        f"- Anda juga bisa mengirim gambar (dengan atau tanpa caption) untuk dijelaskan oleh AI (maks {config.MAX_IMAGE_INPUT} gambar per album).\n"
         f"- Di grup, Anda bisa:\n"
         f"  1. Membalas (reply) salah satu pesan saya.\n"
         f"  2. Menggunakan perintah pemicu seperti `{example_command} pertanyaan Anda`.\n\n"
@@ -166,15 +159,120 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     await update.message.reply_text(help_text, parse_mode=ParseMode.MARKDOWN)
 
 
+async def reject_if_throttled(context: CallbackContext, kind: str, user_id: int | None, chat_id: int, message: Message | None = None) -> bool:
+    """
+    Mengecek throttle sebelum memanggil Gemini. Jika ditolak, mengirim balasan penolakan
+    (paling banyak sekali per jendela waktu) dan mengembalikan True.
+    """
+    reason = throttle.check_request(kind, user_id, chat_id)
+    if reason is None:
+        return False
+    rejection_text = throttle.rejection_message(reason, kind, user_id, chat_id)
+    if rejection_text:
+        try:
+            if message:
+                await message.reply_text(rejection_text)
+            else:
+                await context.bot.send_message(chat_id, rejection_text)
+        except TelegramError as e:
+            logger.warning(f"Gagal mengirim pesan penolakan throttle ke chat {chat_id}: {e}")
+    return True
+
+
+async def download_image(context: CallbackContext, file_id: str, file_unique_id: str | None) -> tuple[bytes, dict]:
+    """
+    Mengunduh gambar dari Telegram (atau mengambilnya dari cache lokal jika sudah pernah diunduh)
+    dan mengembalikan bytes gambar beserta referensi ringkasnya untuk riwayat.
+    """
+    if file_unique_id:
+        cached = await asyncio.to_thread(image_cache.lookup_by_unique_id, file_unique_id)
+        if cached:
+            content_hash, image_bytes = cached
+            logger.debug(f"Gambar {file_unique_id} diambil dari cache lokal, tidak perlu diunduh ulang.")
+            return image_bytes, {"hash": content_hash, "mime_type": "image/jpeg", "file_unique_id": file_unique_id}
+
+    photo_tg_file = await context.bot.get_file(file_id)
+    image_bytes = bytes(await photo_tg_file.download_as_bytearray())
+    image_ref = await asyncio.to_thread(image_cache.store_image, image_bytes, file_unique_id)
+    return image_bytes, image_ref
+
+
+async def build_image_parts(context: CallbackContext, images: list[records.AlbumImage], log_label: str) -> tuple[list[dict], list[dict]]:
+    """
+    Pipeline gambar bersama untuk foto tunggal, album, dan /td.
+    Setiap item di images adalah records.AlbumImage (minimal berisi file_id).
+    Mengembalikan (bagian prompt gambar untuk Gemini, referensi gambar untuk riwayat).
+    Gambar yang gagal diunduh dilewati dan dicatat di log.
+    """
+    image_parts = []
+    image_refs = []
+    for img_detail in images:
+        if len(image_parts) >= config.MAX_IMAGE_INPUT:
+            logger.warning(f"Mencapai batas MAX_IMAGE_INPUT ({config.MAX_IMAGE_INPUT}) saat memproses gambar untuk {log_label}")
+            break
+        try:
+            logger.debug(f"Mengunduh file_id: {img_detail.file_id} untuk {log_label}")
+            image_bytes, image_ref = await download_image(context, img_detail.file_id, img_detail.file_unique_id)
+            image_parts.append({
+                "inline_data": {
+                    "mime_type": "image/jpeg",
+                    "data": image_bytes
+                }
+            })
+            image_refs.append(image_ref)
+        except Exception as e:
+            logger.error(f"Gagal mengunduh atau membuat Part untuk file_id {img_detail.file_id} dalam {log_label}: {e}")
+    return image_parts, image_refs
+
+
+def remember_album(context: CallbackContext, chat_id: int, media_group_id_str: str, images: list[records.AlbumImage]) -> None:
+    """Mengingat file_id gambar album yang sudah diproses agar /td yang membalas album bisa memakai semua gambarnya."""
+    recent_albums = context.bot_data.setdefault('recent_albums', {})
+    recent_albums[f"{chat_id}_{media_group_id_str}"] = tuple(images)
+    while len(recent_albums) > RECENT_ALBUMS_LIMIT:
+        recent_albums.pop(next(iter(recent_albums)))
+
+
+def get_album_images(context: CallbackContext, chat_id: int, media_group_id_str: str) -> list[records.AlbumImage]:
+    """Mengambil daftar gambar album, baik yang sudah diproses maupun yang masih menunggu di buffer."""
+    album_images = context.bot_data.get('recent_albums', {}).get(f"{chat_id}_{media_group_id_str}")
+    if album_images:
+        return album_images
+    return context.bot_data.get('media_groups', {}).get(chat_id, {}).get(media_group_id_str, [])
+
+
+def schedule_media_group_job(job_queue, chat_id: int, media_group_id_str: str, user_id: int | None) -> None:
+    """Menjadwalkan (atau mereset) job pemrosesan album setelah MEDIA_GROUP_PROCESSING_DELAY."""
+    job_name = f"process_media_group_{chat_id}_{media_group_id_str}"
+    current_jobs = job_queue.get_jobs_by_name(job_name)
+    for old_job in current_jobs:
+        old_job.schedule_removal()
+        logger.debug(f"Job lama '{old_job.name}' dihapus untuk direset.")
+    job_queue.run_once(
+        process_media_group_callback,
+        config.MEDIA_GROUP_PROCESSING_DELAY,
+        data={'media_group_id': media_group_id_str, 'chat_id': chat_id, 'user_id': user_id},
+        name=job_name
+    )
+    logger.debug(f"Job '{job_name}' dijadwalkan/direset dalam {config.MEDIA_GROUP_PROCESSING_DELAY} detik.")
+
+
+def restore_pending_albums(application) -> None:
+    """Memulihkan album yang tertunda saat shutdown sebelumnya dan menjadwalkan ulang pemrosesannya."""
+    for chat_id, media_group_id_str in lifecycle.load_pending_albums(application.bot_data):
+        schedule_media_group_job(application.job_queue, chat_id, media_group_id_str, None)
+
+
 async def handle_photo_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Menangani pesan yang berisi foto untuk fitur pemahaman gambar."""
-    if not IMAGE_UNDERSTANDING_ENABLED:
+    if not config.IMAGE_UNDERSTANDING_ENABLED:
         return
 
     message = update.message
     chat_id = message.chat_id
     user = update.effective_user
     photo_file_id = message.photo[-1].file_id
+    photo_file_unique_id = message.photo[-1].file_unique_id
     caption = message.caption
 
     logger.info(f"Menerima foto dari user {user.id} ({user.first_name}) di chat {chat_id}. File ID: {photo_file_id}, Caption: '{caption}'")
@@ -192,76 +290,65 @@ async def handle_photo_message(update: Update, context: ContextTypes.DEFAULT_TYP
 
         current_images_in_group = context.bot_data['media_groups'][chat_id][media_group_id_str]
 
-        is_duplicate = any(img['message_id'] == message.message_id for img in current_images_in_group)
+        is_duplicate = any(img.message_id == message.message_id for img in current_images_in_group)
 
-        if not is_duplicate and len(current_images_in_group) < MAX_IMAGE_INPUT:
-            current_images_in_group.append({
-                'file_id': photo_file_id,
-                'caption': caption,
-                'message_id': message.message_id
-            })
+        if not is_duplicate and len(current_images_in_group) < config.MAX_IMAGE_INPUT:
+            current_images_in_group.append(records.AlbumImage(photo_file_id, photo_file_unique_id, caption, message.message_id))
             logger.debug(f"Foto {photo_file_id} (msg_id: {message.message_id}) ditambahkan ke media group {media_group_id_str} (via bot_data). Total: {len(current_images_in_group)}")
 
-        elif not is_duplicate and len(current_images_in_group) >= MAX_IMAGE_INPUT:
-            logger.warning(f"Media group {media_group_id_str} sudah mencapai batas {MAX_IMAGE_INPUT} gambar (via bot_data). Foto {photo_file_id} (msg_id: {message.message_id}) tidak ditambahkan.")
+        elif not is_duplicate and len(current_images_in_group) >= config.MAX_IMAGE_INPUT:
+            logger.warning(f"Media group {media_group_id_str} sudah mencapai batas {config.MAX_IMAGE_INPUT} gambar (via bot_data). Foto {photo_file_id} (msg_id: {message.message_id}) tidak ditambahkan.")
             notified_key = f"notified_overflow_{chat_id}_{media_group_id_str}"
             if not context.bot_data.get(notified_key):
                 await message.reply_text(
-                    f"Anda mengirim terlalu banyak gambar dalam satu album. Hanya {MAX_IMAGE_INPUT} gambar pertama yang akan diproses.",
-                    quote=True
+                    f"Anda mengirim terlalu banyak gambar dalam satu album. Hanya {config.MAX_IMAGE_INPUT} gambar pertama yang akan diproses.",
+                    do_quote=True
                 )
                 context.bot_data[notified_key] = True
         elif is_duplicate:
              logger.debug(f"Foto {photo_file_id} (msg_id: {message.message_id}) adalah duplikat dalam media group {media_group_id_str}, diabaikan (via bot_data).")
 
-        job_name = f"process_media_group_{chat_id}_{media_group_id_str}"
-        current_jobs = context.job_queue.get_jobs_by_name(job_name)
-        for old_job in current_jobs:
-            old_job.schedule_removal()
-            logger.debug(f"Job lama '{old_job.name}' dihapus untuk direset.")
-        context.job_queue.run_once(
-            process_media_group_callback,
-            MEDIA_GROUP_PROCESSING_DELAY,
-            data={'media_group_id': media_group_id_str, 'chat_id': chat_id, 'user_id': user.id},
-            name=job_name
-        )
-        logger.debug(f"Job '{job_name}' dijadwalkan/direset dalam {MEDIA_GROUP_PROCESSING_DELAY} detik.")
+        schedule_media_group_job(context.job_queue, chat_id, media_group_id_str, user.id)
 
     else:
         logger.debug(f"Foto {photo_file_id} adalah gambar tunggal.")
-        await context.bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
+        if await reject_if_throttled(context, "image", user.id, chat_id, message):
+            return
         try:
-            photo_tg_file = await context.bot.get_file(photo_file_id)
-            image_bytes = bytes(await photo_tg_file.download_as_bytearray())
+            async with chat_action.keep_typing(context.bot, chat_id):
+                image_parts, image_refs = await build_image_parts(
+                    context,
+                    [records.AlbumImage(photo_file_id, photo_file_unique_id)],
+                    f"foto tunggal {photo_file_id}"
+                )
+                if not image_parts:
+                    await message.reply_text("Terjadi kesalahan saat memproses gambar Anda.", do_quote=True)
+                    return
 
-            prompt_parts = []
-            text_prompt = caption if caption else DEFAULT_PROMPT_FOR_IMAGE_IF_NO_CAPTION
+                prompt_parts = []
+                text_prompt = caption if caption else config.DEFAULT_PROMPT_FOR_IMAGE_IF_NO_CAPTION
 
-            if text_prompt:
-                prompt_parts.append(text_prompt)
+                if text_prompt:
+                    prompt_parts.append(text_prompt)
 
-            image_part_dict = {
-                "inline_data": {
-                    "mime_type": "image/jpeg",
-                    "data": image_bytes
-                }
-            }
-            prompt_parts.append(image_part_dict)
+                prompt_parts.extend(image_parts)
 
-            logger.info(f"Mengirim 1 gambar dan prompt '{text_prompt}' ke Gemini untuk chat {chat_id}.")
-            gemini_reply = await gemini_client.generate_multimodal_response(
-                chat_id=chat_id,
-                prompt_parts=prompt_parts,
-                text_prompt_for_history=text_prompt
-            )
+                logger.info(f"Mengirim 1 gambar dan prompt '{text_prompt}' ke Gemini untuk chat {chat_id}.")
+                gemini_reply = await gemini_client.generate_multimodal_response(
+                    chat_id=chat_id,
+                    prompt_parts=prompt_parts,
+                    text_prompt_for_history=text_prompt,
+                    image_refs=image_refs,
+                    user_id=user.id
+                )
 
             if gemini_reply:
-                await message.reply_text(gemini_reply, parse_mode=ParseMode.MARKDOWN, quote=True)
+                await message.reply_text(gemini_reply, parse_mode=ParseMode.MARKDOWN, do_quote=True)
             else:
-                await message.reply_text("Maaf, saya tidak bisa memproses gambar ini saat ini.", quote=True)
+                await message.reply_text("Maaf, saya tidak bisa memproses gambar ini saat ini.", do_quote=True)
         except Exception as e:
             logger.error(f"Error saat memproses foto tunggal {photo_file_id} untuk chat {chat_id}: {e}", exc_info=True)
-            await message.reply_text("Terjadi kesalahan saat memproses gambar Anda.", quote=True)
+            await message.reply_text("Terjadi kesalahan saat memproses gambar Anda.", do_quote=True)
 
 
 async def process_media_group_callback(context: CallbackContext):
@@ -269,6 +356,7 @@ async def process_media_group_callback(context: CallbackContext):
     job_data = context.job.data
     media_group_id_str = job_data['media_group_id']
     chat_id = job_data['chat_id']
+    user_id = job_data.get('user_id')
 
     logger.info(f"Callback dipanggil untuk memproses media group {media_group_id_str} dari chat {chat_id}.")
 
@@ -286,12 +374,14 @@ async def process_media_group_callback(context: CallbackContext):
         logger.warning(f"Tidak ada data gambar valid ditemukan (atau sudah dihapus dari bot_data) untuk media group {media_group_id_str} di chat {chat_id} pada saat callback.")
         return
 
-    await context.bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
+    if await reject_if_throttled(context, "image", user_id, chat_id):
+        return
+
     prompt_parts = []
-    final_text_prompt = DEFAULT_PROMPT_FOR_IMAGE_IF_NO_CAPTION
+    final_text_prompt = config.DEFAULT_PROMPT_FOR_IMAGE_IF_NO_CAPTION
     for img_detail in media_group_images_data:
-        if img_detail.get('caption'):
-            final_text_prompt = img_detail['caption']
+        if img_detail.caption:
+            final_text_prompt = img_detail.caption
             logger.info(f"Menggunakan caption '{final_text_prompt}' dari media group {media_group_id_str}.")
             break
 
@@ -300,30 +390,15 @@ async def process_media_group_callback(context: CallbackContext):
 
     text_prompt_for_history = final_text_prompt
 
-    images_processed_count = 0
-    for img_detail in media_group_images_data:
-        if images_processed_count >= MAX_IMAGE_INPUT:
-            logger.warning(f"Mencapai batas MAX_IMAGE_INPUT ({MAX_IMAGE_INPUT}) saat memproses gambar untuk media group {media_group_id_str}")
-            break
-        try:
-            logger.debug(f"Mengunduh file_id: {img_detail['file_id']} untuk media group {media_group_id_str}")
-            photo_tg_file = await context.bot.get_file(img_detail['file_id'])
-            image_bytes = bytes(await photo_tg_file.download_as_bytearray())
-
-            image_part_dict = {
-                "inline_data": {
-                    "mime_type": "image/jpeg",
-                    "data": image_bytes
-                }
-            }
-            prompt_parts.append(image_part_dict)
-            images_processed_count += 1
-        except Exception as e:
-            logger.error(f"Gagal mengunduh atau membuat Part untuk file_id {img_detail['file_id']} dalam media group {media_group_id_str}: {e}")
+    async with chat_action.keep_typing(context.bot, chat_id):
+        image_parts, image_refs = await build_image_parts(context, media_group_images_data, f"media group {media_group_id_str}")
+    prompt_parts.extend(image_parts)
+    images_processed_count = len(image_parts)
+    remember_album(context, chat_id, media_group_id_str, media_group_images_data)
 
     if images_processed_count == 0:
         logger.warning(f"Tidak ada gambar yang berhasil diunduh/diproses untuk media group {media_group_id_str}.")
-        first_message_id_in_group = media_group_images_data[0].get('message_id') if media_group_images_data else None
+        first_message_id_in_group = media_group_images_data[0].message_id if media_group_images_data else None
         try:
             await context.bot.send_message(chat_id, "Maaf, saya gagal memproses gambar-gambar yang Anda kirim dalam album ini.", reply_to_message_id=first_message_id_in_group)
         except Exception as send_error:
@@ -334,13 +409,16 @@ async def process_media_group_callback(context: CallbackContext):
     logger.info(f"Mengirim {images_processed_count} gambar dan prompt '{text_prompt_for_history}' dari media group {media_group_id_str} ke Gemini untuk chat {chat_id}.")
 
     try:
-        gemini_reply = await gemini_client.generate_multimodal_response(
-            chat_id=chat_id,
-            prompt_parts=prompt_parts,
-            text_prompt_for_history=text_prompt_for_history
-        )
+        async with chat_action.keep_typing(context.bot, chat_id):
+            gemini_reply = await gemini_client.generate_multimodal_response(
+                chat_id=chat_id,
+                prompt_parts=prompt_parts,
+                text_prompt_for_history=text_prompt_for_history,
+                image_refs=image_refs,
+                user_id=user_id
+            )
 
-        first_message_id_in_group = media_group_images_data[0].get('message_id') if media_group_images_data else None
+        first_message_id_in_group = media_group_images_data[0].message_id if media_group_images_data else None
         reply_to_msg_id = first_message_id_in_group if first_message_id_in_group else None
 
         if gemini_reply:
@@ -363,6 +441,44 @@ async def process_media_group_callback(context: CallbackContext):
         await context.bot.send_message(chat_id, "Terjadi kesalahan internal saat memproses album gambar Anda.")
 
 
+async def history_retention_job(context: CallbackContext):
+    """Callback JobQueue berkala untuk retensi dan compaction riwayat chat, sekaligus sweep cache gambar."""
+    try:
+        removed = await supabase_manager.prune_chat_history()
+        logger.info(f"Job retensi riwayat selesai, {removed} pesan dipangkas.")
+    except Exception as e:
+        logger.error(f"Job retensi riwayat gagal: {e}", exc_info=True)
+    try:
+        await asyncio.to_thread(image_cache.sweep)
+    except Exception as e:
+        logger.error(f"Sweep cache gambar gagal: {e}", exc_info=True)
+
+
+async def throttle_state_job(context: CallbackContext):
+    """Callback JobQueue berkala untuk membersihkan data throttle kedaluwarsa dan menyimpan state-nya."""
+    if not throttle.save_state():
+        throttle.prune()
+
+
+async def pool_stats_job(context: CallbackContext):
+    """Callback JobQueue berkala untuk mencatat pemakaian connection pool HTTP."""
+    for pool_stats in http_pool.get_pool_stats():
+        logger.info(f"Statistik connection pool: {pool_stats}")
+
+
+async def reload_config_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Menangani perintah /reload (khusus admin): memuat ulang config.py tanpa restart."""
+    user = update.effective_user
+    if user.id not in config.ADMIN_USER_IDS:
+        logger.warning(f"User {user.id} mencoba /reload tanpa izin.")
+        return
+
+    if await lifecycle.reload_config(context.application):
+        await update.message.reply_text("Config berhasil di-reload.")
+    else:
+        await update.message.reply_text("Reload gagal atau model Gemini belum siap, cek log.")
+
+
 async def think_deeper_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Menangani perintah /td untuk meminta AI berpikir lebih mendalam."""
     message = update.message
@@ -371,22 +487,39 @@ async def think_deeper_command(update: Update, context: ContextTypes.DEFAULT_TYP
 
     prompt_text = ""
     target_message = message
-
-    if context.args:
+    reply_images = []
+    replied_message = message.reply_to_message
+
+    if replied_message and replied_message.photo and config.IMAGE_UNDERSTANDING_ENABLED:
+        target_message = replied_message
+        if replied_message.media_group_id:
+            reply_images = get_album_images(context, chat_id, str(replied_message.media_group_id))
+        if not reply_images:
+            reply_images = [records.AlbumImage(replied_message.photo[-1].file_id, replied_message.photo[-1].file_unique_id)]
+        if context.args:
+            prompt_text = " ".join(context.args)
+        else:
+            album_caption = next((img.caption for img in reply_images if img.caption), None)
+            prompt_text = replied_message.caption or album_caption or config.DEFAULT_PROMPT_FOR_IMAGE_IF_NO_CAPTION
+        logger.info(f"Perintah /td dari user {user.id} di chat {chat_id} sebagai balasan ke {len(reply_images)} gambar dengan prompt: {prompt_text[:50]}...")
+    elif context.args:
         prompt_text = " ".join(context.args)
         logger.info(f"Perintah /td dari user {user.id} di chat {chat_id} dengan argumen: {prompt_text[:50]}...")
-    elif message.reply_to_message and message.reply_to_message.text:
-        prompt_text = message.reply_to_message.text
-        target_message = message.reply_to_message
+    elif replied_message and replied_message.text:
+        prompt_text = replied_message.text
+        target_message = replied_message
         logger.info(f"Perintah /td dari user {user.id} di chat {chat_id} sebagai balasan ke teks: {prompt_text[:50]}...")
     else:
-        await message.reply_text("Gunakan `/td <pertanyaan Anda>` atau balas pesan teks yang ingin dipikirkan lebih dalam dengan `/td`.")
+        await message.reply_text("Gunakan `/td <pertanyaan Anda>` atau balas pesan teks atau gambar yang ingin dipikirkan lebih dalam dengan `/td`.")
         return
 
     if not prompt_text:
          await message.reply_text("Mohon berikan pertanyaan atau balas pesan teks yang valid.")
          return
 
+    if await reject_if_throttled(context, "td", user.id, chat_id, message):
+        return
+
     thinking_indicator_msg: Message | None = None
     try:
         thinking_indicator_msg = await target_message.reply_text(
@@ -400,16 +533,27 @@ async def think_deeper_command(update: Update, context: ContextTypes.DEFAULT_TYP
     except Exception as e:
         logger.error(f"Gagal mengirim pesan indikator thinking ke chat {chat_id}: {e}", exc_info=True)
 
-    await context.bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
-
     prompt_parts = [prompt_text]
     text_prompt_for_history = prompt_text
+    image_refs = None
 
-    gemini_reply = await gemini_client.generate_thinking_response(
-        chat_id=chat_id,
-        prompt_parts=prompt_parts,
-        text_prompt_for_history=text_prompt_for_history
-    )
+    # Pesan indikator diedit dengan waktu berjalan agar user tahu bot masih bekerja dan tidak mengirim ulang /td
+    async with chat_action.keep_typing(context.bot, chat_id, progress_message=thinking_indicator_msg):
+        if reply_images:
+            image_parts, image_refs = await build_image_parts(context, reply_images, f"/td di chat {chat_id}")
+            prompt_parts.extend(image_parts)
+
+        if reply_images and not image_refs:
+            gemini_reply = None
+            logger.warning(f"Tidak ada gambar yang berhasil diunduh untuk /td di chat {chat_id}.")
+        else:
+            gemini_reply = await gemini_client.generate_thinking_response(
+                chat_id=chat_id,
+                prompt_parts=prompt_parts,
+                text_prompt_for_history=text_prompt_for_history,
+                image_refs=image_refs,
+                user_id=user.id
+            )
 
     final_text = ""
     if gemini_reply:
@@ -451,6 +595,7 @@ async def think_deeper_command(update: Update, context: ContextTypes.DEFAULT_TYP
          await send_long_message(context, chat_id, final_text, reply_to_message_id=target_message.message_id, parse_mode=ParseMode.MARKDOWN)
 
 TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+RECENT_ALBUMS_LIMIT = 200 # Jumlah album terakhir yang diingat untuk /td yang membalas album
 
 async def send_long_message(
     context: CallbackContext,
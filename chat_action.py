@@ -0,0 +1,81 @@
+"""
+Indikator "mengetik" yang tetap hidup selama permintaan AI berjalan.
+
+Telegram menghapus chat action setelah sekitar 5 detik, jadi keep_typing() mengirim ulang setiap
+CHAT_ACTION_REFRESH_INTERVAL detik sampai blok selesai. Permintaan yang berjalan bersamaan di chat
+yang sama berbagi satu task refresh, jadi jumlah panggilan sendChatAction per chat tetap sama
+berapa pun banyaknya permintaan. Opsional, pesan indikator (misal THINKING_INDICATOR_MESSAGE untuk /td)
+diedit dengan waktu yang sudah berjalan.
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from telegram import Message
+from telegram.constants import ChatAction
+from telegram.error import RetryAfter, TelegramError
+import config
+
+logger = logging.getLogger(__name__)
+
+_keepalives = {}  # (chat_id, action) -> [jumlah pemakai, task refresh]
+
+
+async def _refresh_loop(bot, chat_id: int, action: str) -> None:
+    while True:
+        try:
+            await bot.send_chat_action(chat_id=chat_id, action=action)
+        except RetryAfter as e:
+            await asyncio.sleep(float(e.retry_after))
+            continue
+        except TelegramError as e:
+            logger.warning(f"Gagal mengirim chat action ke chat {chat_id}: {e}")
+        await asyncio.sleep(config.CHAT_ACTION_REFRESH_INTERVAL)
+
+
+async def _progress_loop(progress_message: Message, base_text: str, started_at: float) -> None:
+    while True:
+        await asyncio.sleep(config.THINKING_PROGRESS_UPDATE_INTERVAL)
+        elapsed = int(time.monotonic() - started_at)
+        try:
+            await progress_message.edit_text(config.THINKING_PROGRESS_MESSAGE.format(indicator=base_text, elapsed=elapsed))
+        except RetryAfter as e:
+            await asyncio.sleep(float(e.retry_after))
+        except TelegramError as e:
+            logger.debug(f"Gagal memperbarui pesan indikator di chat {progress_message.chat_id}: {e}")
+
+
+async def _cancel(task: asyncio.Task) -> None:
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+@asynccontextmanager
+async def keep_typing(bot, chat_id: int, action: str = ChatAction.TYPING, progress_message: Message | None = None):
+    """
+    Menjaga chat action tetap tampil selama blok `async with` berjalan.
+    Jika progress_message diberikan, pesan itu diedit dengan waktu berjalan setiap
+    THINKING_PROGRESS_UPDATE_INTERVAL detik. Semua task dihentikan sebelum blok selesai,
+    jadi edit terakhir dari pemanggil tidak tertimpa.
+    """
+    key = (chat_id, action)
+    keepalive = _keepalives.get(key)
+    if keepalive is None:
+        keepalive = [0, asyncio.create_task(_refresh_loop(bot, chat_id, action))]
+        _keepalives[key] = keepalive
+    keepalive[0] += 1
+
+    progress_task = None
+    if progress_message is not None and config.THINKING_PROGRESS_UPDATE_INTERVAL:
+        progress_task = asyncio.create_task(_progress_loop(progress_message, progress_message.text, time.monotonic()))
+
+    try:
+        yield
+    finally:
+        if progress_task is not None:
+            await _cancel(progress_task)
+        keepalive[0] -= 1
+        if keepalive[0] == 0:
+            _keepalives.pop(key, None)
+            await _cancel(keepalive[1])
+
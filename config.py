@@ -34,6 +34,14 @@ MAX_IMAGE_INPUT = 5               # Batas maksimal gambar yang bisa diproses dal
 MEDIA_GROUP_PROCESSING_DELAY = 2.5 # Detik (misalnya 2-3 detik) untuk menunggu semua gambar dalam album terkumpul
 DEFAULT_PROMPT_FOR_IMAGE_IF_NO_CAPTION = "Jelaskan semua gambar ini dan apa kaitannya satu sama lain" # Prompt default jika gambar dikirim tanpa caption sama sekali
 
+# Cache gambar lokal, dipakai agar gambar di riwayat bisa dilampirkan lagi tanpa perlu upload ulang
+IMAGE_CACHE_ENABLED = True
+IMAGE_CACHE_DIR = os.environ.get("IMAGE_CACHE_DIR", "image_cache")
+IMAGE_CACHE_MAX_AGE_DAYS = 30     # Hapus gambar cache yang tidak dipakai lebih dari N hari (None untuk nonaktifkan), dijalankan oleh job retensi
+IMAGE_CACHE_MAX_BYTES = 500 * 1024 * 1024  # Batas total ukuran cache gambar, yang paling lama tidak dipakai dihapus dulu (None untuk tanpa batas)
+CHAT_HISTORY_MAX_IMAGES = 3       # Batas maksimal gambar dari riwayat yang dilampirkan ulang ke Gemini (0 untuk nonaktifkan)
+UPLOAD_HISTORY_IMAGES_TO_GEMINI = False # True untuk juga mengupload gambar ke Gemini File API dan menyimpan URI-nya di riwayat
+
 # Konfigurasi Perintah (commands)
 # jika ada commands yang lain tambahkan di sini, jangan lupa di daftarkan di bot_handlers.py dan di main.py di bagian application.add_handler(CommandHandler(command_name, handler_func))
 
@@ -43,8 +51,12 @@ COMMANDS = {
     "about": "about",               # /about memanggil fungsi about
     "help": "help_command",         # /help memanggil fungsi help_command
     "td": "think_deeper_command",
+    "reload": "reload_config_command",  # /reload memuat ulang config.py tanpa restart (khusus ADMIN_USER_IDS)
 }
 
+# ID user Telegram yang boleh memakai command admin seperti /reload, dipisah koma (contoh: ADMIN_USER_IDS=12345,67890)
+ADMIN_USER_IDS = [int(user_id) for user_id in os.environ.get("ADMIN_USER_IDS", "").split(",") if user_id.strip()]
+
 # untuk grupp
 # tambahkan perintah sesuka kalian, Pastikan perintah diawali dengan karakter /
 GROUP_TRIGGER_COMMANDS = ["/ai", "/ask"]
@@ -53,8 +65,123 @@ GROUP_TRIGGER_COMMANDS = ["/ai", "/ask"]
 # Jumlah maksimal pesan yang diambil dari history untuk konteks Gemini
 CHAT_HISTORY_MESSAGES_LIMIT = 20
 
+# Backend penyimpanan riwayat: "supabase" (default) atau "sqlite" (database lokal, cocok untuk deploy satu server)
+HISTORY_BACKEND = os.environ.get("HISTORY_BACKEND", "supabase")
+SQLITE_HISTORY_PATH = os.environ.get("SQLITE_HISTORY_PATH", "data/chat_history.sqlite3")
+SQLITE_BUSY_TIMEOUT_MS = 5000
+SQLITE_REPLICATE_TO_SUPABASE = False   # True untuk menyalin riwayat SQLite ke Supabase di latar belakang (butuh SUPABASE_URL/KEY)
+SQLITE_REPLICATION_QUEUE_SIZE = 10000  # Batas antrian replikasi; jika penuh, operasi baru tidak direplikasi
+
+# Retensi riwayat: pesan di luar jendela aktif setiap chat dipindah ke arsip (atau dihapus) secara berkala
+HISTORY_RETENTION_ENABLED = True
+HISTORY_RETENTION_KEEP_LAST = 200      # Jumlah pesan terbaru yang dipertahankan per chat (minimal CHAT_HISTORY_MESSAGES_LIMIT)
+HISTORY_RETENTION_MAX_AGE_DAYS = None  # Hapus juga pesan yang lebih tua dari N hari (None untuk nonaktifkan)
+HISTORY_ARCHIVE_ENABLED = True         # True: pindahkan ke tabel chat_history_archive, False: hapus langsung
+HISTORY_RETENTION_INTERVAL = 3600      # Detik, jeda antar job retensi
+HISTORY_RETENTION_BATCH_CHATS = 50     # Jumlah chat per batch retensi (SQLite dan RPC Supabase), query riwayat lain bisa berjalan di sela batch
+HISTORY_RETENTION_BATCH_ROWS = 5000    # Supabase: maksimal pesan yang dipangkas per panggilan RPC prune_chat_history
+
 # fitur thiking
 THINKING_MODEL_NAME = 'gemini-2.5-flash-preview-04-17'
 THINKING_BUDGET = 4096 # Contoh budget (integer 0-24576 atau None untuk default model)
 THINKING_INDICATOR_MESSAGE = "🤔 Sedang berpikir mendalam..."
+THINKING_PROGRESS_UPDATE_INTERVAL = 10 # Detik, jeda edit pesan indikator dengan waktu berjalan (0 untuk nonaktifkan)
+THINKING_PROGRESS_MESSAGE = "{indicator} ({elapsed} detik)"
+
+# Indikator "mengetik" dikirim ulang selama AI memproses; Telegram menghapusnya setelah sekitar 5 detik
+CHAT_ACTION_REFRESH_INTERVAL = 4.0     # Detik
+
+
+# Routing model
+# "fallback_model" dipakai jika model utama sedang bermasalah (lihat pengaturan circuit breaker di bawah).
+# Setiap permintaan diklasifikasikan secara lokal (panjang prompt, jumlah gambar, panjang riwayat, command)
+# lalu diarahkan ke model termurah yang masih memadai. Harga dalam USD per 1 juta token, hanya untuk estimasi biaya di statistik.
+MODEL_ROUTING_ENABLED = True
+MODEL_ROUTES = {
+    "ringan": {"model": "gemini-1.5-flash-8b-latest", "fallback_model": GEMINI_MODEL_NAME, "thinking_budget": None, "input_price_per_1m": 0.0375, "output_price_per_1m": 0.15},
+    "standar": {"model": GEMINI_MODEL_NAME, "fallback_model": "gemini-1.5-flash-8b-latest", "thinking_budget": None, "input_price_per_1m": 0.075, "output_price_per_1m": 0.30},
+    "td_ringan": {"model": THINKING_MODEL_NAME, "fallback_model": GEMINI_MODEL_NAME, "thinking_budget": 1024, "input_price_per_1m": 0.15, "output_price_per_1m": 3.50},
+    "td": {"model": THINKING_MODEL_NAME, "fallback_model": GEMINI_MODEL_NAME, "thinking_budget": THINKING_BUDGET, "input_price_per_1m": 0.15, "output_price_per_1m": 3.50},
+}
+ROUTING_LIGHT_MAX_PROMPT_CHARS = 60     # Prompt teks tanpa gambar sepanjang ini (atau kurang) dianggap ringan, misal sapaan
+ROUTING_LIGHT_MAX_HISTORY = 6           # Jumlah maksimal pesan riwayat agar permintaan masih dianggap ringan
+ROUTING_TD_LIGHT_MAX_PROMPT_CHARS = 120 # Prompt /td sependek ini (tanpa gambar) memakai thinking budget kecil
+ROUTING_STATS_LOG_EVERY = 100           # Catat ringkasan statistik routing ke log setiap N permintaan (0 untuk nonaktifkan)
+
+# Ketahanan koneksi ke Gemini
+GEMINI_REQUEST_TIMEOUT = 60            # Detik, batas waktu satu panggilan ke Gemini
+GEMINI_THINKING_REQUEST_TIMEOUT = 180  # Detik, batas waktu untuk /td yang biasanya lebih lama
+GEMINI_TOTAL_TIMEOUT_FACTOR = 1.5      # Batas total satu permintaan (semua retry + fallback) = timeout per panggilan x faktor ini
+GEMINI_MAX_RETRIES = 2                 # Jumlah percobaan ulang untuk error sementara (timeout, 5xx, rate limit)
+GEMINI_RETRY_BASE_DELAY = 0.5          # Detik, dasar backoff eksponensial (dengan jitter)
+GEMINI_RETRY_MAX_DELAY = 8.0           # Detik, batas atas jeda antar percobaan
+GEMINI_HEDGE_ENABLED = False           # True untuk mengirim permintaan kedua jika yang pertama terlalu lama (memotong ekor latensi, menambah biaya)
+GEMINI_HEDGE_DELAY = 15.0              # Detik sebelum permintaan hedge dikirim, sebaiknya sekitar latensi p99
+CIRCUIT_BREAKER_WINDOW = 60            # Detik, jendela untuk menghitung rasio error per model
+CIRCUIT_BREAKER_MIN_REQUESTS = 10      # Minimal jumlah permintaan di jendela sebelum circuit bisa terbuka
+CIRCUIT_BREAKER_ERROR_RATE = 0.5       # Rasio error yang membuat circuit terbuka (langsung gagal / pindah ke fallback)
+CIRCUIT_BREAKER_COOLDOWN = 30          # Detik circuit tetap terbuka sebelum mencoba lagi
+
+# Pipeline permintaan AI
+GEMINI_MAX_CONCURRENT_REQUESTS = 32    # Batas permintaan ke Gemini yang berjalan bersamaan (0 untuk tanpa batas)
+RESPONSE_CACHE_ENABLED = False         # True untuk meng-cache balasan prompt teks yang sama persis di chat dan riwayat yang sama (misal pesan terkirim ganda)
+RESPONSE_CACHE_TTL = 30                # Detik
+RESPONSE_CACHE_MAX_ENTRIES = 1000
+STREAMING_ENABLED = True              # False untuk mengabaikan on_partial_text dan selalu menunggu balasan utuh
+STREAM_PARTIAL_UPDATE_INTERVAL = 1.0  # Detik minimal antar panggilan on_partial_text (batasi edit pesan Telegram)
+
+# Connection pool HTTP bersama (Supabase dan Telegram)
+HTTP2_ENABLED = True                   # Butuh paket h2 (pip install "httpx[http2]"), otomatis kembali ke HTTP/1.1 jika tidak ada
+HTTP_POOL_MAX_CONNECTIONS = 50         # Ukuran pool untuk klien Supabase
+HTTP_POOL_MAX_KEEPALIVE = 20           # Jumlah koneksi idle yang dipertahankan (keep-alive)
+HTTP_KEEPALIVE_EXPIRY = 60.0           # Detik koneksi idle dipertahankan sebelum ditutup
+HTTP_CONNECT_TIMEOUT = 5.0
+HTTP_READ_TIMEOUT = 15.0
+HTTP_WRITE_TIMEOUT = 15.0
+HTTP_POOL_TIMEOUT = 5.0                # Detik menunggu koneksi kosong dari pool
+TELEGRAM_POOL_SIZE = 64                # Pool untuk panggilan Bot API (kirim pesan, unduh file, dll)
+TELEGRAM_GET_UPDATES_POOL_SIZE = 2     # Pool terpisah untuk long polling getUpdates
+TELEGRAM_GET_UPDATES_READ_TIMEOUT = 30.0
+POOL_STATS_LOG_INTERVAL = 600          # Detik, jeda log statistik pemakaian pool (0 untuk nonaktifkan)
+GEMINI_TRANSPORT = None                # Transport SDK Gemini: None (default SDK, gRPC HTTP/2 persisten untuk klien sync dan async) atau "rest"
+
+# Startup
+STARTUP_READY_TIMEOUT = 60             # Detik maksimal sebuah update ditahan menunggu warm-up selesai
+
+# Shutdown dan reload
+SHUTDOWN_DRAIN_TIMEOUT = 30            # Detik maksimal menunggu permintaan AI yang masih berjalan saat shutdown
+SHUTDOWN_FLUSH_TIMEOUT = 10            # Detik maksimal menunggu antrian replikasi ke Supabase kosong
+PENDING_ALBUMS_SNAPSHOT_PATH = os.environ.get("PENDING_ALBUMS_SNAPSHOT_PATH", "data/pending_albums.json")
+PENDING_ALBUMS_SNAPSHOT_MAX_AGE = 3600 # Detik; album di snapshot yang lebih tua dari ini tidak diproses lagi
+
+# Pembatasan permintaan (throttle) per user dan per chat, dicek sebelum memanggil Gemini
+THROTTLE_ENABLED = True
+# Rate limit sliding window: jenis permintaan -> {"user"/"chat": (maks permintaan, jendela dalam detik)}
+THROTTLE_LIMITS = {
+    "text": {"user": (10, 60), "chat": (30, 60)},
+    "image": {"user": (5, 300), "chat": (15, 300)},   # Satu album dihitung satu permintaan
+    "td": {"user": (3, 300), "chat": (10, 300)},
+}
+DAILY_TOKEN_QUOTA_PER_USER = 200_000   # Token per hari (UTC) per user, None untuk nonaktifkan
+DAILY_TOKEN_QUOTA_PER_CHAT = 1_000_000 # Token per hari (UTC) per chat, None untuk nonaktifkan
+THROTTLE_MESSAGES = {
+    "rate": "Terlalu banyak permintaan, silakan tunggu sebentar sebelum mencoba lagi.",
+    "rate_td": "Batas /td tercapai, silakan tunggu beberapa menit sebelum mencoba lagi.",
+    "rate_image": "Terlalu banyak gambar dikirim, silakan tunggu beberapa menit sebelum mengirim lagi.",
+    "quota": "Kuota harian AI untuk Anda atau chat ini sudah habis, silakan coba lagi besok.",
+}
+THROTTLE_STATE_PATH = os.environ.get("THROTTLE_STATE_PATH")  # Opsional, misal "data/throttle_state.json" agar limit tetap berlaku setelah restart
+THROTTLE_STATE_SAVE_INTERVAL = 300     # Detik, jeda simpan state throttle (dan pembersihan data kedaluwarsa)
+
+# Log pemakaian per giliran (token, gambar, model, latensi), laporan: python usage_log.py --days 7
+USAGE_LOG_ENABLED = True
+USAGE_LOG_DIR = os.environ.get("USAGE_LOG_DIR", "data/usage")
+USAGE_LOG_QUEUE_SIZE = 10000           # Jika antrian penuh (disk lambat), catatan baru dibuang
+USAGE_LOG_BATCH_SIZE = 200             # Maksimal catatan per sekali tulis
 
+# Perekam update untuk replay beban (benchmarks/replay_updates.py)
+UPDATE_RECORDER_ENABLED = False        # True untuk merekam semua update yang masuk
+UPDATE_RECORDER_PATH = os.environ.get("UPDATE_RECORDER_PATH", "data/updates.jsonl")
+UPDATE_RECORDER_REDACT = True          # Samarkan id, nama, teks, dan file_id sebelum ditulis (lihat update_recorder.py)
+UPDATE_RECORDER_SALT = os.environ.get("UPDATE_RECORDER_SALT")  # Opsional; tanpa salt tetap, pseudonim berbeda setiap restart
+UPDATE_RECORDER_QUEUE_SIZE = 10000     # Jika antrian penuh (disk lambat), update baru tidak direkam
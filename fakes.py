@@ -0,0 +1,291 @@
+"""
+Backend palsu untuk pengujian lokal dan benchmark tanpa memanggil API sungguhan.
+FakeGenerativeModel meniru GenerativeModel Gemini dan bisa menyuntikkan latensi serta error,
+FakeTelegramRequest menggantikan koneksi HTTP ke Bot API, dan FakeSupabaseClient menyimpan
+riwayat di memori.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from types import SimpleNamespace
+from telegram.request import BaseRequest
+import config
+
+
+def _default_transient_error() -> Exception:
+    try:
+        from google.api_core.exceptions import ServiceUnavailable
+        return ServiceUnavailable("Error sementara dari FakeGenerativeModel")
+    except ImportError:
+        return ConnectionError("Error sementara dari FakeGenerativeModel")
+
+
+class FakeChatSession:
+    def __init__(self, model: "FakeGenerativeModel", history: list):
+        self.model = model
+        self.history = list(history or [])
+
+    async def send_message_async(self, content, generation_config=None, stream=False):
+        response = await self.model.respond(self.history, content, generation_config)
+        return FakeStreamResponse(response) if stream else response
+
+
+class FakeStreamResponse:
+    """Meniru respons streaming: bisa di-iterasi secara async per potongan teks."""
+
+    def __init__(self, response, chunk_size: int = 20):
+        self._response = response
+        self._chunk_size = chunk_size
+        self.text = response.text
+        self.prompt_feedback = response.prompt_feedback
+        self.usage_metadata = response.usage_metadata
+
+    async def __aiter__(self):
+        for i in range(0, len(self.text), self._chunk_size):
+            yield SimpleNamespace(text=self.text[i:i + self._chunk_size])
+
+
+class FakeGenerativeModel:
+    """
+    Pengganti GenerativeModel untuk pengujian.
+
+    Args:
+        model_name: Nama model yang ditiru.
+        latency: Latensi dasar (detik) per panggilan.
+        latency_jitter: Tambahan latensi acak maksimal (detik).
+        error_rate: Peluang (0-1) panggilan gagal dengan error dari error_factory.
+        hang_rate: Peluang (0-1) panggilan menggantung sangat lama (untuk menguji deadline).
+        error_factory: Fungsi tanpa argumen yang membuat exception; default error sementara (ServiceUnavailable).
+        reply_text: Teks balasan, atau fungsi (content) -> str.
+        seed: Seed random agar hasil bisa diulang.
+    """
+
+    def __init__(self, model_name: str = "fake-model", latency: float = 0.0, latency_jitter: float = 0.0,
+                 error_rate: float = 0.0, hang_rate: float = 0.0, error_factory=None,
+                 reply_text="Balasan dari model palsu.", seed: int | None = None):
+        self.model_name = model_name
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.error_factory = error_factory or _default_transient_error
+        self.reply_text = reply_text
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.failures = 0
+
+    def start_chat(self, history=None):
+        return FakeChatSession(self, history)
+
+    async def respond(self, history: list, content, generation_config=None):
+        self.calls += 1
+        if self.hang_rate and self.random.random() < self.hang_rate:
+            await asyncio.sleep(3600)
+        delay = self.latency + (self.random.uniform(0, self.latency_jitter) if self.latency_jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.failures += 1
+            raise self.error_factory()
+
+        text = self.reply_text(content) if callable(self.reply_text) else self.reply_text
+        parts = content if isinstance(content, list) else [content]
+        prompt_chars = sum(len(part) for part in parts if isinstance(part, str))
+        num_images = sum(1 for part in parts if isinstance(part, dict))
+        return SimpleNamespace(
+            text=text,
+            prompt_feedback=None,
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=prompt_chars // 4 + num_images * 258 + len(history) * 20,
+                candidates_token_count=len(text) // 4,
+                thoughts_token_count=0,
+            ),
+        )
+
+
+def install_fake_gemini(**model_kwargs) -> dict:
+    """
+    Memasang FakeGenerativeModel ke gemini_client untuk semua model yang ada di config
+    (model dasar, thinking, dan semua model/fallback di MODEL_ROUTES).
+    Mengembalikan dict nama model -> FakeGenerativeModel agar bisa diatur per model.
+    """
+    import gemini_client
+
+    model_names = {config.GEMINI_MODEL_NAME, config.THINKING_MODEL_NAME}
+    for route_config in config.MODEL_ROUTES.values():
+        model_names.add(route_config.get("model"))
+        model_names.add(route_config.get("fallback_model"))
+    model_names.discard(None)
+
+    fake_models = {name: FakeGenerativeModel(model_name=name, **model_kwargs) for name in model_names}
+    gemini_client._models_by_name.update(fake_models)
+    gemini_client.gemini_model_base = fake_models[config.GEMINI_MODEL_NAME]
+    gemini_client.gemini_model_thinking = fake_models.get(config.THINKING_MODEL_NAME, gemini_client.gemini_model_base)
+    return fake_models
+
+
+
+class FakeTelegramRequest(BaseRequest):
+    """
+    Pengganti request HTTP python-telegram-bot tanpa jaringan.
+    getMe dijawab dengan identitas bot palsu, method send*/edit* dijawab dengan Message palsu,
+    getFile dan unduhan file dijawab dengan bytes palsu sebesar image_size, dan semua method dicatat di `calls`.
+    """
+
+    def __init__(self, bot_id: int = 999000, bot_username: str = "fakebot", latency: float = 0.0,
+                 image_size: int = 50_000):
+        self.bot_id = bot_id
+        self.bot_username = bot_username
+        self.latency = latency
+        self.image_size = image_size
+        self.calls = []
+        self._message_id = 0
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        is_file_download = "/file/bot" in url
+        api_method = "downloadFile" if is_file_download else url.rsplit("/", 1)[-1]
+        self.calls.append(api_method)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if is_file_download:
+            seed = hashlib.sha256(url.rsplit("/", 1)[-1].encode()).digest()
+            return 200, (seed * (self.image_size // len(seed) + 1))[:self.image_size]
+        if api_method == "getMe":
+            result = {"id": self.bot_id, "is_bot": True, "first_name": "Fake Bot", "username": self.bot_username}
+        elif api_method.startswith(("send", "edit")) and api_method != "sendChatAction":
+            parameters = request_data.parameters if request_data else {}
+            self._message_id += 1
+            result = {
+                "message_id": parameters.get("message_id", self._message_id),
+                "date": int(time.time()),
+                "chat": {"id": parameters.get("chat_id", 0), "type": "private"},
+                "from": {"id": self.bot_id, "is_bot": True, "first_name": "Fake Bot", "username": self.bot_username},
+                "text": parameters.get("text", ""),
+            }
+        elif api_method == "getFile":
+            file_id = (request_data.parameters if request_data else {}).get("file_id", "file")
+            result = {"file_id": file_id, "file_unique_id": file_id[-16:], "file_size": self.image_size,
+                      "file_path": f"photos/{file_id}.jpg"}
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+class FakeSupabaseQuery:
+    """Query builder minimal untuk rantai yang dipakai supabase_manager (insert/select/delete, eq, order, limit, rpc)."""
+
+    def __init__(self, client: "FakeSupabaseClient", table: str, operation: str = "select", payload=None):
+        self.client = client
+        self.table = table
+        self.operation = operation
+        self.payload = payload
+        self.filters = []
+        self.orders = []
+        self.row_limit = None
+
+    def select(self, columns: str = "*"):
+        self.operation = "select"
+        self.payload = None if columns == "*" else [column.strip() for column in columns.split(",")]
+        return self
+
+    def insert(self, row: dict):
+        self.operation = "insert"
+        self.payload = row
+        return self
+
+    def delete(self):
+        self.operation = "delete"
+        return self
+
+    def eq(self, column: str, value):
+        self.filters.append((column, value))
+        return self
+
+    def order(self, column: str, desc: bool = False):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, count: int):
+        self.row_limit = count
+        return self
+
+    def execute(self):
+        return self.client.execute(self)
+
+
+class FakeAPIError(Exception):
+    """Meniru postgrest.exceptions.APIError (atribut code dan message)."""
+
+    def __init__(self, code: str, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class FakeSupabaseClient:
+    """
+    Pengganti klien Supabase dengan tabel di memori; latency (detik) meniru round-trip jaringan yang memblokir.
+    missing_columns meniru tabel yang belum dimigrasi: query yang menyebut kolom itu ditolak seperti PostgREST.
+    """
+
+    def __init__(self, latency: float = 0.0, missing_columns: tuple = ()):
+        self.latency = latency
+        self.missing_columns = set(missing_columns)
+        self.tables = defaultdict(list)
+        self.calls = Counter()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def table(self, name: str) -> FakeSupabaseQuery:
+        return FakeSupabaseQuery(self, name)
+
+    def rpc(self, function_name: str, params: dict) -> FakeSupabaseQuery:
+        return FakeSupabaseQuery(self, function_name, operation="rpc", payload=params)
+
+    def execute(self, query: FakeSupabaseQuery) -> SimpleNamespace:
+        self.calls[query.operation] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if query.operation == "rpc":
+                return SimpleNamespace(data=[{"removed": 0, "last_chat_id": None, "finished": True}], error=None)
+            rows = self.tables[query.table]
+            missing = sorted(self.missing_columns.intersection(query.payload or ()))
+            if missing and query.operation == "insert":
+                raise FakeAPIError("PGRST204", f"Could not find the '{missing[0]}' column of '{query.table}' in the schema cache")
+            if missing:
+                raise FakeAPIError("42703", f"column {query.table}.{missing[0]} does not exist")
+            if query.operation == "insert":
+                self._next_id += 1
+                row = {"id": self._next_id, **query.payload}
+                rows.append(row)
+                return SimpleNamespace(data=[row], error=None)
+
+            matched = [row for row in rows if all(row.get(column) == value for column, value in query.filters)]
+            if query.operation == "delete":
+                matched_ids = {row["id"] for row in matched}
+                self.tables[query.table] = [row for row in rows if row["id"] not in matched_ids]
+                return SimpleNamespace(data=matched, error=None)
+
+            for column, desc in reversed(query.orders):
+                matched.sort(key=lambda row: row.get(column) or 0, reverse=desc)
+            if query.row_limit is not None:
+                matched = matched[:query.row_limit]
+            if query.payload:
+                matched = [{column: row.get(column) for column in query.payload} for row in matched]
+            return SimpleNamespace(data=matched, error=None)
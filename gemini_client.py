@@ -1,21 +1,48 @@
+import asyncio
 import logging
-import google.generativeai as genai
-from config import GEMINI_API_KEY, GEMINI_MODEL_NAME, GEMINI_SYSTEM_INSTRUCTION
+import time
 import supabase_manager
+import image_cache
+import resilient_client
+import pipeline
+import records
+import throttle
+import usage_log
 import config
 
 
 logger = logging.getLogger(__name__)
 
-try:
-    from google.generativeai.types import GenerationConfig, ThinkingConfig
-    GENERATION_CONFIG_SUPPORTED = True
-    logger.debug("GenerationConfig dan ThinkingConfig berhasil diimpor.")
-except ImportError:
-    logger.warning("Tidak dapat mengimpor GenerationConfig atau ThinkingConfig. Kontrol thinking budget mungkin tidak didukung oleh versi SDK ini.")
-    GenerationConfig = None
-    ThinkingConfig = None
-    GENERATION_CONFIG_SUPPORTED = False
+# SDK Gemini cukup berat untuk diimpor, jadi baru dimuat saat warm-up atau pemakaian pertama
+genai = None
+GenerationConfig = None
+ThinkingConfig = None
+GENERATION_CONFIG_SUPPORTED = None  # None = belum dicek
+
+
+def load_genai():
+    """Mengimpor google.generativeai sekali lalu menyimpannya di variabel modul `genai`."""
+    global genai
+    if genai is None:
+        import google.generativeai as genai_module
+        genai = genai_module
+    return genai
+
+
+def _load_generation_config_types() -> bool:
+    """Mengimpor GenerationConfig dan ThinkingConfig saat pertama kali dibutuhkan."""
+    global GenerationConfig, ThinkingConfig, GENERATION_CONFIG_SUPPORTED
+    if GENERATION_CONFIG_SUPPORTED is None:
+        try:
+            from google.generativeai.types import GenerationConfig, ThinkingConfig
+            GENERATION_CONFIG_SUPPORTED = True
+            logger.debug("GenerationConfig dan ThinkingConfig berhasil diimpor.")
+        except ImportError:
+            logger.warning("Tidak dapat mengimpor GenerationConfig atau ThinkingConfig. Kontrol thinking budget mungkin tidak didukung oleh versi SDK ini.")
+            GenerationConfig = None
+            ThinkingConfig = None
+            GENERATION_CONFIG_SUPPORTED = False
+    return GENERATION_CONFIG_SUPPORTED
 
 
 
@@ -36,7 +63,12 @@ def configure_models():
 
     if api_key_valid:
         try:
-            genai.configure(api_key=config.GEMINI_API_KEY)
+            load_genai()
+            # SDK Gemini mengelola channel-nya sendiri; transport gRPC sudah memakai satu koneksi HTTP/2 persisten
+            if config.GEMINI_TRANSPORT:
+                genai.configure(api_key=config.GEMINI_API_KEY, transport=config.GEMINI_TRANSPORT)
+            else:
+                genai.configure(api_key=config.GEMINI_API_KEY)
         except Exception as e:
              logger.error(f"Gagal mengkonfigurasi API Key Gemini: {e}")
              api_key_valid = False
@@ -72,186 +104,458 @@ def configure_models():
             logger.error(f"Gagal mengkonfigurasi model thinking Gemini '{config.THINKING_MODEL_NAME}': {e}")
             gemini_model_thinking = None
 
-    # Pastikan supabase client diinisialisasi jika belum (biasanya di supabase_manager.py)
-    if not supabase_manager.supabase_client and config.SUPABASE_URL and config.SUPABASE_KEY:
-         supabase_manager.init_supabase_client()
-
     return models_configured_successfully and gemini_model_base is not None
 
 
-async def generate_response(prompt: str, chat_id: int) -> str | None:
-    """
-    Mengirim prompt ke Gemini menggunakan sesi chat yang sesuai (mempertahankan histori).
-    Membuat sesi baru jika belum ada untuk chat_id tersebut.
-    """
-    global gemini_model_base
-
-    if gemini_model_base is None:
-        logger.error("Model dasar Gemini belum diinisialisasi.")
-        return "Maaf, koneksi ke AI sedang bermasalah (Model dasar tidak siap)."
-
-    if not supabase_manager.supabase_client:
-        logger.warning("Supabase tidak aktif. Bot akan berjalan tanpa riwayat percakapan persisten.")
-        # Opsi: Buat sesi chat tanpa history jika Supabase tidak ada
-        try:
-            chat_session_no_history = gemini_model_base.start_chat(history=[])
-            response_no_history = await chat_session_no_history.send_message_async(prompt)
-            if response_no_history.prompt_feedback and response_no_history.prompt_feedback.block_reason:
-                reason = response_no_history.prompt_feedback.block_reason
-                logger.warning(f"Permintaan (tanpa history Supabase) diblokir oleh Gemini untuk chat {chat_id} karena: {reason}")
-                return f"Maaf, permintaan Anda tidak dapat diproses karena alasan keamanan: {reason}."
-            return response_no_history.text
-        except Exception as e_no_history:
-            logger.error(f"Error saat generate content dari Gemini (tanpa history Supabase) untuk chat {chat_id}: {e_no_history}")
-            return "Maaf, terjadi kesalahan saat menghubungi AI (tanpa history). Silakan coba lagi nanti."
+# Routing model
+ROUTE_LIGHT = "ringan"
+ROUTE_STANDARD = "standar"
+ROUTE_THINKING_LIGHT = "td_ringan"
+ROUTE_THINKING = "td"
 
-    retrieved_history = supabase_manager.get_chat_history(chat_id)
-    logger.debug(f"Riwayat yang diambil dari Supabase untuk chat {chat_id}: {len(retrieved_history)} pesan.")
-
-    chat_session = gemini_model_base.start_chat(history=retrieved_history)
-
-    logger.info(f"Mengirim prompt ke Gemini (Chat ID: {chat_id}): '{prompt[:100]}...' dengan {len(retrieved_history)} pesan history.")
-
-    logger.info(f"Mengirim prompt ke Gemini (Chat ID: {chat_id}): '{prompt[:100]}...'")
-    try:
-        response = await chat_session.send_message_async(prompt)
+_models_by_name = {}
+route_stats = {}
 
-        if response.prompt_feedback and response.prompt_feedback.block_reason:
-            reason = response.prompt_feedback.block_reason
-            logger.warning(f"Permintaan diblokir oleh Gemini (Chat ID: {chat_id}) karena: {reason}")
-            return f"Maaf, permintaan Anda tidak dapat diproses karena alasan keamanan: {reason}. Riwayat chat mungkin terpengaruh."
 
-        gemini_reply = response.text
-        logger.info(f"Menerima balasan dari Gemini (Chat ID: {chat_id}): '{gemini_reply[:100]}...'")
-
-        supabase_manager.add_message_to_history(chat_id, "user", prompt)
-        supabase_manager.add_message_to_history(chat_id, "model", gemini_reply)
-
-        return gemini_reply
-
-    except Exception as e:
-        logger.error(f"Terjadi error saat generate content dari Gemini (Chat ID: {chat_id}): {e}")
-        return "Maaf, terjadi kesalahan saat menghubungi AI. Silakan coba lagi nanti."
-
-async def generate_multimodal_response(chat_id: int, prompt_parts: list, text_prompt_for_history: str | None) -> str | None:
+def classify_request(prompt_text: str | None, num_images: int, history_len: int, command: str | None = None) -> str:
     """
-    Menghasilkan respons dari Gemini berdasarkan input multimodal (teks dan/atau gambar).
-    Menyimpan versi teks dari percakapan ke Supabase jika diaktifkan.
-
-    Args:
-        chat_id: ID chat pengguna.
-        prompt_parts: List yang berisi bagian-bagian prompt. Bisa berupa string (untuk teks)
-                      atau dictionary (untuk gambar, dengan format yang dikenali Gemini).
-        text_prompt_for_history: Versi teks dari prompt pengguna (misalnya caption)
-                                 untuk disimpan ke riwayat chat.
-    Returns:
-        String balasan dari Gemini, atau None jika terjadi error.
+    Mengklasifikasikan permintaan secara lokal (tanpa memanggil API) dan mengembalikan nama route.
+    Route yang tidak ada di config.MODEL_ROUTES akan jatuh ke route standar / td.
     """
-    global gemini_model_base
+    prompt_len = len(prompt_text or "")
+
+    if command == "td":
+        route = ROUTE_THINKING
+        if config.MODEL_ROUTING_ENABLED and num_images == 0 and prompt_len <= config.ROUTING_TD_LIGHT_MAX_PROMPT_CHARS:
+            route = ROUTE_THINKING_LIGHT
+        return route if route in config.MODEL_ROUTES else ROUTE_THINKING
+
+    route = ROUTE_STANDARD
+    if (config.MODEL_ROUTING_ENABLED and num_images == 0
+            and prompt_len <= config.ROUTING_LIGHT_MAX_PROMPT_CHARS
+            and history_len <= config.ROUTING_LIGHT_MAX_HISTORY):
+        route = ROUTE_LIGHT
+    return route if route in config.MODEL_ROUTES else ROUTE_STANDARD
+
+
+def get_route_config(route: str) -> dict:
+    """Mengembalikan konfigurasi route, dengan fallback ke model dasar / thinking dari config lama."""
+    route_config = config.MODEL_ROUTES.get(route)
+    if route_config:
+        return route_config
+    if route in (ROUTE_THINKING, ROUTE_THINKING_LIGHT):
+        return {"model": config.THINKING_MODEL_NAME, "thinking_budget": config.THINKING_BUDGET}
+    return {"model": config.GEMINI_MODEL_NAME, "thinking_budget": None}
+
+
+def get_model(model_name: str, fallback_model=None):
+    """Mengambil (atau membuat sekali lalu menyimpan) GenerativeModel berdasarkan nama model."""
+    if not model_name:
+        return fallback_model
+    if model_name == config.GEMINI_MODEL_NAME and gemini_model_base is not None:
+        return gemini_model_base
+    if model_name == config.THINKING_MODEL_NAME and gemini_model_thinking is not None:
+        return gemini_model_thinking
+
+    model = _models_by_name.get(model_name)
+    if model is None:
+        try:
+            model = load_genai().GenerativeModel(model_name, system_instruction=config.GEMINI_SYSTEM_INSTRUCTION)
+            _models_by_name[model_name] = model
+            logger.info(f"Model Gemini '{model_name}' berhasil dikonfigurasi.")
+        except Exception as e:
+            logger.error(f"Gagal mengkonfigurasi model '{model_name}', memakai model fallback: {e}")
+            return fallback_model
+    return model
 
-    if gemini_model_base is None:
-        logger.error("Model dasar Gemini belum diinisialisasi untuk multimodal.")
-        return "Maaf, koneksi ke AI sedang bermasalah (Model dasar tidak siap)."
 
-    retrieved_text_history = []
-    if supabase_manager.supabase_client:
-        retrieved_text_history = supabase_manager.get_chat_history(chat_id)
-        logger.debug(f"Riwayat teks yang diambil dari Supabase untuk chat {chat_id}: {len(retrieved_text_history)} pesan.")
+def get_model_for_route(route: str):
+    """Mengambil GenerativeModel untuk route tertentu."""
+    if route in (ROUTE_THINKING, ROUTE_THINKING_LIGHT):
+        fallback_model = gemini_model_thinking
     else:
-        logger.warning("Supabase tidak aktif. Pemrosesan multimodal akan berjalan tanpa riwayat percakapan persisten.")
-
-    chat_session = gemini_model_base.start_chat(history=retrieved_text_history)
+        fallback_model = gemini_model_base
+    return get_model(get_route_config(route).get("model"), fallback_model)
 
-    # Hitung jumlah gambar berdasarkan struktur dictionary yang kita harapkan
-    num_images = sum(1 for part in prompt_parts if isinstance(part, dict) and 'inline_data' in part)
-    logger.info(f"Mengirim ke Gemini untuk chat {chat_id}: prompt dengan {num_images} gambar. Teks utama (jika ada): '{text_prompt_for_history}'")
 
+async def send_message(route: str, history: list, content, generation_config=None, timeout: float | None = None, stream: bool = False, call_info: dict | None = None):
+    """
+    Mengirim content ke model route lewat resilient_client (deadline, retry, hedging, circuit breaker).
+    Setiap percobaan memakai sesi chat baru dari history yang sama, sehingga retry/hedge tidak
+    menggandakan riwayat sesi. Model fallback dipanggil tanpa generation_config khusus route.
+    Jika call_info diberikan, call_info["model"] diisi nama model yang terakhir dipanggil.
+    Dengan stream=True, deadline hanya berlaku sampai respons streaming pertama diterima.
+    history berisi records.HistoryTurn dan baru diubah ke format SDK di sini, sekali untuk semua percobaan.
+    Gambar riwayat dibaca dari cache lokal di thread terpisah agar event loop tidak terblokir.
+    """
+    route_config = get_route_config(route)
+    if any(turn.images for turn in history):
+        sdk_history = await asyncio.to_thread(records.to_sdk_history, history, image_cache.image_ref_to_part)
+    else:
+        sdk_history = records.to_sdk_history(history)
+    primary_model_name = route_config.get("model") or config.GEMINI_MODEL_NAME
+
+    def make_call(model_name: str):
+        if call_info is not None:
+            call_info["model"] = model_name
+        if model_name == primary_model_name:
+            model = get_model_for_route(route)
+            call_generation_config = generation_config
+        else:
+            model = get_model(model_name, gemini_model_base)
+            call_generation_config = None
+        chat_session = model.start_chat(history=sdk_history)
+        return chat_session.send_message_async(content, generation_config=call_generation_config, stream=stream)
+
+    return await resilient_client.call(
+        primary_model_name,
+        make_call,
+        fallback_model_name=route_config.get("fallback_model"),
+        timeout=timeout
+    )
+
+
+def build_generation_config(thinking_budget: int | None, log_prefix: str = ""):
+    """Membuat GenerationConfig dengan thinking budget jika didukung SDK, atau None."""
+    if thinking_budget is None:
+        return None
+    if not _load_generation_config_types():
+        logger.debug(f"{log_prefix}SDK tidak mendukung GenerationConfig/ThinkingConfig. Menggunakan default model.")
+        return None
     try:
-        response = await chat_session.send_message_async(prompt_parts)
+        think_config = ThinkingConfig(thinking_budget=thinking_budget)
+        return GenerationConfig(thinking_config=think_config)
+    except Exception as e_cfg:
+        logger.warning(f"{log_prefix}Gagal membuat GenerationConfig/ThinkingConfig: {e_cfg}")
+        return None
+
+
+def get_token_usage(response) -> tuple[int, int] | None:
+    """Mengambil (token input, token output termasuk thoughts) dari usage_metadata respons, atau None."""
+    usage = getattr(response, "usage_metadata", None) if response is not None else None
+    if usage is None:
+        return None
+    input_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    output_tokens = (getattr(usage, "candidates_token_count", 0) or 0) + (getattr(usage, "thoughts_token_count", 0) or 0)
+    return input_tokens, output_tokens
+
+
+def record_route_stats(route: str, latency: float, response=None, error: bool = False) -> None:
+    """Mencatat latensi, token, dan estimasi biaya per route untuk tuning routing."""
+    stats = route_stats.setdefault(route, {
+        "count": 0, "errors": 0, "total_latency": 0.0, "max_latency": 0.0,
+        "input_tokens": 0, "output_tokens": 0, "estimated_cost": 0.0,
+    })
+    stats["count"] += 1
+    stats["total_latency"] += latency
+    stats["max_latency"] = max(stats["max_latency"], latency)
+    if error:
+        stats["errors"] += 1
+
+    usage_tokens = get_token_usage(response)
+    if usage_tokens is not None:
+        input_tokens, output_tokens = usage_tokens
+        route_config = get_route_config(route)
+        stats["input_tokens"] += input_tokens
+        stats["output_tokens"] += output_tokens
+        stats["estimated_cost"] += (
+            input_tokens * route_config.get("input_price_per_1m", 0.0)
+            + output_tokens * route_config.get("output_price_per_1m", 0.0)
+        ) / 1_000_000
+
+    total_requests = sum(item["count"] for item in route_stats.values())
+    if config.ROUTING_STATS_LOG_EVERY and total_requests % config.ROUTING_STATS_LOG_EVERY == 0:
+        for summary in get_route_stats_summary():
+            logger.info(f"Statistik route: {summary}")
+
+
+def get_route_stats_summary() -> list[dict]:
+    """Ringkasan statistik per route (jumlah, error, rata-rata/maks latensi, token, estimasi biaya)."""
+    summaries = []
+    for route, stats in route_stats.items():
+        count = stats["count"] or 1
+        summaries.append({
+            "route": route,
+            "model": get_route_config(route).get("model"),
+            "count": stats["count"],
+            "errors": stats["errors"],
+            "avg_latency": round(stats["total_latency"] / count, 3),
+            "max_latency": round(stats["max_latency"], 3),
+            "input_tokens": stats["input_tokens"],
+            "output_tokens": stats["output_tokens"],
+            "estimated_cost": round(stats["estimated_cost"], 6),
+        })
+    return summaries
+
+
+def _upload_image_refs_sync(image_refs: list[dict]) -> None:
+    """Mengupload gambar dari cache lokal ke Gemini File API dan menyimpan URI-nya di referensi."""
+    for image_ref in image_refs:
+        if image_ref.get("file_uri"):
+            continue
+        image_path = image_cache.get_image_path(image_ref.get("hash"))
+        if not image_path:
+            continue
+        try:
+            uploaded_file = load_genai().upload_file(image_path, mime_type=image_ref.get("mime_type", "image/jpeg"))
+            image_ref["file_uri"] = uploaded_file.uri
+            logger.debug(f"Gambar {image_ref['hash'][:12]} diupload ke Gemini File API: {uploaded_file.uri}")
+        except Exception as e:
+            logger.warning(f"Gagal mengupload gambar {image_ref['hash'][:12]} ke Gemini File API: {e}")
 
-        if response.prompt_feedback and response.prompt_feedback.block_reason:
-            reason = response.prompt_feedback.block_reason
-            logger.warning(f"Permintaan multimodal diblokir oleh Gemini (Chat ID: {chat_id}) karena: {reason}.")
-            return f"Maaf, permintaan Anda (dengan gambar) tidak dapat diproses karena alasan keamanan: {reason}."
 
-        gemini_reply_text = response.text
-        logger.info(f"Menerima balasan multimodal dari Gemini (Chat ID: {chat_id}): '{gemini_reply_text[:100]}...'")
+async def _prepare_image_refs_for_history(image_refs: list[dict] | None) -> list[dict] | None:
+    """Melengkapi referensi gambar (URI Gemini opsional) sebelum disimpan ke riwayat."""
+    if not image_refs:
+        return None
+    if config.UPLOAD_HISTORY_IMAGES_TO_GEMINI:
+        await asyncio.to_thread(_upload_image_refs_sync, image_refs)
+    return image_refs
 
-        if supabase_manager.supabase_client and text_prompt_for_history:
-            supabase_manager.add_message_to_history(chat_id, "user", text_prompt_for_history)
-            supabase_manager.add_message_to_history(chat_id, "model", gemini_reply_text)
 
-        return gemini_reply_text
+BUSY_MESSAGE = "Maaf, layanan AI sedang sibuk atau bermasalah. Silakan coba lagi beberapa saat lagi."
 
-    except Exception as e:
-        logger.error(f"Error saat generate content multimodal dari Gemini (Chat ID: {chat_id}): {e}", exc_info=True)
-        return "Maaf, terjadi kesalahan saat memproses permintaan gambar Anda dengan AI."
 
-async def generate_thinking_response(chat_id: int, prompt_parts: list, text_prompt_for_history: str | None) -> str | None:
-    """Menghasilkan respons dari model THINKING (/td) Gemini."""
-    global gemini_model_thinking
+# Stage pipeline
 
-    if gemini_model_thinking is None:
-        logger.error("Model thinking Gemini (/td) belum diinisialisasi atau gagal dikonfigurasi.")
-        return "Maaf, fitur berpikir mendalam (/td) saat ini tidak tersedia."
+async def assemble_context_stage(request: pipeline.GenerationRequest) -> None:
+    """Memastikan model siap, mengambil riwayat, lalu memilih route dan generation config."""
+    model_ready = gemini_model_thinking if request.command == "td" else gemini_model_base
+    if model_ready is None:
+        logger.error(f"{request.log_prefix}Model Gemini untuk permintaan ini belum diinisialisasi atau gagal dikonfigurasi.")
+        request.finish(request.unavailable_message)
+        return
 
-    retrieved_text_history = []
-    if supabase_manager.supabase_client:
-        retrieved_text_history = supabase_manager.get_chat_history(chat_id)
-        logger.debug(f"[TD] Riwayat teks yang diambil dari Supabase untuk chat {chat_id}: {len(retrieved_text_history)} pesan.")
+    if supabase_manager.is_history_enabled():
+        request.history = await supabase_manager.get_chat_history(request.chat_id)
+        logger.debug(f"{request.log_prefix}Riwayat yang diambil untuk chat {request.chat_id}: {len(request.history)} pesan.")
     else:
-        logger.warning("[TD] Supabase tidak aktif. Pemrosesan /td akan berjalan tanpa riwayat.")
+        logger.warning(f"{request.log_prefix}Backend riwayat tidak aktif. Permintaan akan diproses tanpa riwayat percakapan persisten.")
 
-    gen_config_td = None
-    if GENERATION_CONFIG_SUPPORTED and config.THINKING_BUDGET is not None:
-        try:
-            think_config = ThinkingConfig(thinking_budget=config.THINKING_BUDGET)
-            gen_config_td = GenerationConfig(thinking_config=think_config)
-            logger.info(f"[TD] Menggunakan thinking_budget={config.THINKING_BUDGET} untuk chat {chat_id}.")
-        except Exception as e_cfg:
-            logger.warning(f"[TD] Gagal membuat GenerationConfig/ThinkingConfig (mungkin tidak didukung model {config.THINKING_MODEL_NAME}): {e_cfg}")
-            gen_config_td = None
-    elif not GENERATION_CONFIG_SUPPORTED:
-         logger.debug(f"[TD] SDK tidak mendukung GenerationConfig/ThinkingConfig. Menggunakan default model.")
-    else:
-         logger.info(f"[TD] THINKING_BUDGET tidak diatur (None). Menggunakan default model {config.THINKING_MODEL_NAME}.")
+    # Hitung jumlah gambar berdasarkan struktur dictionary yang kita harapkan
+    request.num_images = sum(1 for part in request.prompt_parts if isinstance(part, dict) and 'inline_data' in part)
+    # Gambar dari riwayat ikut dikirim ulang, jadi pertanyaan lanjutan tentang foto tetap butuh route standar
+    history_images = sum(len(turn.images) for turn in request.history)
+    request.route = classify_request(request.text_prompt_for_history, request.num_images + history_images, len(request.history), command=request.command)
 
-    chat_session_td = gemini_model_thinking.start_chat(history=retrieved_text_history)
+    thinking_budget = get_route_config(request.route).get("thinking_budget")
+    request.generation_config = build_generation_config(thinking_budget, log_prefix=request.log_prefix)
+    if request.generation_config is not None:
+        logger.info(f"{request.log_prefix}Menggunakan thinking_budget={thinking_budget} (route: {request.route}) untuk chat {request.chat_id}.")
 
-    num_images = sum(1 for part in prompt_parts if isinstance(part, dict) and 'inline_data' in part)
-    logger.info(f"[TD] Mengirim ke model {config.THINKING_MODEL_NAME} untuk chat {chat_id}: prompt dengan {num_images} gambar. Teks: '{text_prompt_for_history}'")
 
+async def _consume_stream(request: pipeline.GenerationRequest) -> None:
+    partial_text = ""
+    async for chunk in request.response:
+        try:
+            partial_text += chunk.text
+        except ValueError:
+            continue
+        await request.on_partial_text(partial_text)
+
+
+async def generate_stage(request: pipeline.GenerationRequest) -> None:
+    """Mengirim prompt ke model route terpilih lewat resilient_client, streaming jika request.stream."""
+    if request.cache_hit:
+        return
+    logger.info(f"{request.log_prefix}Mengirim ke Gemini untuk chat {request.chat_id} (route: {request.route}): prompt dengan {request.num_images} gambar. Teks utama (jika ada): '{request.text_prompt_for_history}'")
+    generation_started_at = time.monotonic()
     try:
-        response = await chat_session_td.send_message_async(
-            prompt_parts,
-            generation_config=gen_config_td
+        request.response = await send_message(
+            request.route, request.history, request.prompt_parts,
+            generation_config=request.generation_config,
+            timeout=request.timeout,
+            stream=request.stream,
+            call_info=request.extras
         )
+        if request.stream:
+            await _consume_stream(request)
+    except resilient_client.CircuitOpenError as e:
+        request.error = e
+        logger.warning(f"{request.log_prefix}Permintaan untuk chat {request.chat_id} ditolak cepat: {e}")
+        request.finish(BUSY_MESSAGE)
+    except Exception as e:
+        request.error = e
+        logger.error(f"{request.log_prefix}Error saat generate content dari Gemini (Chat ID: {request.chat_id}, route: {request.route}): {e}", exc_info=True)
+        request.finish(request.error_message)
+    finally:
+        request.generation_latency = time.monotonic() - generation_started_at
+
+
+async def safety_stage(request: pipeline.GenerationRequest) -> None:
+    """Menangani prompt/respons yang diblokir filter keamanan Gemini dan mengambil teks balasan."""
+    if request.cache_hit:
+        return
+    prompt_feedback = request.response.prompt_feedback
+    if prompt_feedback and prompt_feedback.block_reason:
+        reason = prompt_feedback.block_reason
+        logger.warning(f"{request.log_prefix}Permintaan diblokir oleh Gemini (Chat ID: {request.chat_id}) karena: {reason}.")
+        request.finish(request.blocked_message.format(reason=reason))
+        return
 
-        if response.prompt_feedback and response.prompt_feedback.block_reason:
-            reason = response.prompt_feedback.block_reason
-            logger.warning(f"[TD] Permintaan diblokir oleh Gemini (Chat ID: {chat_id}) karena: {reason}.")
-            return f"Maaf, permintaan berpikir mendalam Anda tidak dapat diproses karena alasan keamanan: {reason}."
-
-        gemini_reply_text = response.text
-        logger.info(f"[TD] Menerima balasan dari model THINKING (Chat ID: {chat_id}): '{gemini_reply_text[:100]}...'")
-
-        if supabase_manager.supabase_client and text_prompt_for_history:
-            # Menandai di history bahwa ini dari /td bisa membantu saat debugging
-            supabase_manager.add_message_to_history(chat_id, "user", f"[TD] {text_prompt_for_history}")
-            supabase_manager.add_message_to_history(chat_id, "model", gemini_reply_text)
-
-        return gemini_reply_text
+    try:
+        request.reply_text = request.response.text
+    except ValueError as e:
+        # response.text melempar ValueError jika kandidat balasan diblokir (misal finish_reason SAFETY)
+        candidates = getattr(request.response, "candidates", None) or []
+        reason = getattr(candidates[0], "finish_reason", e) if candidates else e
+        logger.warning(f"{request.log_prefix}Balasan Gemini diblokir atau kosong (Chat ID: {request.chat_id}): {reason}.")
+        request.finish(request.blocked_message.format(reason=reason))
+        return
+
+    logger.info(f"{request.log_prefix}Menerima balasan dari Gemini (Chat ID: {request.chat_id}): '{request.reply_text[:100]}...'")
+
+
+async def persist_stage(request: pipeline.GenerationRequest) -> None:
+    """Menyimpan giliran user dan balasan model ke riwayat."""
+    if supabase_manager.is_history_enabled() and request.text_prompt_for_history:
+        history_image_refs = await _prepare_image_refs_for_history(request.image_refs)
+        await supabase_manager.add_message_to_history(request.chat_id, "user", f"{request.history_prefix}{request.text_prompt_for_history}", image_refs=history_image_refs)
+        await supabase_manager.add_message_to_history(request.chat_id, "model", request.reply_text)
+
+
+async def route_metrics_middleware(request: pipeline.GenerationRequest, call_next):
+    """Mencatat statistik route untuk setiap permintaan yang benar-benar memanggil Gemini."""
+    reply_text = await call_next(request)
+    if request.route is not None and request.generation_latency is not None:
+        record_route_stats(request.route, request.generation_latency, request.response, error=request.error is not None)
+    return reply_text
+
+
+async def token_quota_middleware(request: pipeline.GenerationRequest, call_next):
+    """Mencatat token yang dipakai ke kuota harian user dan chat (lihat throttle.py)."""
+    reply_text = await call_next(request)
+    if not request.cache_hit:
+        usage_tokens = get_token_usage(request.response)
+        if usage_tokens is not None:
+            throttle.record_tokens(request.user_id, request.chat_id, sum(usage_tokens))
+    return reply_text
+
+
+async def usage_log_middleware(request: pipeline.GenerationRequest, call_next):
+    """Mencatat pemakaian setiap giliran (token, gambar, model, latensi, cache hit) ke usage_log."""
+    reply_text = await call_next(request)
+    usage = getattr(request.response, "usage_metadata", None) if request.response is not None else None
+    route = request.route
+    usage_log.record({
+        "ts": time.time(),
+        "chat_id": request.chat_id,
+        "user_id": request.user_id,
+        "command": request.command,
+        "route": route,
+        "model": request.extras.get("model") or (get_route_config(route).get("model") if route else None),
+        "input_tokens": (getattr(usage, "prompt_token_count", 0) or 0) if usage else 0,
+        "output_tokens": (getattr(usage, "candidates_token_count", 0) or 0) if usage else 0,
+        "thinking_tokens": (getattr(usage, "thoughts_token_count", 0) or 0) if usage else 0,
+        "images": request.num_images,
+        "latency": round(request.generation_latency, 3) if request.generation_latency is not None else None,
+        "total_latency": round(time.monotonic() - request.started_at, 3),
+        "cache_hit": request.cache_hit,
+        "error": request.error is not None,
+    })
+    return reply_text
+
+
+request_pipeline = pipeline.Pipeline(
+    stages=[
+        assemble_context_stage,
+        pipeline.response_cache_lookup_stage,
+        generate_stage,
+        safety_stage,
+        pipeline.response_cache_store_stage,
+        persist_stage,
+    ],
+    middleware=[
+        pipeline.in_flight_middleware,
+        usage_log_middleware,
+        route_metrics_middleware,
+        token_quota_middleware,
+        pipeline.concurrency_limit_middleware,
+        pipeline.streaming_middleware,
+    ],
+)
+
+
+async def generate_response(prompt: str, chat_id: int, user_id: int | None = None, on_partial_text=None) -> str | None:
+    """
+    Mengirim prompt ke Gemini menggunakan sesi chat yang sesuai (mempertahankan histori).
+    Membuat sesi baru jika belum ada untuk chat_id tersebut.
+    Jika on_partial_text diberikan, teks sementara dikirim ke callback itu selama Gemini menjawab.
+    """
+    return await request_pipeline.run(pipeline.GenerationRequest(
+        chat_id=chat_id,
+        user_id=user_id,
+        on_partial_text=on_partial_text,
+        prompt_parts=[prompt],
+        text_prompt_for_history=prompt,
+        blocked_message="Maaf, permintaan Anda tidak dapat diproses karena alasan keamanan: {reason}. Riwayat chat mungkin terpengaruh.",
+    ))
 
-    except Exception as e:
-        logger.error(f"Error saat generate content dari model THINKING ({config.THINKING_MODEL_NAME}) (Chat ID: {chat_id}): {e}", exc_info=True)
-        return "Maaf, terjadi kesalahan saat mencoba berpikir mendalam."
 
+async def generate_multimodal_response(chat_id: int, prompt_parts: list, text_prompt_for_history: str | None, image_refs: list[dict] | None = None, user_id: int | None = None, on_partial_text=None) -> str | None:
+    """
+    Menghasilkan respons dari Gemini berdasarkan input multimodal (teks dan/atau gambar).
+    Menyimpan versi teks dari percakapan ke Supabase jika diaktifkan.
 
-def reset_chat_history(chat_id: int) -> bool:
-    """Menghapus riwayat percakapan untuk chat_id tertentu dari Supabase."""
-    if not supabase_manager.supabase_client:
-        logger.warning("Supabase tidak aktif. Tidak dapat mereset riwayat percakapan.")
+    Args:
+        chat_id: ID chat pengguna.
+        prompt_parts: List yang berisi bagian-bagian prompt. Bisa berupa string (untuk teks)
+                      atau dictionary (untuk gambar, dengan format yang dikenali Gemini).
+        text_prompt_for_history: Versi teks dari prompt pengguna (misalnya caption)
+                                 untuk disimpan ke riwayat chat.
+        image_refs: Referensi ringkas gambar di prompt (dari image_cache.store_image)
+                    untuk disimpan ke riwayat, agar gambar bisa dilampirkan lagi di pertanyaan lanjutan.
+        user_id: ID user pengirim, untuk menghitung kuota token harian per user.
+        on_partial_text: Opsional, async callback(teks_sementara) untuk streaming balasan.
+    Returns:
+        String balasan dari Gemini, atau None jika terjadi error.
+    """
+    has_images = any(isinstance(part, dict) for part in prompt_parts)
+    return await request_pipeline.run(pipeline.GenerationRequest(
+        chat_id=chat_id,
+        user_id=user_id,
+        on_partial_text=on_partial_text,
+        prompt_parts=prompt_parts,
+        text_prompt_for_history=text_prompt_for_history,
+        image_refs=image_refs,
+        blocked_message=(
+            "Maaf, permintaan Anda (dengan gambar) tidak dapat diproses karena alasan keamanan: {reason}."
+            if has_images else
+            "Maaf, permintaan Anda tidak dapat diproses karena alasan keamanan: {reason}."
+        ),
+        error_message=(
+            "Maaf, terjadi kesalahan saat memproses permintaan gambar Anda dengan AI."
+            if has_images else
+            "Maaf, terjadi kesalahan saat menghubungi AI. Silakan coba lagi nanti."
+        ),
+    ))
+
+
+async def generate_thinking_response(chat_id: int, prompt_parts: list, text_prompt_for_history: str | None, image_refs: list[dict] | None = None, user_id: int | None = None, on_partial_text=None) -> str | None:
+    """Menghasilkan respons dari model THINKING (/td) Gemini. image_refs, user_id dan on_partial_text sama seperti di generate_multimodal_response."""
+    return await request_pipeline.run(pipeline.GenerationRequest(
+        chat_id=chat_id,
+        user_id=user_id,
+        on_partial_text=on_partial_text,
+        prompt_parts=prompt_parts,
+        text_prompt_for_history=text_prompt_for_history,
+        image_refs=image_refs,
+        command="td",
+        log_prefix="[TD] ",
+        # Menandai di history bahwa ini dari /td bisa membantu saat debugging
+        history_prefix="[TD] ",
+        timeout=config.GEMINI_THINKING_REQUEST_TIMEOUT,
+        unavailable_message="Maaf, fitur berpikir mendalam (/td) saat ini tidak tersedia.",
+        blocked_message="Maaf, permintaan berpikir mendalam Anda tidak dapat diproses karena alasan keamanan: {reason}.",
+        error_message="Maaf, terjadi kesalahan saat mencoba berpikir mendalam.",
+    ))
+
+
+async def reset_chat_history(chat_id: int) -> bool:
+    """Menghapus riwayat percakapan untuk chat_id tertentu dari backend riwayat."""
+    if not supabase_manager.is_history_enabled():
+        logger.warning("Backend riwayat tidak aktif. Tidak dapat mereset riwayat percakapan.")
         return True
 
-    logger.info(f"Mereset riwayat percakapan dari Supabase untuk chat_id {chat_id}.")
-    return supabase_manager.delete_chat_history_db(chat_id)
+    logger.info(f"Mereset riwayat percakapan untuk chat_id {chat_id}.")
+    return await supabase_manager.delete_chat_history_db(chat_id)
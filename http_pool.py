@@ -0,0 +1,129 @@
+"""
+Lapisan connection pool HTTP bersama.
+
+Semua klien HTTP bot (Supabase dan request Telegram) dibuat dari satu konfigurasi di sini:
+ukuran pool, keep-alive, HTTP/2, dan timeout. Koneksi dipakai ulang antar permintaan sehingga
+jalur yang sering dipanggil tidak mengulang TCP/TLS handshake. get_pool_stats() memberi
+gambaran pemakaian pool untuk dipantau.
+"""
+import importlib.util
+import logging
+import httpx
+import config
+
+logger = logging.getLogger(__name__)
+
+_sync_clients = {}
+_telegram_requests = {}
+_request_counts = {}
+
+
+def http2_enabled() -> bool:
+    """HTTP/2 hanya aktif jika diizinkan di config dan paket h2 terpasang."""
+    if not config.HTTP2_ENABLED:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        logger.warning("HTTP2_ENABLED=True tetapi paket 'h2' tidak terpasang (pip install \"httpx[http2]\"). Memakai HTTP/1.1.")
+        return False
+    return True
+
+
+def build_limits(max_connections: int) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=min(config.HTTP_POOL_MAX_KEEPALIVE, max_connections),
+        keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def build_timeout(read_timeout: float | None = None) -> httpx.Timeout:
+    return httpx.Timeout(
+        connect=config.HTTP_CONNECT_TIMEOUT,
+        read=config.HTTP_READ_TIMEOUT if read_timeout is None else read_timeout,
+        write=config.HTTP_WRITE_TIMEOUT,
+        pool=config.HTTP_POOL_TIMEOUT,
+    )
+
+
+def _count_request(name: str):
+    def hook(request):
+        _request_counts[name] = _request_counts.get(name, 0) + 1
+    return hook
+
+
+def _count_request_async(name: str):
+    async def hook(request):
+        _request_counts[name] = _request_counts.get(name, 0) + 1
+    return hook
+
+
+def get_sync_client(name: str = "supabase") -> httpx.Client:
+    """Mengembalikan httpx.Client bersama (dibuat sekali per nama) dengan pool dan keep-alive dari config."""
+    client = _sync_clients.get(name)
+    if client is None:
+        use_http2 = http2_enabled()
+        client = httpx.Client(
+            http2=use_http2,
+            limits=build_limits(config.HTTP_POOL_MAX_CONNECTIONS),
+            timeout=build_timeout(),
+            event_hooks={"request": [_count_request(name)]},
+        )
+        _sync_clients[name] = client
+        logger.info(f"Connection pool HTTP '{name}' dibuat (maks {config.HTTP_POOL_MAX_CONNECTIONS} koneksi, HTTP/2: {use_http2}).")
+    return client
+
+
+def build_telegram_request(name: str, pool_size: int, read_timeout: float | None = None):
+    """Membuat HTTPXRequest python-telegram-bot dengan pengaturan pool yang sama."""
+    from telegram.request import HTTPXRequest
+
+    request = HTTPXRequest(
+        connection_pool_size=pool_size,
+        read_timeout=config.HTTP_READ_TIMEOUT if read_timeout is None else read_timeout,
+        write_timeout=config.HTTP_WRITE_TIMEOUT,
+        connect_timeout=config.HTTP_CONNECT_TIMEOUT,
+        pool_timeout=config.HTTP_POOL_TIMEOUT,
+        http_version="2" if http2_enabled() else "1.1",
+        httpx_kwargs={
+            "limits": build_limits(pool_size),
+            "event_hooks": {"request": [_count_request_async(name)]},
+        },
+    )
+    _telegram_requests[name] = (request, pool_size)
+    return request
+
+
+def _describe_pool(name: str, client, max_connections: int | None) -> dict:
+    stats = {"name": name, "requests": _request_counts.get(name, 0), "max_connections": max_connections}
+    try:
+        connections = client._transport._pool.connections
+        idle = sum(1 for connection in connections if connection.is_idle())
+        stats.update({
+            "connections": len(connections),
+            "active": len(connections) - idle,
+            "idle": idle,
+        })
+        if max_connections:
+            stats["utilization"] = round((len(connections) - idle) / max_connections, 3)
+    except AttributeError:
+        # Struktur internal httpx/httpcore bisa berubah antar versi
+        stats["connections"] = None
+    return stats
+
+
+def get_pool_stats() -> list[dict]:
+    """Statistik pemakaian setiap pool: jumlah koneksi aktif/idle, utilisasi, dan jumlah request."""
+    stats = []
+    for name, client in _sync_clients.items():
+        stats.append(_describe_pool(name, client, config.HTTP_POOL_MAX_CONNECTIONS))
+    for name, (request, pool_size) in _telegram_requests.items():
+        client = getattr(request, "_client", None)
+        if client is not None:
+            stats.append(_describe_pool(name, client, pool_size))
+    return stats
+
+
+def close_sync_clients() -> None:
+    for client in _sync_clients.values():
+        client.close()
+    _sync_clients.clear()
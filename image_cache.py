@@ -0,0 +1,213 @@
+import hashlib
+import logging
+import os
+import time
+import config
+
+logger = logging.getLogger(__name__)
+
+# Indeks file_unique_id Telegram -> hash konten, agar gambar yang sama tidak diunduh ulang
+_unique_id_index: dict[str, str] = {}
+
+
+def _cache_dir() -> str:
+    cache_dir = config.IMAGE_CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def _image_path(content_hash: str) -> str:
+    return os.path.join(_cache_dir(), f"{content_hash}.img")
+
+
+def get_image_path(content_hash: str) -> str | None:
+    """Mengembalikan path file gambar di cache lokal jika ada."""
+    if not config.IMAGE_CACHE_ENABLED or not content_hash:
+        return None
+    path = _image_path(content_hash)
+    return path if os.path.exists(path) else None
+
+
+def _index_path(file_unique_id: str) -> str:
+    return os.path.join(_cache_dir(), f"{file_unique_id}.ref")
+
+
+def compute_hash(image_bytes: bytes) -> str:
+    """Menghitung hash konten (sha256) dari bytes gambar."""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def store_image(image_bytes: bytes, file_unique_id: str | None = None, mime_type: str = "image/jpeg") -> dict:
+    """
+    Menyimpan gambar ke cache lokal dan mengembalikan referensi ringkas
+    yang bisa disimpan di riwayat chat.
+    """
+    content_hash = compute_hash(image_bytes)
+    image_ref = {"hash": content_hash, "mime_type": mime_type}
+    if file_unique_id:
+        image_ref["file_unique_id"] = file_unique_id
+
+    if not config.IMAGE_CACHE_ENABLED:
+        return image_ref
+
+    try:
+        path = _image_path(content_hash)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(image_bytes)
+            os.replace(tmp_path, path)
+            logger.debug(f"Gambar {content_hash[:12]} disimpan ke cache lokal.")
+        else:
+            _touch(path)
+        if file_unique_id and _unique_id_index.get(file_unique_id) != content_hash:
+            with open(_index_path(file_unique_id), "w") as f:
+                f.write(content_hash)
+            _unique_id_index[file_unique_id] = content_hash
+    except OSError as e:
+        logger.warning(f"Gagal menyimpan gambar {content_hash[:12]} ke cache lokal: {e}")
+
+    return image_ref
+
+
+def _touch(path: str) -> None:
+    """Memperbarui mtime file agar sweep() memperlakukannya sebagai baru dipakai."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def load_image(content_hash: str) -> bytes | None:
+    """Membaca bytes gambar dari cache lokal berdasarkan hash konten (blocking, jangan panggil langsung di event loop)."""
+    if not config.IMAGE_CACHE_ENABLED or not content_hash:
+        return None
+    path = _image_path(content_hash)
+    try:
+        with open(path, "rb") as f:
+            image_bytes = f.read()
+        _touch(path)
+        return image_bytes
+    except FileNotFoundError:
+        logger.debug(f"Gambar {content_hash[:12]} tidak ada di cache lokal.")
+        return None
+    except OSError as e:
+        logger.warning(f"Gagal membaca gambar {content_hash[:12]} dari cache lokal: {e}")
+        return None
+
+
+def lookup_by_unique_id(file_unique_id: str) -> tuple[str, bytes] | None:
+    """Mencari gambar di cache berdasarkan file_unique_id Telegram. Mengembalikan (hash, bytes) atau None."""
+    if not config.IMAGE_CACHE_ENABLED or not file_unique_id:
+        return None
+
+    content_hash = _unique_id_index.get(file_unique_id)
+    if content_hash is None:
+        try:
+            with open(_index_path(file_unique_id), "r") as f:
+                content_hash = f.read().strip()
+            _unique_id_index[file_unique_id] = content_hash
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Gagal membaca indeks cache untuk {file_unique_id}: {e}")
+            return None
+
+    image_bytes = load_image(content_hash)
+    if image_bytes is None:
+        _unique_id_index.pop(file_unique_id, None)
+        return None
+    return content_hash, image_bytes
+
+
+def image_ref_to_part(image_ref: dict) -> dict | None:
+    """
+    Mengubah referensi gambar dari riwayat menjadi bagian prompt Gemini.
+    Mengutamakan cache lokal, lalu URI file Gemini jika tersedia. Membaca disk, jadi
+    panggil lewat asyncio.to_thread dari kode async.
+    """
+    mime_type = image_ref.get("mime_type", "image/jpeg")
+
+    image_bytes = load_image(image_ref.get("hash"))
+    if image_bytes is None and image_ref.get("file_unique_id"):
+        cached = lookup_by_unique_id(image_ref["file_unique_id"])
+        if cached:
+            image_bytes = cached[1]
+
+    if image_bytes is not None:
+        return {"inline_data": {"mime_type": mime_type, "data": image_bytes}}
+    if image_ref.get("file_uri"):
+        return {"file_data": {"mime_type": mime_type, "file_uri": image_ref["file_uri"]}}
+    return None
+
+
+def sweep(max_age_days: float | None = None, max_bytes: int | None = None) -> int:
+    """
+    Membersihkan cache lokal: menghapus gambar yang lebih tua dari max_age_days, lalu gambar yang
+    paling lama tidak dipakai (mtime, diperbarui setiap dibaca) sampai total ukuran <= max_bytes.
+    Indeks file_unique_id yang menunjuk ke gambar terhapus dan sisa file .tmp ikut dihapus.
+    Default dari IMAGE_CACHE_MAX_AGE_DAYS dan IMAGE_CACHE_MAX_BYTES. Blocking, dipanggil dari
+    job retensi lewat asyncio.to_thread. Mengembalikan jumlah gambar yang dihapus.
+    """
+    if max_age_days is None:
+        max_age_days = config.IMAGE_CACHE_MAX_AGE_DAYS
+    if max_bytes is None:
+        max_bytes = config.IMAGE_CACHE_MAX_BYTES
+    cache_dir = config.IMAGE_CACHE_DIR
+    if not config.IMAGE_CACHE_ENABLED or not os.path.isdir(cache_dir):
+        return 0
+
+    now = time.time()
+    images = []  # (mtime, ukuran, path, hash)
+    index_paths = []
+    with os.scandir(cache_dir) as entries:
+        for entry in entries:
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if entry.name.endswith(".img"):
+                images.append((stat.st_mtime, stat.st_size, entry.path, entry.name[:-4]))
+            elif entry.name.endswith(".ref"):
+                index_paths.append(entry.path)
+            elif entry.name.endswith(".tmp") and now - stat.st_mtime > 3600:
+                # Sisa penulisan yang gagal di tengah jalan
+                _remove(entry.path)
+
+    images.sort()  # Paling lama tidak dipakai dulu
+    total_bytes = sum(size for _, size, _, _ in images)
+    kept_hashes = {content_hash for _, _, _, content_hash in images}
+    removed = 0
+    for mtime, size, path, content_hash in images:
+        expired = bool(max_age_days) and now - mtime > max_age_days * 86400
+        over_size = bool(max_bytes) and total_bytes > max_bytes
+        if not expired and not over_size:
+            break
+        if _remove(path):
+            total_bytes -= size
+            kept_hashes.discard(content_hash)
+            removed += 1
+
+    for index_path in index_paths:
+        try:
+            with open(index_path, "r") as f:
+                content_hash = f.read().strip()
+        except OSError:
+            continue
+        if content_hash not in kept_hashes and _remove(index_path):
+            _unique_id_index.pop(os.path.basename(index_path)[:-4], None)
+
+    if removed:
+        logger.info(f"Sweep cache gambar: {removed} gambar dihapus, sisa {total_bytes} byte.")
+    return removed
+
+
+def _remove(path: str) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        logger.warning(f"Gagal menghapus {path} dari cache lokal: {e}")
+        return False
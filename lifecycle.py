@@ -0,0 +1,159 @@
+"""
+Siklus hidup bot: drain saat shutdown dan reload config tanpa restart.
+
+Saat shutdown (SIGTERM/SIGINT), python-telegram-bot berhenti mengambil update baru dan
+menyelesaikan update yang sudah diterima. drain() lalu menunggu permintaan AI yang masih
+berjalan dan menyimpan album yang belum diproses ke disk, dan flush_pending_writes()
+mengosongkan antrian tulis sebelum proses keluar. Album dipulihkan saat bot start berikutnya.
+"""
+import asyncio
+import importlib
+import json
+import logging
+import os
+import time
+import config
+import gemini_client
+import http_pool
+import pipeline
+import records
+import sqlite_history
+import supabase_manager
+import throttle
+import update_recorder
+import usage_log
+
+logger = logging.getLogger(__name__)
+
+_reload_hooks = []
+_reload_lock = None
+
+
+def on_reload(callback) -> None:
+    """Mendaftarkan callback(application) yang dipanggil setelah config di-reload."""
+    _reload_hooks.append(callback)
+
+
+async def drain(application) -> None:
+    """Dipasang sebagai post_stop: menunggu permintaan AI selesai lalu menyimpan album yang tertunda."""
+    in_flight = pipeline.in_flight_count()
+    if in_flight:
+        logger.info(f"Drain: menunggu {in_flight} permintaan AI yang masih berjalan (maks {config.SHUTDOWN_DRAIN_TIMEOUT} detik)...")
+    if not await pipeline.wait_until_idle(timeout=config.SHUTDOWN_DRAIN_TIMEOUT):
+        logger.warning(f"Drain: {pipeline.in_flight_count()} permintaan AI belum selesai setelah {config.SHUTDOWN_DRAIN_TIMEOUT} detik dan akan ditinggalkan.")
+    save_pending_albums(application.bot_data)
+
+
+async def flush_pending_writes(application) -> None:
+    """Dipasang sebagai post_shutdown: mengosongkan antrian replikasi dan log pemakaian, lalu menutup koneksi."""
+    if not await asyncio.to_thread(supabase_manager.flush_replication, config.SHUTDOWN_FLUSH_TIMEOUT):
+        logger.warning(f"Antrian replikasi ke Supabase belum kosong setelah {config.SHUTDOWN_FLUSH_TIMEOUT} detik.")
+    if not await asyncio.to_thread(usage_log.flush, config.SHUTDOWN_FLUSH_TIMEOUT):
+        logger.warning(f"Log pemakaian belum selesai ditulis setelah {config.SHUTDOWN_FLUSH_TIMEOUT} detik.")
+    throttle.save_state()
+    if not await asyncio.to_thread(update_recorder.close, config.SHUTDOWN_FLUSH_TIMEOUT):
+        logger.warning(f"Rekaman update belum selesai ditulis setelah {config.SHUTDOWN_FLUSH_TIMEOUT} detik.")
+    sqlite_history.close_store()
+    http_pool.close_sync_clients()
+    logger.info("Semua penulisan tertunda sudah di-flush.")
+
+
+# Snapshot album
+
+def save_pending_albums(bot_data: dict) -> int:
+    """Menyimpan album yang masih di buffer (bot_data['media_groups']) ke disk. Mengembalikan jumlah album."""
+    media_groups = bot_data.get('media_groups') or {}
+    pending_count = sum(len(groups) for groups in media_groups.values())
+    path = config.PENDING_ALBUMS_SNAPSHOT_PATH
+    if not pending_count and not bot_data.get('recent_albums'):
+        return 0
+
+    snapshot = {
+        "saved_at": time.time(),
+        # Kunci JSON selalu string, chat_id dikembalikan ke int saat restore
+        "media_groups": {str(chat_id): groups for chat_id, groups in media_groups.items()},
+        "recent_albums": bot_data.get('recent_albums') or {},
+    }
+    try:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as snapshot_file:
+            json.dump(snapshot, snapshot_file, ensure_ascii=False)
+        os.replace(temp_path, path)
+        logger.info(f"Snapshot {pending_count} album tertunda disimpan ke {path}.")
+    except OSError as e:
+        logger.error(f"Gagal menyimpan snapshot album ke {path}: {e}")
+        return 0
+    return pending_count
+
+
+def load_pending_albums(bot_data: dict) -> list[tuple[int, str]]:
+    """
+    Memulihkan snapshot album ke bot_data lalu menghapus file snapshot.
+    Mengembalikan daftar (chat_id, media_group_id) yang perlu dijadwalkan ulang.
+    """
+    path = config.PENDING_ALBUMS_SNAPSHOT_PATH
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, encoding="utf-8") as snapshot_file:
+            snapshot = json.load(snapshot_file)
+        os.remove(path)
+    except (OSError, ValueError) as e:
+        logger.error(f"Gagal membaca snapshot album dari {path}: {e}")
+        return []
+
+    recent_albums = bot_data.setdefault('recent_albums', {})
+    for album_key, images in (snapshot.get("recent_albums") or {}).items():
+        recent_albums[album_key] = tuple(records.album_images_from_json(images))
+
+    snapshot_age = time.time() - snapshot.get("saved_at", 0)
+    if snapshot_age > config.PENDING_ALBUMS_SNAPSHOT_MAX_AGE:
+        logger.warning(f"Snapshot album berumur {snapshot_age:.0f} detik, album tertunda di dalamnya dilewati.")
+        return []
+
+    restored = []
+    media_groups = bot_data.setdefault('media_groups', {})
+    for chat_id_str, groups in (snapshot.get("media_groups") or {}).items():
+        chat_id = int(chat_id_str)
+        for media_group_id_str, images in groups.items():
+            media_groups.setdefault(chat_id, {}).setdefault(media_group_id_str, records.album_images_from_json(images))
+            restored.append((chat_id, media_group_id_str))
+    logger.info(f"{len(restored)} album tertunda dipulihkan dari snapshot.")
+    return restored
+
+
+# Reload config
+
+async def reload_config(application) -> bool:
+    """
+    Memuat ulang config.py tanpa restart: model Gemini dikonfigurasi ulang, command didaftarkan ulang,
+    dan callback on_reload dijalankan. Mengembalikan False jika config.py tidak valid.
+    """
+    global _reload_lock
+    if _reload_lock is None:
+        _reload_lock = asyncio.Lock()
+
+    async with _reload_lock:
+        try:
+            with open(config.__file__, encoding="utf-8") as config_file:
+                compile(config_file.read(), config.__file__, "exec")
+        except (OSError, SyntaxError) as e:
+            logger.error(f"Reload dibatalkan, config.py tidak valid: {e}")
+            return False
+
+        importlib.reload(config)
+        gemini_client._models_by_name.clear()
+        models_ok = await asyncio.to_thread(gemini_client.configure_models)
+        pipeline.reset_middleware_state()
+
+        for callback in _reload_hooks:
+            try:
+                callback(application)
+            except Exception as e:
+                logger.error(f"Callback reload {getattr(callback, '__name__', callback)} gagal: {e}", exc_info=True)
+
+        logger.info(f"Config di-reload (model Gemini siap: {models_ok}).")
+        return models_ok
@@ -1,9 +1,17 @@
+import asyncio
 import logging
+import signal
 import sys
+from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters
 import config
 import bot_handlers
-import gemini_client
+import http_pool
+import lifecycle
+import startup
+import throttle
+import trigger_matcher
+import update_recorder
 #import supabase_manager
 
 logging.basicConfig(
@@ -14,28 +22,25 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
 
-def main() -> None:
-    logger.info("Memulai bot...")
+_command_handlers = []
+_photo_handler = None
 
-    if not config.TELEGRAM_TOKEN:
-        logger.critical("CRITICAL: Token Telegram tidak ditemukan!")
-        sys.exit("Token Telegram tidak ditemukan.")
 
-    if not gemini_client.configure_models():
-        logger.warning("WARNING: Gagal mengkonfigurasi satu atau lebih model Gemini! Fitur AI mungkin terbatas.")
-        if not gemini_client.gemini_model_base:
-             logger.critical("CRITICAL: Model dasar Gemini gagal dikonfigurasi! Bot tidak bisa berjalan.")
-             sys.exit("Model dasar Gemini gagal.")
-
-
-    application = Application.builder().token(config.TELEGRAM_TOKEN).build()
+def register_commands(application: Application) -> None:
+    """Mendaftarkan command dari config.COMMANDS. Dipanggil ulang setelah config di-reload."""
+    global _command_handlers
+    for old_handler in _command_handlers:
+        application.remove_handler(old_handler)
+    _command_handlers = []
 
     registered_commands = []
     if hasattr(config, 'COMMANDS') and isinstance(config.COMMANDS, dict):
         for command_name, function_name_str in config.COMMANDS.items():
             try:
                 handler_func = getattr(bot_handlers, function_name_str)
-                application.add_handler(CommandHandler(command_name, handler_func))
+                command_handler = CommandHandler(command_name, handler_func)
+                application.add_handler(command_handler)
+                _command_handlers.append(command_handler)
                 registered_commands.append(f"/{command_name}")
                 logger.info(f"Command /{command_name} berhasil didaftarkan ke fungsi {function_name_str}.")
             except AttributeError:
@@ -46,20 +51,136 @@ def main() -> None:
     else:
         logger.warning("Variabel COMMANDS tidak ditemukan atau bukan dictionary di config.py.")
 
+    # Command harus dicek sebelum MessageHandler teks di group yang sama
+    group_handlers = application.handlers.get(0, [])
+    application.handlers[0] = _command_handlers + [handler for handler in group_handlers if handler not in _command_handlers]
+
     if registered_commands:
         logger.info(f"Command yang terdaftar: {', '.join(registered_commands)}")
     else:
         logger.info("Tidak ada command eksplisit yang terdaftar dari config.COMMANDS.")
 
+
+def register_photo_handler(application: Application) -> None:
+    """Mendaftarkan (atau melepas) handler foto sesuai IMAGE_UNDERSTANDING_ENABLED. Dipanggil ulang setelah config di-reload."""
+    global _photo_handler
+    if _photo_handler is not None:
+        application.remove_handler(_photo_handler)
+        _photo_handler = None
+
     if config.IMAGE_UNDERSTANDING_ENABLED:
-        application.add_handler(MessageHandler(filters.PHOTO, bot_handlers.handle_photo_message))
+        _photo_handler = MessageHandler(filters.PHOTO, bot_handlers.handle_photo_message)
+        application.add_handler(_photo_handler)
         logger.info("MessageHandler untuk foto (IMAGE_UNDERSTANDING_ENABLED=True) telah ditambahkan.")
     else:
         logger.info("Fitur pemahaman gambar dinonaktifkan via config. IMAGE_UNDERSTANDING_ENABLED=False.")
 
-    application.add_handler(MessageHandler(filters.TEXT & (~filters.UpdateType.EDITED_MESSAGE), bot_handlers.handle_message))
+
+async def run_warm_up(application: Application) -> None:
+    if not await startup.warm_up():
+        logger.critical("CRITICAL: Model dasar Gemini gagal dikonfigurasi! Bot tidak bisa berjalan.")
+        application.stop_running()
+        return
+    bot_handlers.restore_pending_albums(application)
+
+
+def install_reload_signal(application: Application) -> None:
+    """SIGHUP memuat ulang config.py tanpa restart (tidak tersedia di Windows)."""
+    if not hasattr(signal, "SIGHUP"):
+        return
+    try:
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGHUP,
+            lambda: application.create_task(lifecycle.reload_config(application))
+        )
+    except (NotImplementedError, RuntimeError) as e:
+        logger.warning(f"Tidak bisa memasang handler SIGHUP untuk reload config: {e}")
+
+
+async def post_init(application: Application) -> None:
+    """Warm-up dijalankan di latar belakang agar polling langsung dimulai; update ditahan sampai siap."""
+    install_reload_signal(application)
+    trigger_matcher.set_bot_identity(application.bot.id, application.bot.username)
+    application.bot_data["warm_up_task"] = asyncio.create_task(run_warm_up(application))
+
+
+def build_application(token: str | None = None, request=None, get_updates_request=None) -> Application:
+    """Membuat Application dengan hook siklus hidup. request dan get_updates_request bisa diganti (misal untuk replay)."""
+    return Application.builder()\
+        .token(token or config.TELEGRAM_TOKEN)\
+        .post_init(post_init)\
+        .post_stop(lifecycle.drain)\
+        .post_shutdown(lifecycle.flush_pending_writes)\
+        .request(request or http_pool.build_telegram_request("telegram", config.TELEGRAM_POOL_SIZE))\
+        .get_updates_request(get_updates_request or http_pool.build_telegram_request(
+            "telegram_updates",
+            config.TELEGRAM_GET_UPDATES_POOL_SIZE,
+            read_timeout=config.TELEGRAM_GET_UPDATES_READ_TIMEOUT
+        ))\
+        .build()
+
+
+def register_handlers(application: Application) -> None:
+    """Mendaftarkan semua handler update. Juga dipakai replay.py agar trafik rekaman melewati jalur yang sama."""
+    if config.UPDATE_RECORDER_ENABLED:
+        update_recorder.install(application)
+    application.add_handler(startup.ReadinessGate(Update, startup.wait_until_ready), group=-1)
+    register_commands(application)
+    lifecycle.on_reload(register_commands)
+    trigger_matcher.rebuild()
+    lifecycle.on_reload(lambda application: trigger_matcher.rebuild())
+
+    register_photo_handler(application)
+    lifecycle.on_reload(register_photo_handler)
+
+    # Pesan grup yang bukan untuk bot ditolak di filter, sebelum coroutine handler dijadwalkan
+    application.add_handler(MessageHandler(
+        filters.TEXT & (~filters.UpdateType.EDITED_MESSAGE) & trigger_matcher.ADDRESSED_TO_BOT,
+        bot_handlers.handle_message
+    ))
     logger.info("MessageHandler untuk pesan teks biasa telah ditambahkan.")
 
+
+def register_jobs(application: Application) -> None:
+    """Menjadwalkan job berkala (retensi riwayat, state throttle, statistik pool)."""
+    if config.HISTORY_RETENTION_ENABLED:
+        application.job_queue.run_repeating(
+            bot_handlers.history_retention_job,
+            interval=config.HISTORY_RETENTION_INTERVAL,
+            first=60,
+            name="history_retention"
+        )
+        logger.info(f"Job retensi riwayat dijadwalkan setiap {config.HISTORY_RETENTION_INTERVAL} detik.")
+
+    if config.THROTTLE_ENABLED:
+        throttle.load_state()
+        application.job_queue.run_repeating(
+            bot_handlers.throttle_state_job,
+            interval=config.THROTTLE_STATE_SAVE_INTERVAL,
+            first=config.THROTTLE_STATE_SAVE_INTERVAL,
+            name="throttle_state"
+        )
+
+    if config.POOL_STATS_LOG_INTERVAL:
+        application.job_queue.run_repeating(
+            bot_handlers.pool_stats_job,
+            interval=config.POOL_STATS_LOG_INTERVAL,
+            first=config.POOL_STATS_LOG_INTERVAL,
+            name="pool_stats"
+        )
+
+
+def main() -> None:
+    logger.info("Memulai bot...")
+
+    if not config.TELEGRAM_TOKEN:
+        logger.critical("CRITICAL: Token Telegram tidak ditemukan!")
+        sys.exit("Token Telegram tidak ditemukan.")
+
+    application = build_application()
+    register_handlers(application)
+    register_jobs(application)
+
     logger.info("Bot siap menerima pesan...")
     application.run_polling()
     logger.info("Bot dihentikan.")
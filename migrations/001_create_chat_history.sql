@@ -0,0 +1,10 @@
+-- Tabel riwayat chat dasar (sama seperti di readme).
+CREATE TABLE IF NOT EXISTS chat_history (
+    id BIGSERIAL PRIMARY KEY,
+    chat_id BIGINT NOT NULL,
+    message_timestamp TIMESTAMPTZ DEFAULT NOW() NOT NULL,
+    role TEXT NOT NULL CHECK (role IN ('user', 'model')),
+    content TEXT NOT NULL
+);
+
+ALTER TABLE chat_history ADD COLUMN IF NOT EXISTS image_refs JSONB;
@@ -0,0 +1,9 @@
+-- Index komposit untuk pembacaan riwayat terbaru dan paginasi keyset (chat_id, message_timestamp, id).
+-- id ikut di index agar urutan tetap deterministik jika ada timestamp yang sama,
+-- sehingga latensi baca tetap datar walau total baris mencapai jutaan.
+-- Jalankan di luar transaksi karena memakai CONCURRENTLY (tabel tidak terkunci saat index dibuat).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_chat_history_chat_ts_id
+    ON chat_history (chat_id, message_timestamp DESC, id DESC);
+
+-- Index lama tercakup oleh index baru di atas.
+DROP INDEX CONCURRENTLY IF EXISTS idx_chat_history_chat_id_timestamp;
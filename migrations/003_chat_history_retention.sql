@@ -0,0 +1,96 @@
+-- Tabel arsip dan fungsi retensi/compaction riwayat chat.
+CREATE TABLE IF NOT EXISTS chat_history_archive (
+    id BIGINT PRIMARY KEY,
+    chat_id BIGINT NOT NULL,
+    message_timestamp TIMESTAMPTZ NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    image_refs JSONB,
+    archived_at TIMESTAMPTZ DEFAULT NOW() NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_chat_history_archive_chat_ts
+    ON chat_history_archive (chat_id, message_timestamp DESC);
+
+-- Memindahkan (atau menghapus jika do_archive = false) pesan di luar jendela aktif setiap chat:
+-- pesan selain keep_last pesan terbaru, dan pesan yang lebih tua dari max_age (jika diisi).
+-- Batas per chat dicari lewat index (chat_id, message_timestamp DESC, id DESC), bukan scan seluruh tabel.
+-- Retensi bertahap: satu panggilan memproses paling banyak p_max_chats chat setelah after_chat_id
+-- (urut chat_id) dan memangkas paling banyak p_limit pesan, sehingga setiap RPC berjalan di transaksi pendek.
+-- Mengembalikan jumlah pesan yang dipangkas, chat_id terakhir yang selesai diproses (kursor untuk
+-- panggilan berikutnya), dan finished = true jika semua chat sudah diproses.
+-- Dipanggil dari bot lewat supabase_client.rpc("prune_chat_history", {...}), lihat supabase_manager._supabase_prune_batches.
+CREATE OR REPLACE FUNCTION prune_chat_history(
+    keep_last INTEGER,
+    max_age INTERVAL DEFAULT NULL,
+    do_archive BOOLEAN DEFAULT TRUE,
+    p_limit INTEGER DEFAULT 5000,
+    after_chat_id BIGINT DEFAULT NULL,
+    p_max_chats INTEGER DEFAULT 500
+) RETURNS TABLE (removed BIGINT, last_chat_id BIGINT, finished BOOLEAN)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    target_chat BIGINT;
+    boundary_ts TIMESTAMPTZ;
+    boundary_id BIGINT;
+    cutoff_ts TIMESTAMPTZ := CASE WHEN max_age IS NULL THEN NULL ELSE NOW() - max_age END;
+    batch_count BIGINT;
+    chats_seen INTEGER := 0;
+BEGIN
+    removed := 0;
+    last_chat_id := after_chat_id;
+    finished := FALSE;
+
+    FOR target_chat IN
+        SELECT DISTINCT chat_id FROM chat_history
+        WHERE after_chat_id IS NULL OR chat_id > after_chat_id
+        ORDER BY chat_id
+        LIMIT p_max_chats
+    LOOP
+        chats_seen := chats_seen + 1;
+        boundary_ts := NULL;
+        boundary_id := NULL;
+        SELECT message_timestamp, id INTO boundary_ts, boundary_id
+            FROM chat_history
+            WHERE chat_id = target_chat
+            ORDER BY message_timestamp DESC, id DESC
+            OFFSET keep_last LIMIT 1;
+
+        IF boundary_ts IS NOT NULL OR cutoff_ts IS NOT NULL THEN
+            -- Pesan terlama dulu, dibatasi sisa jatah p_limit panggilan ini
+            WITH moved AS (
+                DELETE FROM chat_history
+                WHERE id IN (
+                    SELECT id FROM chat_history
+                    WHERE chat_id = target_chat
+                      AND (
+                        (boundary_ts IS NOT NULL AND (message_timestamp < boundary_ts OR (message_timestamp = boundary_ts AND id <= boundary_id)))
+                        OR (cutoff_ts IS NOT NULL AND message_timestamp < cutoff_ts)
+                      )
+                    ORDER BY message_timestamp, id
+                    LIMIT p_limit - removed
+                )
+                RETURNING id, chat_id, message_timestamp, role, content, image_refs
+            ), archived AS (
+                INSERT INTO chat_history_archive (id, chat_id, message_timestamp, role, content, image_refs)
+                SELECT id, chat_id, message_timestamp, role, content, image_refs FROM moved WHERE do_archive
+                ON CONFLICT (id) DO NOTHING
+            )
+            SELECT COUNT(*) INTO batch_count FROM moved;
+
+            removed := removed + batch_count;
+            -- Jatah habis: chat ini mungkin belum selesai, jadi kursor tidak dimajukan melewatinya
+            IF removed >= p_limit THEN
+                RETURN NEXT;
+                RETURN;
+            END IF;
+        END IF;
+
+        last_chat_id := target_chat;
+    END LOOP;
+
+    finished := chats_seen < p_max_chats;
+    RETURN NEXT;
+END;
+$$;
@@ -0,0 +1,239 @@
+"""
+Mesin pipeline permintaan AI.
+
+Setiap permintaan (teks, gambar, /td) direpresentasikan sebagai GenerationRequest dan
+dijalankan melewati urutan stage (misal: susun konteks -> generate -> cek keamanan -> simpan riwayat).
+Middleware membungkus seluruh pipeline dengan bentuk `async def middleware(request, call_next)`,
+sehingga fitur seperti metrik, kuota, pembatasan, dan streaming berlaku seragam untuk semua jenis permintaan.
+Cache balasan berupa stage, karena kuncinya butuh riwayat yang baru diambil di tengah pipeline.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class GenerationRequest:
+    chat_id: int
+    prompt_parts: list
+    text_prompt_for_history: str | None = None
+    image_refs: list | None = None
+    user_id: int | None = None          # Pengirim permintaan, untuk kuota per user
+    command: str | None = None         # "td" untuk permintaan berpikir mendalam
+    log_prefix: str = ""                # Awalan log, misal "[TD] "
+    history_prefix: str = ""            # Awalan teks user saat disimpan ke riwayat, misal "[TD] "
+    timeout: float | None = None
+    on_partial_text: object = None      # Opsional: async callback(teks_sementara) untuk streaming
+
+    # Pesan untuk pengguna
+    unavailable_message: str = "Maaf, koneksi ke AI sedang bermasalah (Model dasar tidak siap)."
+    blocked_message: str = "Maaf, permintaan Anda tidak dapat diproses karena alasan keamanan: {reason}."
+    error_message: str = "Maaf, terjadi kesalahan saat menghubungi AI. Silakan coba lagi nanti."
+
+    # Diisi oleh stage
+    history: list = field(default_factory=list)  # records.HistoryTurn, diubah ke format SDK di send_message
+    num_images: int = 0
+    route: str | None = None
+    generation_config: object = None
+    response: object = None
+    reply_text: str | None = None
+    finished: bool = False              # True jika stage sudah menentukan balasan akhir (pipeline berhenti)
+    cache_key: tuple | None = None      # Kunci cache balasan, diisi response_cache_lookup_stage
+    cache_hit: bool = False             # True jika balasan diambil dari cache (stage generate dilewati)
+    stream: bool = False                # Diisi streaming_middleware: stage generate meminta respons streaming
+    error: Exception | None = None
+    started_at: float = field(default_factory=time.monotonic)
+    generation_latency: float | None = None
+    extras: dict = field(default_factory=dict)
+
+    def finish(self, reply_text: str | None) -> None:
+        """Menetapkan balasan akhir dan menghentikan stage berikutnya."""
+        self.reply_text = reply_text
+        self.finished = True
+
+
+class Pipeline:
+    """Menjalankan stage secara berurutan di dalam rantai middleware."""
+
+    def __init__(self, stages: list, middleware: list | None = None):
+        self.stages = list(stages)
+        self.middleware = list(middleware or [])
+
+    def use(self, middleware) -> None:
+        """Menambahkan middleware di lapisan paling dalam (dijalankan setelah middleware yang sudah ada)."""
+        self.middleware.append(middleware)
+
+    async def _run_stages(self, request: GenerationRequest) -> str | None:
+        for stage in self.stages:
+            await stage(request)
+            if request.finished:
+                break
+        return request.reply_text
+
+    async def run(self, request: GenerationRequest) -> str | None:
+        handler = self._run_stages
+        for middleware in reversed(self.middleware):
+            handler = _bind_middleware(middleware, handler)
+        return await handler(request)
+
+
+def _bind_middleware(middleware, call_next):
+    async def handler(request: GenerationRequest):
+        return await middleware(request, call_next)
+    return handler
+
+
+# Cache balasan
+
+_response_cache = OrderedDict()
+
+
+def history_fingerprint(history: list) -> tuple:
+    """Sidik ringkas riwayat (jumlah giliran dan hash dua giliran terakhir) untuk kunci cache."""
+    return (len(history), hash(tuple((turn.role, turn.text) for turn in history[-2:])))
+
+
+def _response_cache_key(request: GenerationRequest):
+    # Hanya permintaan teks murni yang di-cache; riwayat ikut dalam kunci lewat sidiknya
+    if request.image_refs or any(not isinstance(part, str) for part in request.prompt_parts):
+        return None
+    return (request.chat_id, request.command, tuple(request.prompt_parts), history_fingerprint(request.history))
+
+
+async def response_cache_lookup_stage(request: GenerationRequest) -> None:
+    """
+    Stage setelah riwayat diambil: memakai balasan dari cache untuk prompt teks yang sama persis
+    dengan riwayat yang sama, misal pesan yang terkirim ganda. Stage generate dan safety dilewati
+    saat cache hit, tapi giliran tetap disimpan ke riwayat oleh stage persist.
+    """
+    if not config.RESPONSE_CACHE_ENABLED:
+        return
+    request.cache_key = _response_cache_key(request)
+    if request.cache_key is None:
+        return
+    cached = _response_cache.get(request.cache_key)
+    if cached and time.monotonic() - cached[0] <= config.RESPONSE_CACHE_TTL:
+        _response_cache.move_to_end(request.cache_key)
+        request.reply_text = cached[1]
+        request.cache_hit = True
+        logger.info(f"{request.log_prefix}Balasan untuk chat {request.chat_id} diambil dari cache.")
+
+
+async def response_cache_store_stage(request: GenerationRequest) -> None:
+    """Stage setelah balasan siap: menyimpan balasan baru dari Gemini ke cache."""
+    if request.cache_key is None or request.cache_hit or not request.reply_text or request.response is None:
+        return
+    _response_cache[request.cache_key] = (time.monotonic(), request.reply_text)
+    _response_cache.move_to_end(request.cache_key)
+    while len(_response_cache) > config.RESPONSE_CACHE_MAX_ENTRIES:
+        _response_cache.popitem(last=False)
+
+
+# Middleware umum
+
+_concurrency_semaphore = None
+_concurrency_limit = None   # Batas yang dipakai _concurrency_semaphore
+_concurrency_users = 0      # Permintaan yang sedang memegang atau menunggu _concurrency_semaphore
+
+
+async def concurrency_limit_middleware(request: GenerationRequest, call_next):
+    """
+    Membatasi jumlah permintaan ke Gemini yang berjalan bersamaan di proses ini.
+    Jika GEMINI_MAX_CONCURRENT_REQUESTS berubah (reload config), semaphore baru hanya dibuat saat
+    semaphore lama tidak dipakai siapa pun, agar permintaan lama dan baru tidak melampaui batas bersama-sama.
+    """
+    global _concurrency_semaphore, _concurrency_limit, _concurrency_users
+    limit = config.GEMINI_MAX_CONCURRENT_REQUESTS
+    if limit != _concurrency_limit and _concurrency_users == 0:
+        _concurrency_semaphore = asyncio.Semaphore(limit) if limit else None
+        _concurrency_limit = limit
+    semaphore = _concurrency_semaphore
+    if semaphore is None:
+        return await call_next(request)
+    _concurrency_users += 1
+    try:
+        async with semaphore:
+            return await call_next(request)
+    finally:
+        _concurrency_users -= 1
+
+
+async def streaming_middleware(request: GenerationRequest, call_next):
+    """
+    Mengaktifkan streaming untuk permintaan yang memberi on_partial_text (opt-in).
+    Callback dipanggil paling sering sekali per STREAM_PARTIAL_UPDATE_INTERVAL detik dengan teks
+    kumulatif, jadi potongan yang terlewat tidak hilang. Semua panggilan selesai sebelum pipeline
+    mengembalikan balasan akhir, jadi edit akhir dari pemanggil tidak tertimpa.
+    """
+    callback = request.on_partial_text
+    if callback is None or not config.STREAMING_ENABLED:
+        request.stream = False
+        return await call_next(request)
+
+    last_sent_at = None
+
+    async def throttled(partial_text: str) -> None:
+        nonlocal last_sent_at
+        now = time.monotonic()
+        if last_sent_at is not None and now - last_sent_at < config.STREAM_PARTIAL_UPDATE_INTERVAL:
+            return
+        last_sent_at = now
+        try:
+            await callback(partial_text)
+        except Exception as e:
+            logger.warning(f"{request.log_prefix}Callback streaming untuk chat {request.chat_id} gagal: {e}")
+
+    request.stream = True
+    request.on_partial_text = throttled
+    try:
+        return await call_next(request)
+    finally:
+        request.on_partial_text = callback
+
+
+_in_flight_count = 0
+_idle_event = None
+
+
+async def in_flight_middleware(request: GenerationRequest, call_next):
+    """Menghitung permintaan yang sedang berjalan, agar shutdown bisa menunggu semuanya selesai (drain)."""
+    global _in_flight_count, _idle_event
+    if _idle_event is None:
+        _idle_event = asyncio.Event()
+        _idle_event.set()
+    _in_flight_count += 1
+    _idle_event.clear()
+    try:
+        return await call_next(request)
+    finally:
+        _in_flight_count -= 1
+        if _in_flight_count == 0:
+            _idle_event.set()
+
+
+def in_flight_count() -> int:
+    return _in_flight_count
+
+
+async def wait_until_idle(timeout: float | None = None) -> bool:
+    """Menunggu sampai tidak ada permintaan yang berjalan. Mengembalikan False jika timeout."""
+    if _idle_event is None or _in_flight_count == 0:
+        return True
+    try:
+        await asyncio.wait_for(_idle_event.wait(), timeout=timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+def reset_middleware_state() -> None:
+    """
+    Mengosongkan cache balasan, dipakai setelah config di-reload. Semaphore tidak dibuang di sini;
+    concurrency_limit_middleware menggantinya sendiri setelah permintaan yang sedang berjalan selesai.
+    """
+    _response_cache.clear()
@@ -0,0 +1,54 @@
+"""
+Record ringkas untuk state di memori: gambar album yang tertunda (tinggal di bot_data per chat)
+dan giliran riwayat chat (hanya selama satu permintaan berjalan, tidak di-cache per chat).
+
+Keduanya NamedTuple (tanpa __dict__ per objek seperti dict biasa), dan string role di-intern
+sehingga semua giliran berbagi objek string yang sama. Format dict SDK Gemini
+({"role": ..., "parts": [...]}) baru dibuat di gemini_client.send_message lewat to_sdk_history().
+Karena berupa tuple, AlbumImage tetap bisa ditulis ke JSON (snapshot album) sebagai list.
+"""
+import sys
+from typing import NamedTuple
+
+ROLE_USER = sys.intern("user")
+ROLE_MODEL = sys.intern("model")
+_ROLES = {ROLE_USER: ROLE_USER, ROLE_MODEL: ROLE_MODEL}
+
+
+def intern_role(role: str) -> str:
+    """Mengembalikan objek string role bersama, agar string dari baris database tidak ikut disimpan."""
+    return _ROLES.get(role) or sys.intern(role)
+
+
+class HistoryTurn(NamedTuple):
+    role: str
+    text: str
+    images: tuple = ()  # Referensi gambar (dict dari image_cache.store_image), bytes-nya baru dibaca saat dikirim
+
+
+class AlbumImage(NamedTuple):
+    file_id: str
+    file_unique_id: str | None = None
+    caption: str | None = None
+    message_id: int | None = None
+
+
+def to_sdk_history(turns: list[HistoryTurn], resolve_image=None) -> list[dict]:
+    """
+    Mengubah giliran riwayat menjadi format history SDK Gemini.
+    resolve_image (misal image_cache.image_ref_to_part) mengubah referensi gambar menjadi bagian prompt;
+    referensi yang menghasilkan None dilewati. Tanpa resolve_image, gambar riwayat tidak ikut dikirim
+    (referensi mentah bukan bagian prompt yang valid untuk SDK).
+    """
+    history = []
+    for turn in turns:
+        parts = [{"text": turn.text}]
+        if turn.images and resolve_image is not None:
+            parts.extend(part for part in map(resolve_image, turn.images) if part)
+        history.append({"role": turn.role, "parts": parts})
+    return history
+
+
+def album_images_from_json(items: list) -> list[AlbumImage]:
+    """Memulihkan AlbumImage dari snapshot JSON (list, atau dict dari snapshot versi lama)."""
+    return [AlbumImage(**item) if isinstance(item, dict) else AlbumImage(*item) for item in items]
@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Dilempar jika circuit breaker model sedang terbuka dan tidak ada model fallback yang bisa dipakai."""
+
+
+def _transient_error_types() -> tuple:
+    error_types = [asyncio.TimeoutError, TimeoutError, ConnectionError]
+    try:
+        from google.api_core import exceptions as google_exceptions
+        error_types.extend([
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.DeadlineExceeded,
+            google_exceptions.InternalServerError,
+            google_exceptions.TooManyRequests,
+            google_exceptions.ResourceExhausted,
+            google_exceptions.Aborted,
+        ])
+    except ImportError:
+        logger.debug("google.api_core tidak tersedia, hanya timeout dan error koneksi yang dianggap sementara.")
+    return tuple(error_types)
+
+
+# Diisi saat pertama kali dipakai agar google.api_core tidak ikut diimpor saat startup
+TRANSIENT_ERROR_TYPES = None
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """True jika error bersifat sementara (timeout, 5xx, rate limit) dan layak dicoba ulang."""
+    global TRANSIENT_ERROR_TYPES
+    if TRANSIENT_ERROR_TYPES is None:
+        TRANSIENT_ERROR_TYPES = _transient_error_types()
+    return isinstance(error, TRANSIENT_ERROR_TYPES)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker per model berdasarkan rasio error dalam jendela waktu bergeser.
+    closed -> open jika rasio error melewati ambang, open -> half-open setelah cooldown,
+    half-open -> closed jika satu permintaan percobaan berhasil.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.half_open_in_flight = False
+        self.outcomes = deque()  # (waktu, berhasil)
+
+    def _trim(self, now: float) -> None:
+        window_start = now - config.CIRCUIT_BREAKER_WINDOW
+        while self.outcomes and self.outcomes[0][0] < window_start:
+            self.outcomes.popleft()
+
+    def allow_request(self) -> bool:
+        now = time.monotonic()
+        if self.state == "open":
+            if now - self.opened_at < config.CIRCUIT_BREAKER_COOLDOWN:
+                return False
+            self.state = "half_open"
+            self.half_open_in_flight = False
+            logger.info(f"Circuit breaker '{self.name}' half-open, mencoba satu permintaan.")
+        if self.state == "half_open":
+            if self.half_open_in_flight:
+                return False
+            self.half_open_in_flight = True
+        return True
+
+    def release(self) -> None:
+        """Hasil netral (error permanen atau dibatalkan): tidak dihitung di rasio error, hanya melepas slot half-open."""
+        if self.state == "half_open":
+            self.half_open_in_flight = False
+
+    def record(self, success: bool) -> None:
+        now = time.monotonic()
+        if self.state == "half_open":
+            self.half_open_in_flight = False
+            if success:
+                self.state = "closed"
+                self.outcomes.clear()
+                logger.info(f"Circuit breaker '{self.name}' kembali closed.")
+            else:
+                self._open(now)
+            return
+
+        self.outcomes.append((now, success))
+        self._trim(now)
+        total = len(self.outcomes)
+        if total < config.CIRCUIT_BREAKER_MIN_REQUESTS:
+            return
+        errors = sum(1 for _, ok in self.outcomes if not ok)
+        if errors / total >= config.CIRCUIT_BREAKER_ERROR_RATE:
+            self._open(now)
+
+    def _open(self, now: float) -> None:
+        self.state = "open"
+        self.opened_at = now
+        self.outcomes.clear()
+        logger.warning(f"Circuit breaker '{self.name}' terbuka selama {config.CIRCUIT_BREAKER_COOLDOWN} detik karena rasio error tinggi.")
+
+
+circuit_breakers = {}
+
+
+def get_circuit_breaker(model_name: str) -> CircuitBreaker:
+    breaker = circuit_breakers.get(model_name)
+    if breaker is None:
+        breaker = CircuitBreaker(model_name)
+        circuit_breakers[model_name] = breaker
+    return breaker
+
+
+def _retry_delay(attempt: int) -> float:
+    """Backoff eksponensial dengan full jitter."""
+    max_delay = min(config.GEMINI_RETRY_MAX_DELAY, config.GEMINI_RETRY_BASE_DELAY * (2 ** attempt))
+    return random.uniform(0, max_delay)
+
+
+def _is_timeout(error: BaseException) -> bool:
+    return isinstance(error, (asyncio.TimeoutError, TimeoutError))
+
+
+async def _call_once(make_call, model_name: str, timeout: float):
+    """Satu percobaan dengan deadline, opsional di-hedge dengan permintaan kedua jika lambat."""
+    first = asyncio.ensure_future(asyncio.wait_for(make_call(model_name), timeout))
+    pending = {first}
+    try:
+        if not config.GEMINI_HEDGE_ENABLED or timeout <= config.GEMINI_HEDGE_DELAY:
+            return await first
+
+        done, _ = await asyncio.wait({first}, timeout=config.GEMINI_HEDGE_DELAY)
+        if done:
+            return first.result()
+
+        logger.debug(f"Permintaan ke '{model_name}' melewati {config.GEMINI_HEDGE_DELAY} detik, mengirim permintaan hedge.")
+        # Hedge memakai sisa waktu percobaan ini, bukan deadline penuh yang baru
+        hedge = asyncio.ensure_future(asyncio.wait_for(make_call(model_name), timeout - config.GEMINI_HEDGE_DELAY))
+        pending = {first, hedge}
+        last_error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                last_error = task.exception()
+        raise last_error
+    finally:
+        # Juga saat pemanggil dibatalkan, agar tidak ada task yang tertinggal berjalan
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def _call_model(make_call, model_name: str, timeout: float, deadline: float):
+    """
+    Memanggil satu model dengan retry ber-jitter untuk error sementara. Setiap percobaan mendapat
+    min(timeout, sisa waktu sampai deadline). Timeout tidak dicoba ulang di model yang sama,
+    karena percobaan berikutnya kemungkinan juga akan menunggu sampai habis.
+    """
+    loop = asyncio.get_running_loop()
+    breaker = get_circuit_breaker(model_name)
+    last_error = None
+    for attempt in range(config.GEMINI_MAX_RETRIES + 1):
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            raise last_error or asyncio.TimeoutError(f"Batas waktu total permintaan ke '{model_name}' habis.")
+        if not breaker.allow_request():
+            raise CircuitOpenError(f"Circuit breaker untuk model '{model_name}' sedang terbuka.")
+        try:
+            result = await _call_once(make_call, model_name, min(timeout, remaining))
+        except Exception as e:
+            if not is_transient_error(e):
+                # Error permanen (misal argumen tidak valid) bukan tanda upstream sehat maupun bermasalah
+                breaker.release()
+                raise
+            breaker.record(False)
+            last_error = e
+            if _is_timeout(e):
+                raise
+            if attempt < config.GEMINI_MAX_RETRIES:
+                delay = _retry_delay(attempt)
+                if loop.time() + delay >= deadline:
+                    break
+                logger.warning(f"Error sementara dari model '{model_name}' (percobaan {attempt + 1}): {type(e).__name__}: {e}. Mencoba lagi dalam {delay:.2f} detik.")
+                await asyncio.sleep(delay)
+        except BaseException:
+            breaker.release()
+            raise
+        else:
+            breaker.record(True)
+            return result
+    raise last_error
+
+
+async def call(model_name: str, make_call, fallback_model_name: str | None = None, timeout: float | None = None):
+    """
+    Menjalankan make_call(model_name) dengan deadline, retry, hedging, dan circuit breaker.
+    make_call harus membuat coroutine baru di setiap pemanggilan (misal sesi chat baru),
+    karena satu permintaan bisa dikirim lebih dari sekali. Jika model utama gagal karena
+    error sementara atau circuit-nya terbuka, fallback_model_name dicoba dengan sisa waktu.
+    timeout berlaku per percobaan; total semua percobaan dibatasi timeout x GEMINI_TOTAL_TIMEOUT_FACTOR.
+    """
+    if timeout is None:
+        timeout = config.GEMINI_REQUEST_TIMEOUT
+    deadline = asyncio.get_running_loop().time() + timeout * config.GEMINI_TOTAL_TIMEOUT_FACTOR
+    try:
+        return await _call_model(make_call, model_name, timeout, deadline)
+    except Exception as e:
+        if not fallback_model_name or fallback_model_name == model_name:
+            raise
+        if not isinstance(e, CircuitOpenError) and not is_transient_error(e):
+            raise
+        if deadline - asyncio.get_running_loop().time() <= 0:
+            raise
+        logger.warning(f"Model '{model_name}' gagal ({type(e).__name__}), beralih ke model fallback '{fallback_model_name}'.")
+        return await _call_model(make_call, fallback_model_name, timeout, deadline)
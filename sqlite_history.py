@@ -0,0 +1,231 @@
+"""
+Backend riwayat chat lokal berbasis SQLite (mode WAL).
+
+Semua akses ke database dijalankan di satu thread I/O khusus, sehingga koneksi SQLite
+tidak pernah dipakai lintas thread dan penulisan selalu berurutan. Method publiknya async:
+event loop hanya menunggu future dari thread itu, tidak pernah ikut terblokir. Query memakai teks SQL
+konstan agar statement yang sudah dikompilasi diambil dari cache statement sqlite3.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+import config
+
+logger = logging.getLogger(__name__)
+
+# Migrasi skema berurutan; versi yang sudah diterapkan disimpan di PRAGMA user_version.
+MIGRATIONS = (
+    (
+        """
+        CREATE TABLE IF NOT EXISTS chat_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            message_timestamp TEXT NOT NULL,
+            role TEXT NOT NULL CHECK (role IN ('user', 'model')),
+            content TEXT NOT NULL,
+            image_refs TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_chat_history_chat_id_timestamp ON chat_history (chat_id, message_timestamp DESC, id DESC)",
+    ),
+    (
+        """
+        CREATE TABLE IF NOT EXISTS chat_history_archive (
+            id INTEGER PRIMARY KEY,
+            chat_id INTEGER NOT NULL,
+            message_timestamp TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            image_refs TEXT,
+            archived_at TEXT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_chat_history_archive_chat_ts ON chat_history_archive (chat_id, message_timestamp DESC)",
+    ),
+)
+
+INSERT_MESSAGE_SQL = "INSERT INTO chat_history (chat_id, message_timestamp, role, content, image_refs) VALUES (?, ?, ?, ?, ?)"
+SELECT_RECENT_SQL = (
+    "SELECT role, content, image_refs FROM chat_history WHERE chat_id = ? "
+    "ORDER BY message_timestamp DESC, id DESC LIMIT ?"
+)
+SELECT_PAGE_SQL = (
+    "SELECT id, message_timestamp, role, content, image_refs FROM chat_history "
+    "WHERE chat_id = ? AND (message_timestamp < ? OR (message_timestamp = ? AND id < ?)) "
+    "ORDER BY message_timestamp DESC, id DESC LIMIT ?"
+)
+SELECT_FIRST_PAGE_SQL = (
+    "SELECT id, message_timestamp, role, content, image_refs FROM chat_history "
+    "WHERE chat_id = ? ORDER BY message_timestamp DESC, id DESC LIMIT ?"
+)
+DELETE_CHAT_SQL = "DELETE FROM chat_history WHERE chat_id = ?"
+
+# Retensi: batas per chat dicari lewat index, lalu baris yang lebih tua dipindah ke arsip
+SELECT_CHAT_IDS_SQL = "SELECT DISTINCT chat_id FROM chat_history WHERE chat_id > ? ORDER BY chat_id LIMIT ?"
+MIN_CHAT_ID = -(2 ** 63)
+SELECT_KEEP_BOUNDARY_SQL = (
+    "SELECT message_timestamp, id FROM chat_history WHERE chat_id = ? "
+    "ORDER BY message_timestamp DESC, id DESC LIMIT 1 OFFSET ?"
+)
+PRUNE_WHERE_SQL = "chat_id = ? AND (message_timestamp < ? OR (message_timestamp = ? AND id <= ?))"
+ARCHIVE_ROWS_SQL = (
+    "INSERT OR IGNORE INTO chat_history_archive (id, chat_id, message_timestamp, role, content, image_refs, archived_at) "
+    f"SELECT id, chat_id, message_timestamp, role, content, image_refs, ? FROM chat_history WHERE {PRUNE_WHERE_SQL}"
+)
+DELETE_ROWS_SQL = f"DELETE FROM chat_history WHERE {PRUNE_WHERE_SQL}"
+
+
+class SQLiteHistoryStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._connection: sqlite3.Connection | None = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-history")
+        self._run(self._open)
+
+    def _run(self, func, *args):
+        """Menjalankan func di thread I/O SQLite dan menunggu hasilnya (blocking, hanya untuk buka/tutup)."""
+        return self._executor.submit(func, *args).result()
+
+    def _submit(self, func, *args) -> asyncio.Future:
+        """Menjalankan func di thread I/O SQLite dan mengembalikan future yang bisa di-await."""
+        return asyncio.wrap_future(self._executor.submit(func, *args))
+
+    def _open(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.path, isolation_level=None, cached_statements=128)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(f"PRAGMA busy_timeout={int(config.SQLITE_BUSY_TIMEOUT_MS)}")
+        self._migrate(connection)
+        self._connection = connection
+        logger.info(f"Database riwayat SQLite dibuka di {self.path} (mode WAL).")
+
+    def _migrate(self, connection: sqlite3.Connection) -> None:
+        current_version = connection.execute("PRAGMA user_version").fetchone()[0]
+        for version, statements in enumerate(MIGRATIONS, start=1):
+            if version <= current_version:
+                continue
+            connection.execute("BEGIN")
+            for statement in statements:
+                connection.execute(statement)
+            connection.execute(f"PRAGMA user_version={version}")
+            connection.execute("COMMIT")
+            logger.info(f"Migrasi skema SQLite versi {version} diterapkan.")
+
+    def _add_message(self, chat_id: int, role: str, content: str, image_refs_json: str | None, timestamp: str) -> None:
+        self._connection.execute(INSERT_MESSAGE_SQL, (chat_id, timestamp, role, content, image_refs_json))
+
+    def _get_recent(self, chat_id: int, limit: int) -> list:
+        return self._connection.execute(SELECT_RECENT_SQL, (chat_id, limit)).fetchall()
+
+    def _get_page(self, chat_id: int, limit: int, before: tuple | None) -> list:
+        if before is None:
+            return self._connection.execute(SELECT_FIRST_PAGE_SQL, (chat_id, limit)).fetchall()
+        before_timestamp, before_id = before
+        return self._connection.execute(SELECT_PAGE_SQL, (chat_id, before_timestamp, before_timestamp, before_id, limit)).fetchall()
+
+    def _delete_chat(self, chat_id: int) -> int:
+        return self._connection.execute(DELETE_CHAT_SQL, (chat_id,)).rowcount
+
+    def _next_chat_ids(self, after_chat_id: int, limit: int) -> list:
+        return [row[0] for row in self._connection.execute(SELECT_CHAT_IDS_SQL, (after_chat_id, limit)).fetchall()]
+
+    def _prune_chats(self, chat_ids: list, keep_last: int, cutoff_timestamp: str | None, archive: bool, archived_at: str) -> int:
+        removed = 0
+        for chat_id in chat_ids:
+            boundaries = []
+            boundary = self._connection.execute(SELECT_KEEP_BOUNDARY_SQL, (chat_id, keep_last)).fetchone()
+            if boundary:
+                boundaries.append(boundary)
+            if cutoff_timestamp:
+                # id -1 berarti hanya baris dengan timestamp < cutoff yang terkena
+                boundaries.append((cutoff_timestamp, -1))
+            for boundary_timestamp, boundary_id in boundaries:
+                params = (chat_id, boundary_timestamp, boundary_timestamp, boundary_id)
+                self._connection.execute("BEGIN")
+                try:
+                    if archive:
+                        self._connection.execute(ARCHIVE_ROWS_SQL, (archived_at,) + params)
+                    removed += self._connection.execute(DELETE_ROWS_SQL, params).rowcount
+                    self._connection.execute("COMMIT")
+                except Exception:
+                    self._connection.execute("ROLLBACK")
+                    raise
+        return removed
+
+    def _close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    async def add_message(self, chat_id: int, role: str, content: str, image_refs: list[dict] | None, timestamp: str) -> None:
+        image_refs_json = json.dumps(image_refs, separators=(",", ":")) if image_refs else None
+        await self._submit(self._add_message, chat_id, role, content, image_refs_json, timestamp)
+
+    async def get_recent(self, chat_id: int, limit: int) -> list[dict]:
+        """Mengambil pesan terbaru (urutan terbaru dulu) dengan bentuk yang sama seperti baris Supabase."""
+        rows = await self._submit(self._get_recent, chat_id, limit)
+        return [
+            {"role": role, "content": content, "image_refs": json.loads(image_refs) if image_refs else None}
+            for role, content, image_refs in rows
+        ]
+
+    async def get_page(self, chat_id: int, limit: int, before: tuple | None = None) -> list[dict]:
+        """Mengambil satu halaman riwayat (terbaru dulu) sebelum kursor (message_timestamp, id)."""
+        rows = await self._submit(self._get_page, chat_id, limit, before)
+        return [
+            {
+                "id": row_id, "message_timestamp": message_timestamp, "role": role, "content": content,
+                "image_refs": json.loads(image_refs) if image_refs else None,
+            }
+            for row_id, message_timestamp, role, content, image_refs in rows
+        ]
+
+    async def delete_chat(self, chat_id: int) -> int:
+        return await self._submit(self._delete_chat, chat_id)
+
+    async def prune(self, keep_last: int, cutoff_timestamp: str | None, archive: bool, archived_at: str) -> int:
+        """
+        Memindahkan/menghapus pesan di luar jendela aktif setiap chat. Mengembalikan jumlah baris yang dipangkas.
+        Chat diproses per batch HISTORY_RETENTION_BATCH_CHATS; di sela batch, query riwayat lain
+        yang sudah mengantre di thread I/O dijalankan lebih dulu.
+        """
+        removed = 0
+        after_chat_id = MIN_CHAT_ID
+        batch_size = max(1, config.HISTORY_RETENTION_BATCH_CHATS)
+        while True:
+            chat_ids = await self._submit(self._next_chat_ids, after_chat_id, batch_size)
+            if not chat_ids:
+                break
+            removed += await self._submit(self._prune_chats, chat_ids, keep_last, cutoff_timestamp, archive, archived_at)
+            if len(chat_ids) < batch_size:
+                break
+            after_chat_id = chat_ids[-1]
+        return removed
+
+    def close(self) -> None:
+        self._run(self._close)
+        self._executor.shutdown(wait=True)
+
+
+_store: SQLiteHistoryStore | None = None
+
+
+def get_store() -> SQLiteHistoryStore:
+    """Mengembalikan store SQLite bersama (dibuat saat pertama kali dipakai)."""
+    global _store
+    if _store is None:
+        _store = SQLiteHistoryStore(config.SQLITE_HISTORY_PATH)
+    return _store
+
+
+def close_store() -> None:
+    global _store
+    if _store is not None:
+        _store.close()
+        _store = None
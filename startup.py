@@ -0,0 +1,81 @@
+"""
+Warm-up bot di latar belakang.
+
+Klien Supabase, model Gemini, dan store SQLite diinisialisasi bersamaan setelah polling dimulai,
+sehingga bot cepat terhubung ke Telegram. Selama warm-up, update ditahan oleh wait_until_ready()
+(lewat ReadinessGate di handler group -1) dan baru diproses setelah ready_event di-set.
+"""
+import asyncio
+import logging
+import time
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, CallbackContext, TypeHandler
+import config
+import gemini_client
+import supabase_manager
+
+logger = logging.getLogger(__name__)
+
+PROCESS_STARTED_AT = time.monotonic()
+
+ready_event = asyncio.Event()
+warm_up_succeeded = False
+startup_timings = {}  # Nama langkah -> durasi (detik), untuk log dan benchmark
+
+
+async def _timed_step(name: str, func) -> object:
+    started_at = time.monotonic()
+    try:
+        return await asyncio.to_thread(func)
+    finally:
+        startup_timings[name] = time.monotonic() - started_at
+
+
+def _open_history_store() -> None:
+    if supabase_manager.using_sqlite_backend():
+        supabase_manager.sqlite_history.get_store()
+
+
+async def warm_up() -> bool:
+    """Menginisialisasi semua klien secara bersamaan lalu menandai bot siap. Mengembalikan True jika model dasar siap."""
+    global warm_up_succeeded
+    started_at = time.monotonic()
+    results = await asyncio.gather(
+        _timed_step("supabase", supabase_manager.init_supabase_client),
+        _timed_step("gemini", gemini_client.configure_models),
+        _timed_step("sqlite", _open_history_store),
+        return_exceptions=True,
+    )
+    for step_name, result in zip(("supabase", "gemini", "sqlite"), results):
+        if isinstance(result, Exception):
+            logger.error(f"Warm-up '{step_name}' gagal: {result}")
+
+    if results[1] is not True:
+        logger.warning("WARNING: Gagal mengkonfigurasi satu atau lebih model Gemini! Fitur AI mungkin terbatas.")
+    warm_up_succeeded = gemini_client.gemini_model_base is not None
+
+    startup_timings["warm_up"] = time.monotonic() - started_at
+    startup_timings["ready"] = time.monotonic() - PROCESS_STARTED_AT
+    ready_event.set()
+    logger.info(f"Warm-up selesai dalam {startup_timings['warm_up']:.2f} detik, bot siap {startup_timings['ready']:.2f} detik sejak proses dimulai.")
+    return warm_up_succeeded
+
+
+async def wait_until_ready(update: Update, context: CallbackContext):
+    """Handler group -1: menahan update sampai warm-up selesai, agar tidak gagal karena klien belum siap."""
+    if ready_event.is_set():
+        return
+    try:
+        await asyncio.wait_for(ready_event.wait(), timeout=config.STARTUP_READY_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning(f"Update {update.update_id} dilewati karena warm-up belum selesai setelah {config.STARTUP_READY_TIMEOUT} detik.")
+        if update.effective_message:
+            await update.effective_message.reply_text("Bot sedang bersiap, silakan coba lagi sebentar lagi.")
+        raise ApplicationHandlerStop
+
+
+class ReadinessGate(TypeHandler):
+    """TypeHandler yang hanya aktif selama warm-up; setelah siap, update langsung lolos tanpa coroutine tambahan."""
+
+    def check_update(self, update: object) -> bool:
+        return not ready_event.is_set() and super().check_update(update)
@@ -1,19 +1,30 @@
+import asyncio
 import logging
-from supabase import create_client, Client
-from datetime import datetime, timezone
+import queue
+import threading
+from datetime import datetime, timedelta, timezone
 import config
+import http_pool
+import image_cache
+import records
+import sqlite_history
 
 logger = logging.getLogger(__name__)
 
-supabase_client: Client | None = None
+supabase_client = None  # supabase.Client, dibuat oleh init_supabase_client() saat warm-up
 CHAT_HISTORY_TABLE = "chat_history" # Nama tabel di Supabase
 
 def init_supabase_client():
-    """Menginisialisasi klien Supabase."""
+    """Menginisialisasi klien Supabase. Paket supabase baru diimpor di sini agar startup lebih cepat."""
     global supabase_client
     if config.SUPABASE_URL and config.SUPABASE_KEY:
         try:
-            supabase_client = create_client(config.SUPABASE_URL, config.SUPABASE_KEY)
+            from supabase import create_client, ClientOptions
+            supabase_client = create_client(
+                config.SUPABASE_URL,
+                config.SUPABASE_KEY,
+                options=ClientOptions(httpx_client=http_pool.get_sync_client("supabase"))
+            )
             logger.info("Klien Supabase berhasil diinisialisasi.")
         except Exception as e:
             logger.error(f"Gagal menginisialisasi klien Supabase: {e}")
@@ -22,81 +33,340 @@ def init_supabase_client():
         logger.warning("URL atau Kunci Supabase tidak ada di konfigurasi. Fitur Supabase akan dinonaktifkan.")
         supabase_client = None
 
-def add_message_to_history(chat_id: int, role: str, content: str) -> bool:
-    """Menambahkan pesan ke tabel riwayat chat di Supabase."""
+def using_sqlite_backend() -> bool:
+    """True jika riwayat disimpan di SQLite lokal (config.HISTORY_BACKEND = "sqlite")."""
+    return config.HISTORY_BACKEND == "sqlite"
+
+def is_history_enabled() -> bool:
+    """True jika ada backend riwayat yang aktif (SQLite lokal atau Supabase)."""
+    return using_sqlite_backend() or supabase_client is not None
+
+
+# Replikasi asinkron SQLite -> Supabase
+# Penulisan ke SQLite langsung selesai; salinannya dikirim ke Supabase oleh thread latar belakang.
+
+_replication_queue: queue.Queue | None = None
+_replication_thread: threading.Thread | None = None
+
+def _replication_enabled() -> bool:
+    return using_sqlite_backend() and config.SQLITE_REPLICATE_TO_SUPABASE and supabase_client is not None
+
+def _replication_worker():
+    while True:
+        operation, payload = _replication_queue.get()
+        try:
+            if operation == "insert":
+                _supabase_insert_row(payload)
+            elif operation == "delete":
+                _supabase_delete_chat(payload)
+            elif operation == "prune":
+                _supabase_prune(*payload)
+        except Exception as e:
+            logger.error(f"Replikasi '{operation}' ke Supabase gagal: {e}")
+        finally:
+            _replication_queue.task_done()
+
+def _enqueue_replication(operation: str, payload) -> None:
+    global _replication_queue, _replication_thread
+    if not _replication_enabled():
+        return
+    if _replication_thread is None:
+        _replication_queue = queue.Queue(maxsize=config.SQLITE_REPLICATION_QUEUE_SIZE)
+        _replication_thread = threading.Thread(target=_replication_worker, name="supabase-replication", daemon=True)
+        _replication_thread.start()
+    try:
+        _replication_queue.put_nowait((operation, payload))
+    except queue.Full:
+        logger.warning(f"Antrian replikasi Supabase penuh, operasi '{operation}' tidak direplikasi.")
+
+def flush_replication(timeout: float | None = None) -> bool:
+    """Menunggu antrian replikasi ke Supabase kosong. Mengembalikan False jika timeout."""
+    if _replication_queue is None:
+        return True
+    done = threading.Event()
+
+    def wait_queue():
+        _replication_queue.join()
+        done.set()
+
+    threading.Thread(target=wait_queue, daemon=True).start()
+    return done.wait(timeout)
+
+
+# Kolom image_refs ditambahkan oleh migrations/001_create_chat_history.sql. Jika migrasi itu belum
+# dijalankan, PostgREST menolak query yang menyebut kolomnya; riwayat tetap dibaca/ditulis tanpa gambar.
+_image_refs_supported = True
+_MISSING_COLUMN_CODES = ("42703", "PGRST204")  # Kolom tidak ada (Postgres), kolom tidak ada di schema cache (PostgREST)
+
+def _is_missing_image_refs_column(error: Exception) -> bool:
+    message = getattr(error, "message", None) or str(error)
+    return getattr(error, "code", None) in _MISSING_COLUMN_CODES and "image_refs" in message
+
+def _disable_image_refs(error: Exception) -> None:
+    global _image_refs_supported
+    if _image_refs_supported:
+        logger.warning(
+            "Kolom image_refs tidak ada di tabel chat_history Supabase, riwayat disimpan tanpa referensi gambar. "
+            f"Jalankan migrations/001_create_chat_history.sql lalu restart bot. ({error})"
+        )
+    _image_refs_supported = False
+
+def _select_with_image_refs(run_query, columns: str) -> list:
+    """Menjalankan run_query(kolom) dengan kolom image_refs; jika kolomnya belum ada, diulang tanpa kolom itu."""
+    if _image_refs_supported:
+        try:
+            return run_query(f"{columns}, image_refs")
+        except Exception as e:
+            if not _is_missing_image_refs_column(e):
+                raise
+            _disable_image_refs(e)
+    return run_query(columns)
+
+
+def _supabase_insert_row(row: dict) -> bool:
+    if "image_refs" in row and not _image_refs_supported:
+        row = {key: value for key, value in row.items() if key != "image_refs"}
+    try:
+        response = supabase_client.table(CHAT_HISTORY_TABLE).insert(row).execute()
+    except Exception as e:
+        if "image_refs" not in row or not _is_missing_image_refs_column(e):
+            raise
+        _disable_image_refs(e)
+        return _supabase_insert_row(row)
+    chat_id = row["chat_id"]
+
+    if hasattr(response, 'data') and response.data:
+         logger.debug(f"Pesan untuk chat_id {chat_id} berhasil ditambahkan ke riwayat Supabase.")
+         return True
+    elif hasattr(response, 'error') and response.error:
+         logger.error(f"Error Supabase saat menambahkan pesan untuk chat_id {chat_id}: {response.error.message}")
+         return False
+    else:
+         logger.warning(f"Respons tidak dikenali dari Supabase saat menambahkan pesan untuk chat_id {chat_id}. Mungkin berhasil.")
+
+         return True # Atau False jika ingin lebih ketat
+
+def _supabase_delete_chat(chat_id: int) -> bool:
+    response = supabase_client.table(CHAT_HISTORY_TABLE).delete().eq("chat_id", chat_id).execute()
+
+    if hasattr(response, 'data') and response.data is not None: # response.data bisa berupa list (kosong atau berisi)
+         logger.info(f"Riwayat chat untuk chat_id {chat_id} berhasil dihapus dari Supabase.")
+         return True
+    elif hasattr(response, 'error') and response.error:
+         logger.error(f"Error Supabase saat menghapus riwayat untuk chat_id {chat_id}: {response.error.message}")
+         return False
+    else:
+         logger.warning(f"Respons tidak dikenali dari Supabase saat menghapus riwayat untuk chat_id {chat_id}. Mungkin berhasil.")
+         return True # Atau False jika ingin lebih ketat
+
+def _supabase_prune_batch(keep_last: int, max_age_days: int | None, after_chat_id: int | None) -> tuple[int, int | None, bool]:
+    # Fungsi prune_chat_history dibuat oleh migrations/003_chat_history_retention.sql
+    response = supabase_client.rpc("prune_chat_history", {
+        "keep_last": keep_last,
+        "max_age": f"{max_age_days} days" if max_age_days else None,
+        "do_archive": config.HISTORY_ARCHIVE_ENABLED,
+        "p_limit": config.HISTORY_RETENTION_BATCH_ROWS,
+        "after_chat_id": after_chat_id,
+        "p_max_chats": config.HISTORY_RETENTION_BATCH_CHATS,
+    }).execute()
+    result = response.data[0] if response.data else {}
+    return result.get("removed") or 0, result.get("last_chat_id"), result.get("finished", True)
+
+def _supabase_prune_batches(keep_last: int, max_age_days: int | None):
+    """
+    Generator retensi Supabase: setiap iterasi menjalankan satu RPC prune_chat_history (maksimal
+    HISTORY_RETENTION_BATCH_ROWS pesan dan HISTORY_RETENTION_BATCH_CHATS chat) dan menghasilkan jumlah
+    pesan yang dipangkas. Kursor chat_id diteruskan antar panggilan, jadi setiap chat hanya dipindai sekali.
+    """
+    after_chat_id = None
+    while True:
+        removed, after_chat_id, finished = _supabase_prune_batch(keep_last, max_age_days, after_chat_id)
+        yield removed
+        if finished:
+            return
+
+def _supabase_prune(keep_last: int, max_age_days: int | None) -> int:
+    removed = sum(_supabase_prune_batches(keep_last, max_age_days))
+    logger.info(f"Retensi riwayat Supabase selesai: {removed} pesan dipangkas.")
+    return removed
+
+
+async def add_message_to_history(chat_id: int, role: str, content: str, image_refs: list[dict] | None = None) -> bool:
+    """
+    Menambahkan pesan ke tabel riwayat chat (Supabase atau SQLite lokal, sesuai config.HISTORY_BACKEND).
+    image_refs berisi referensi ringkas gambar (file_unique_id, hash, file_uri opsional), bukan bytes gambarnya.
+    """
+    timestamp = datetime.now(timezone.utc).isoformat()
+    row = {
+        "chat_id": chat_id,
+        "role": role,
+        "content": content,
+        "message_timestamp": timestamp
+    }
+    if image_refs:
+        row["image_refs"] = image_refs
+
+    if using_sqlite_backend():
+        try:
+            await sqlite_history.get_store().add_message(chat_id, role, content, image_refs, timestamp)
+            logger.debug(f"Pesan untuk chat_id {chat_id} berhasil ditambahkan ke riwayat SQLite.")
+        except Exception as e:
+            logger.error(f"Pengecualian saat menambahkan pesan ke SQLite untuk chat_id {chat_id}: {e}")
+            return False
+        _enqueue_replication("insert", row)
+        return True
+
     if not supabase_client:
         logger.warning("Supabase client tidak tersedia. Pesan tidak bisa ditambahkan ke riwayat.")
         return False
     try:
-        timestamp = datetime.now(timezone.utc).isoformat()
-
-        response = supabase_client.table(CHAT_HISTORY_TABLE).insert({
-            "chat_id": chat_id,
-            "role": role,
-            "content": content,
-            "message_timestamp": timestamp
-        }).execute()
-
-        if hasattr(response, 'data') and response.data:
-             logger.debug(f"Pesan untuk chat_id {chat_id} berhasil ditambahkan ke riwayat Supabase.")
-             return True
-        elif hasattr(response, 'error') and response.error:
-             logger.error(f"Error Supabase saat menambahkan pesan untuk chat_id {chat_id}: {response.error.message}")
-             return False
-        else:
-             logger.warning(f"Respons tidak dikenali dari Supabase saat menambahkan pesan untuk chat_id {chat_id}. Mungkin berhasil.")
-
-             return True # Atau False jika ingin lebih ketat
-
+        return await asyncio.to_thread(_supabase_insert_row, row)
     except Exception as e:
         logger.error(f"Pengecualian saat menambahkan pesan ke Supabase untuk chat_id {chat_id}: {e}")
         return False
 
-def get_chat_history(chat_id: int) -> list:
-    """Mengambil riwayat percakapan dari Supabase untuk chat_id tertentu."""
-    if not supabase_client:
-        logger.warning("Supabase client tidak tersedia. Tidak bisa mengambil riwayat chat.")
-        return []
-    try:
+def _format_history_rows(rows: list) -> list:
+    """
+    Mengubah baris riwayat (urutan terbaru dulu) menjadi daftar records.HistoryTurn (urutan lama dulu).
+    Hanya referensi gambar yang disimpan, dibatasi CHAT_HISTORY_MAX_IMAGES dan diprioritaskan untuk
+    pesan terbaru; bytes-nya baru dibaca dari cache lokal saat dikirim (gemini_client.send_message).
+    """
+    images_remaining = config.CHAT_HISTORY_MAX_IMAGES
+    formatted_history = []
+    for item in rows:
+        images = ()
+        if item.get("image_refs") and images_remaining > 0:
+            images = tuple(item["image_refs"][:images_remaining])
+            images_remaining -= len(images)
+        formatted_history.append(records.HistoryTurn(records.intern_role(item["role"]), item["content"], images))
+    formatted_history.reverse()
+    return formatted_history
+
+def _supabase_select_recent(chat_id: int) -> list:
+    def run_query(columns: str) -> list:
         response = supabase_client.table(CHAT_HISTORY_TABLE)\
-            .select("role, content")\
+            .select(columns)\
             .eq("chat_id", chat_id)\
             .order("message_timestamp", desc=True)\
+            .order("id", desc=True)\
             .limit(config.CHAT_HISTORY_MESSAGES_LIMIT)\
             .execute()
+        return response.data or []
+    return _select_with_image_refs(run_query, "role, content")
 
-        formatted_history = []
-        if response.data:
-            for item in reversed(response.data):
+async def get_chat_history(chat_id: int) -> list:
+    """Mengambil riwayat percakapan (list records.HistoryTurn) untuk chat_id tertentu dari backend riwayat yang aktif."""
+    if using_sqlite_backend():
+        try:
+            rows = await sqlite_history.get_store().get_recent(chat_id, config.CHAT_HISTORY_MESSAGES_LIMIT)
+            formatted_history = _format_history_rows(rows)
+            logger.debug(f"Mengambil {len(formatted_history)} pesan dari riwayat SQLite untuk chat_id {chat_id}.")
+            return formatted_history
+        except Exception as e:
+            logger.error(f"Error mengambil riwayat chat dari SQLite untuk chat_id {chat_id}: {e}")
+            return []
 
-                formatted_history.append({"role": item["role"], "parts": [{"text": item["content"]}]})
+    if not supabase_client:
+        logger.warning("Supabase client tidak tersedia. Tidak bisa mengambil riwayat chat.")
+        return []
+    try:
+        rows = await asyncio.to_thread(_supabase_select_recent, chat_id)
+        formatted_history = []
+        if rows:
+            formatted_history = _format_history_rows(rows)
             logger.debug(f"Mengambil {len(formatted_history)} pesan dari riwayat Supabase untuk chat_id {chat_id}.")
         return formatted_history
     except Exception as e:
         logger.error(f"Error mengambil riwayat chat dari Supabase untuk chat_id {chat_id}: {e}")
         return []
 
-def delete_chat_history_db(chat_id: int) -> bool:
-    """Menghapus semua riwayat percakapan untuk chat_id tertentu dari Supabase."""
+def _supabase_select_page(chat_id: int, limit: int, before: tuple | None) -> list:
+    def run_query(columns: str) -> list:
+        query = supabase_client.table(CHAT_HISTORY_TABLE)\
+            .select(columns)\
+            .eq("chat_id", chat_id)
+        if before is not None:
+            before_timestamp, before_id = before
+            query = query.or_(
+                f'message_timestamp.lt."{before_timestamp}",'
+                f'and(message_timestamp.eq."{before_timestamp}",id.lt.{int(before_id)})'
+            )
+        response = query.order("message_timestamp", desc=True)\
+            .order("id", desc=True)\
+            .limit(limit)\
+            .execute()
+        return response.data or []
+    return _select_with_image_refs(run_query, "id, message_timestamp, role, content")
+
+async def get_chat_history_page(chat_id: int, limit: int = 50, before: tuple | None = None) -> tuple[list, tuple | None]:
+    """
+    Paginasi keyset riwayat chat (terbaru dulu), memakai index (chat_id, message_timestamp, id).
+    before adalah kursor (message_timestamp, id) dari halaman sebelumnya, atau None untuk halaman pertama.
+    Mengembalikan (baris, kursor_halaman_berikutnya); kursor None berarti tidak ada halaman lagi.
+    """
+    rows = []
+    try:
+        if using_sqlite_backend():
+            rows = await sqlite_history.get_store().get_page(chat_id, limit, before)
+        elif supabase_client:
+            rows = await asyncio.to_thread(_supabase_select_page, chat_id, limit, before)
+        else:
+            logger.warning("Backend riwayat tidak tersedia. Tidak bisa mengambil halaman riwayat chat.")
+    except Exception as e:
+        logger.error(f"Error mengambil halaman riwayat chat untuk chat_id {chat_id}: {e}")
+        return [], None
+
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = (rows[-1]["message_timestamp"], rows[-1]["id"])
+    return rows, next_cursor
+
+async def prune_chat_history() -> int:
+    """
+    Retensi dan compaction: memindahkan ke arsip (atau menghapus) pesan di luar jendela aktif setiap chat,
+    yaitu selain HISTORY_RETENTION_KEEP_LAST pesan terbaru dan yang lebih tua dari HISTORY_RETENTION_MAX_AGE_DAYS.
+    Mengembalikan jumlah pesan yang dipangkas.
+    """
+    keep_last = max(config.HISTORY_RETENTION_KEEP_LAST, config.CHAT_HISTORY_MESSAGES_LIMIT)
+    max_age_days = config.HISTORY_RETENTION_MAX_AGE_DAYS
+
+    if using_sqlite_backend():
+        now = datetime.now(timezone.utc)
+        cutoff_timestamp = (now - timedelta(days=max_age_days)).isoformat() if max_age_days else None
+        removed = await sqlite_history.get_store().prune(keep_last, cutoff_timestamp, config.HISTORY_ARCHIVE_ENABLED, now.isoformat())
+        logger.info(f"Retensi riwayat SQLite selesai: {removed} pesan dipangkas.")
+        _enqueue_replication("prune", (keep_last, max_age_days))
+        return removed
+
+    if not supabase_client:
+        logger.debug("Supabase client tidak tersedia. Retensi riwayat dilewati.")
+        return 0
+    # Satu RPC per thread, agar thread pool default tidak tertahan selama seluruh retensi
+    batches = _supabase_prune_batches(keep_last, max_age_days)
+    removed = 0
+    while (batch_removed := await asyncio.to_thread(next, batches, None)) is not None:
+        removed += batch_removed
+    logger.info(f"Retensi riwayat Supabase selesai: {removed} pesan dipangkas.")
+    return removed
+
+async def delete_chat_history_db(chat_id: int) -> bool:
+    """Menghapus semua riwayat percakapan untuk chat_id tertentu dari backend riwayat yang aktif."""
+    if using_sqlite_backend():
+        try:
+            deleted = await sqlite_history.get_store().delete_chat(chat_id)
+            logger.info(f"Riwayat chat untuk chat_id {chat_id} berhasil dihapus dari SQLite ({deleted} pesan).")
+        except Exception as e:
+            logger.error(f"Pengecualian saat menghapus riwayat chat dari SQLite untuk chat_id {chat_id}: {e}")
+            return False
+        _enqueue_replication("delete", chat_id)
+        return True
+
     if not supabase_client:
         logger.warning("Supabase client tidak tersedia. Tidak bisa menghapus riwayat chat.")
         return False
     try:
-        response = supabase_client.table(CHAT_HISTORY_TABLE).delete().eq("chat_id", chat_id).execute()
-
-        if hasattr(response, 'data') and response.data is not None: # response.data bisa berupa list (kosong atau berisi)
-             logger.info(f"Riwayat chat untuk chat_id {chat_id} berhasil dihapus dari Supabase.")
-             return True
-        elif hasattr(response, 'error') and response.error:
-             logger.error(f"Error Supabase saat menghapus riwayat untuk chat_id {chat_id}: {response.error.message}")
-             return False
-        else:
-             logger.warning(f"Respons tidak dikenali dari Supabase saat menghapus riwayat untuk chat_id {chat_id}. Mungkin berhasil.")
-             return True # Atau False jika ingin lebih ketat
-
+        return await asyncio.to_thread(_supabase_delete_chat, chat_id)
     except Exception as e:
         logger.error(f"Pengecualian saat menghapus riwayat chat dari Supabase untuk chat_id {chat_id}: {e}")
         return False
 
-
-init_supabase_client()
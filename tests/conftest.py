@@ -0,0 +1,31 @@
+import os
+import sys
+
+# Modul bot ada di root repo (tanpa paket), sama seperti benchmarks/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from types import SimpleNamespace
+import pytest
+import config
+
+
+@pytest.fixture
+def fake_backends(monkeypatch):
+    """Gemini dan Supabase palsu dari fakes.py; state modul dikembalikan setelah tes."""
+    import fakes
+    import gemini_client
+    import pipeline
+    import supabase_manager
+
+    for name in ("gemini_model_base", "gemini_model_thinking"):
+        monkeypatch.setattr(gemini_client, name, getattr(gemini_client, name))
+    monkeypatch.setattr(gemini_client, "_models_by_name", {})
+    monkeypatch.setattr(gemini_client, "route_stats", {})
+    monkeypatch.setattr(pipeline, "_response_cache", pipeline.OrderedDict())
+    monkeypatch.setattr(config, "HISTORY_BACKEND", "supabase")
+    monkeypatch.setattr(config, "USAGE_LOG_ENABLED", False)
+    monkeypatch.setattr(config, "THROTTLE_ENABLED", False)
+    monkeypatch.setattr(config, "UPLOAD_HISTORY_IMAGES_TO_GEMINI", False)
+    supabase_client = fakes.FakeSupabaseClient()
+    monkeypatch.setattr(supabase_manager, "supabase_client", supabase_client)
+    return SimpleNamespace(models=fakes.install_fake_gemini(), supabase=supabase_client)
@@ -0,0 +1,58 @@
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import pytest
+from telegram import Bot, Chat, Message, PhotoSize, Update, User
+import bot_handlers
+import config
+import fakes
+import gemini_client
+import image_cache
+import records
+
+
+@pytest.fixture(autouse=True)
+def handler_config(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "IMAGE_UNDERSTANDING_ENABLED", True)
+    monkeypatch.setattr(config, "IMAGE_CACHE_ENABLED", True)
+    monkeypatch.setattr(config, "IMAGE_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(config, "THROTTLE_ENABLED", False)
+    monkeypatch.setattr(config, "THINKING_PROGRESS_UPDATE_INTERVAL", 0)
+    monkeypatch.setattr(image_cache, "_unique_id_index", {})
+
+
+def test_td_reply_to_cached_album_uses_every_album_image_without_get_file(monkeypatch):
+    album = [records.AlbumImage(f"file-{i}", f"uniq-{i}", "keterangan album" if i == 0 else None, 100 + i) for i in range(3)]
+    for i, image in enumerate(album):
+        image_cache.store_image(f"gambar {i}".encode(), file_unique_id=image.file_unique_id)
+    calls = {}
+
+    async def fake_thinking_response(**kwargs):
+        calls.update(kwargs)
+        return "Jawaban tentang album."
+
+    monkeypatch.setattr(gemini_client, "generate_thinking_response", fake_thinking_response)
+
+    async def scenario():
+        telegram_request = fakes.FakeTelegramRequest()
+        bot = Bot("123:TEST", request=telegram_request, get_updates_request=fakes.FakeTelegramRequest())
+        await bot.initialize()
+        chat = Chat(10, Chat.PRIVATE)
+        user = User(5, "User", is_bot=False)
+        now = datetime.now(timezone.utc)
+        # Membalas foto kedua album; foto pertama dan ketiga hanya ada di recent_albums
+        replied = Message(101, now, chat, from_user=user, photo=(PhotoSize("file-1", "uniq-1", 90, 90),), media_group_id="555")
+        command = Message(200, now, chat, from_user=user, text="/td", reply_to_message=replied)
+        for message in (replied, command):
+            message.set_bot(bot)
+        context = SimpleNamespace(bot=bot, args=[], bot_data={"recent_albums": {"10_555": tuple(album)}})
+        await bot_handlers.think_deeper_command(Update(1, message=command), context)
+        return telegram_request.calls
+
+    telegram_calls = asyncio.run(scenario())
+
+    assert "getFile" not in telegram_calls and "downloadFile" not in telegram_calls
+    assert calls["text_prompt_for_history"] == "keterangan album"
+    assert [part["inline_data"]["data"] for part in calls["prompt_parts"][1:]] == [b"gambar 0", b"gambar 1", b"gambar 2"]
+    assert [ref["file_unique_id"] for ref in calls["image_refs"]] == ["uniq-0", "uniq-1", "uniq-2"]
+    assert telegram_calls[-1] == "editMessageText"
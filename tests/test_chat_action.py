@@ -0,0 +1,76 @@
+import asyncio
+import pytest
+from telegram import Bot
+import chat_action
+import config
+import fakes
+
+
+@pytest.fixture(autouse=True)
+def short_intervals(monkeypatch):
+    monkeypatch.setattr(config, "CHAT_ACTION_REFRESH_INTERVAL", 0.01)
+    monkeypatch.setattr(config, "THINKING_PROGRESS_UPDATE_INTERVAL", 0.01)
+    monkeypatch.setattr(chat_action, "_keepalives", {})
+
+
+async def make_bot() -> tuple[Bot, fakes.FakeTelegramRequest]:
+    telegram_request = fakes.FakeTelegramRequest()
+    bot = Bot("123:TEST", request=telegram_request, get_updates_request=fakes.FakeTelegramRequest())
+    await bot.initialize()
+    return bot, telegram_request
+
+
+def test_concurrent_requests_in_one_chat_share_one_refresh_task():
+    async def scenario():
+        bot, telegram_request = await make_bot()
+        tasks = []
+
+        async def request():
+            async with chat_action.keep_typing(bot, 10):
+                tasks.append(chat_action._keepalives[(10, "typing")][1])
+                await asyncio.sleep(0.05)
+
+        await asyncio.gather(request(), request(), request())
+        return tasks, telegram_request.calls.count("sendChatAction")
+
+    tasks, chat_actions = asyncio.run(scenario())
+
+    assert len(tasks) == 3 and len(set(map(id, tasks))) == 1
+    # Satu task refresh: sekitar 0.05 / 0.01 panggilan, bukan tiga kali lipatnya
+    assert 1 <= chat_actions <= 8
+    assert chat_action._keepalives == {}
+
+
+def test_refresh_task_is_cancelled_and_awaited_on_exit():
+    async def scenario():
+        bot, telegram_request = await make_bot()
+        async with chat_action.keep_typing(bot, 10):
+            task = chat_action._keepalives[(10, "typing")][1]
+            await asyncio.sleep(0.02)
+        state_on_exit = task.done(), task.cancelled()
+        calls_on_exit = len(telegram_request.calls)
+        await asyncio.sleep(0.03)
+        return state_on_exit, calls_on_exit, len(telegram_request.calls)
+
+    (done, cancelled), calls_on_exit, calls_later = asyncio.run(scenario())
+
+    assert done and cancelled
+    assert calls_later == calls_on_exit
+
+
+def test_no_progress_edit_arrives_after_the_final_edit():
+    async def scenario():
+        bot, telegram_request = await make_bot()
+        progress_message = await bot.send_message(10, "Sedang berpikir...")
+        async with chat_action.keep_typing(bot, 10, progress_message=progress_message):
+            await asyncio.sleep(0.05)
+        progress_edits = telegram_request.calls.count("editMessageText")
+        await progress_message.edit_text("Jawaban akhir")
+        await asyncio.sleep(0.05)
+        return progress_edits, telegram_request.calls
+
+    progress_edits, calls = asyncio.run(scenario())
+
+    assert progress_edits >= 1
+    assert calls.count("editMessageText") == progress_edits + 1
+    assert calls[-1] == "editMessageText"
@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+import pytest
+import config
+import http_pool
+
+
+@pytest.fixture(autouse=True)
+def fresh_pools(monkeypatch):
+    monkeypatch.setattr(config, "HTTP2_ENABLED", False)
+    monkeypatch.setattr(http_pool, "_sync_clients", {})
+    monkeypatch.setattr(http_pool, "_telegram_requests", {})
+    monkeypatch.setattr(http_pool, "_request_counts", {})
+    yield
+    http_pool.close_sync_clients()
+
+
+def test_one_shared_client_per_name():
+    supabase_client = http_pool.get_sync_client("supabase")
+    assert http_pool.get_sync_client("supabase") is supabase_client
+    assert http_pool.get_sync_client("lain") is not supabase_client
+    assert [stats["name"] for stats in http_pool.get_pool_stats()] == ["supabase", "lain"]
+
+
+def test_pool_stats_count_requests_and_connections():
+    client = http_pool.get_sync_client("supabase")
+    http_pool._count_request("supabase")(None)
+
+    stats = http_pool.get_pool_stats()[0]
+
+    assert stats["requests"] == 1
+    assert stats["max_connections"] == config.HTTP_POOL_MAX_CONNECTIONS
+    assert (stats["connections"], stats["active"], stats["idle"], stats["utilization"]) == (0, 0, 0, 0.0)
+    assert client is http_pool.get_sync_client("supabase")
+
+
+def test_pool_stats_degrade_when_internals_are_unavailable(monkeypatch):
+    http_pool._sync_clients["lama"] = SimpleNamespace(close=lambda: None)  # Tanpa _transport._pool
+    http_pool._telegram_requests["belum_dibuka"] = (SimpleNamespace(), 8)  # Tanpa _client
+    telegram_request = http_pool.build_telegram_request("telegram", 4)
+
+    stats = {item["name"]: item for item in http_pool.get_pool_stats()}
+
+    assert stats["lama"]["connections"] is None
+    assert "belum_dibuka" not in stats
+    assert stats["telegram"]["max_connections"] == 4
+    assert http_pool._telegram_requests["telegram"][0] is telegram_request
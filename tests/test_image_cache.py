@@ -0,0 +1,62 @@
+import os
+import time
+import pytest
+import config
+import image_cache
+import records
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "IMAGE_CACHE_ENABLED", True)
+    monkeypatch.setattr(config, "IMAGE_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(image_cache, "_unique_id_index", {})
+    return tmp_path
+
+
+def _age(content_hash: str, seconds: float) -> None:
+    past = time.time() - seconds
+    os.utime(image_cache._image_path(content_hash), (past, past))
+
+
+def test_store_and_lookup_by_unique_id():
+    image_ref = image_cache.store_image(b"gambar", file_unique_id="u1")
+    assert image_ref["hash"] == image_cache.compute_hash(b"gambar")
+    assert image_cache.lookup_by_unique_id("u1") == (image_ref["hash"], b"gambar")
+
+
+def test_sweep_removes_old_images_and_their_index(cache_dir):
+    old_ref = image_cache.store_image(b"lama", file_unique_id="lama")
+    new_ref = image_cache.store_image(b"baru", file_unique_id="baru")
+    _age(old_ref["hash"], 40 * 86400)
+
+    assert image_cache.sweep(max_age_days=30, max_bytes=0) == 1
+    assert image_cache.load_image(old_ref["hash"]) is None
+    assert image_cache.lookup_by_unique_id("lama") is None
+    assert not (cache_dir / "lama.ref").exists()
+    assert image_cache.load_image(new_ref["hash"]) == b"baru"
+
+
+def test_sweep_evicts_least_recently_used_until_under_size():
+    refs = [image_cache.store_image(bytes([i]) * 100) for i in range(4)]
+    for age, image_ref in zip((400, 300, 200, 100), refs):
+        _age(image_ref["hash"], age)
+    # Dibaca ulang, jadi menjadi yang paling baru dipakai
+    image_cache.load_image(refs[0]["hash"])
+
+    assert image_cache.sweep(max_age_days=0, max_bytes=250) == 2
+    remaining = {image_ref["hash"] for image_ref in refs if image_cache.load_image(image_ref["hash"]) is not None}
+    assert remaining == {refs[0]["hash"], refs[3]["hash"]}
+
+
+def test_history_images_resolved_only_when_converted():
+    image_ref = image_cache.store_image(b"foto")
+    missing_ref = {"hash": "0" * 64, "mime_type": "image/jpeg"}
+    turns = [records.HistoryTurn(records.ROLE_USER, "lihat ini", (image_ref, missing_ref))]
+
+    sdk_history = records.to_sdk_history(turns, image_cache.image_ref_to_part)
+
+    assert sdk_history == [{
+        "role": "user",
+        "parts": [{"text": "lihat ini"}, {"inline_data": {"mime_type": "image/jpeg", "data": b"foto"}}],
+    }]
@@ -0,0 +1,21 @@
+import config
+import main
+
+
+def test_photo_handler_follows_config_on_reload(monkeypatch):
+    monkeypatch.setattr(main, "_photo_handler", None)
+    application = main.build_application(token="123:fake")
+
+    monkeypatch.setattr(config, "IMAGE_UNDERSTANDING_ENABLED", True)
+    main.register_photo_handler(application)
+    photo_handler = main._photo_handler
+    assert photo_handler in application.handlers[0]
+
+    monkeypatch.setattr(config, "IMAGE_UNDERSTANDING_ENABLED", False)
+    main.register_photo_handler(application)
+    assert main._photo_handler is None
+    assert photo_handler not in application.handlers.get(0, [])
+
+    monkeypatch.setattr(config, "IMAGE_UNDERSTANDING_ENABLED", True)
+    main.register_photo_handler(application)
+    assert sum(1 for handler in application.handlers[0] if handler is main._photo_handler) == 1
@@ -0,0 +1,191 @@
+import asyncio
+import pytest
+import config
+import gemini_client
+import pipeline
+import records
+import supabase_manager
+
+
+@pytest.fixture(autouse=True)
+def fresh_middleware_state(monkeypatch):
+    monkeypatch.setattr(pipeline, "_response_cache", pipeline.OrderedDict())
+    monkeypatch.setattr(pipeline, "_concurrency_semaphore", None)
+    monkeypatch.setattr(pipeline, "_concurrency_limit", None)
+    monkeypatch.setattr(pipeline, "_concurrency_users", 0)
+    monkeypatch.setattr(pipeline, "_in_flight_count", 0)
+    monkeypatch.setattr(pipeline, "_idle_event", None)
+
+
+def make_request(**kwargs) -> pipeline.GenerationRequest:
+    kwargs.setdefault("chat_id", 1)
+    kwargs.setdefault("prompt_parts", ["halo"])
+    return pipeline.GenerationRequest(**kwargs)
+
+
+def test_stages_run_in_order_inside_middleware():
+    events = []
+
+    def stage(name, finish=False):
+        async def run(request):
+            events.append(name)
+            if finish:
+                request.finish(name)
+        return run
+
+    def middleware(name):
+        async def run(request, call_next):
+            events.append(f"{name}:masuk")
+            reply_text = await call_next(request)
+            events.append(f"{name}:keluar")
+            return reply_text
+        return run
+
+    engine = pipeline.Pipeline([stage("a"), stage("b", finish=True), stage("c")], [middleware("luar")])
+    engine.use(middleware("dalam"))
+
+    assert asyncio.run(engine.run(make_request())) == "b"
+    assert events == ["luar:masuk", "dalam:masuk", "a", "b", "dalam:keluar", "luar:keluar"]
+
+
+def test_concurrency_limit_middleware_caps_parallel_requests(monkeypatch):
+    monkeypatch.setattr(config, "GEMINI_MAX_CONCURRENT_REQUESTS", 2)
+    running = [0, 0]  # sedang berjalan, maksimum
+
+    async def slow_stage(request):
+        running[0] += 1
+        running[1] = max(running[1], running[0])
+        await asyncio.sleep(0.01)
+        running[0] -= 1
+
+    engine = pipeline.Pipeline([slow_stage], [pipeline.concurrency_limit_middleware])
+
+    async def scenario():
+        await asyncio.gather(*(engine.run(make_request()) for _ in range(6)))
+
+    asyncio.run(scenario())
+    assert running[1] == 2
+
+
+def test_concurrency_limit_change_waits_until_semaphore_is_idle(monkeypatch):
+    monkeypatch.setattr(config, "GEMINI_MAX_CONCURRENT_REQUESTS", 1)
+    running = [0, 0]
+    release = None
+
+    async def blocking_stage(request):
+        running[0] += 1
+        running[1] = max(running[1], running[0])
+        await release.wait()
+        running[0] -= 1
+
+    engine = pipeline.Pipeline([blocking_stage], [pipeline.concurrency_limit_middleware])
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        first = asyncio.create_task(engine.run(make_request()))
+        await asyncio.sleep(0)
+        # Reload config saat permintaan pertama masih memegang semaphore
+        config.GEMINI_MAX_CONCURRENT_REQUESTS = 2
+        pipeline.reset_middleware_state()
+        others = [asyncio.create_task(engine.run(make_request())) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        assert running[1] == 1  # Semaphore lama (batas 1) tetap dipakai, tidak ada 1 + 2 sekaligus
+        release.set()
+        await asyncio.gather(first, *others)
+        await engine.run(make_request())
+
+    asyncio.run(scenario())
+    assert running[1] == 1
+    assert pipeline._concurrency_limit == 2
+
+
+def test_in_flight_middleware_and_wait_until_idle():
+    async def stage(request):
+        await asyncio.sleep(0.01)
+
+    engine = pipeline.Pipeline([stage], [pipeline.in_flight_middleware])
+
+    async def scenario():
+        task = asyncio.create_task(engine.run(make_request()))
+        await asyncio.sleep(0)
+        assert pipeline.in_flight_count() == 1
+        assert await pipeline.wait_until_idle(timeout=1)
+        await task
+        return pipeline.in_flight_count()
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_response_cache_key_includes_history_fingerprint():
+    request = make_request()
+    other_history = make_request(history=[records.HistoryTurn("user", "sebelumnya")])
+    assert pipeline._response_cache_key(request) != pipeline._response_cache_key(other_history)
+    assert pipeline._response_cache_key(make_request(image_refs=[{"hash": "x"}])) is None
+
+
+def test_cached_reply_skips_generation_but_is_persisted(fake_backends, monkeypatch):
+    monkeypatch.setattr(config, "RESPONSE_CACHE_ENABLED", True)
+
+    async def scenario():
+        first = await gemini_client.generate_response("halo", 5)
+        await supabase_manager.delete_chat_history_db(5)
+        # Prompt dan riwayat (kosong) sama persis: diambil dari cache
+        cached = await gemini_client.generate_response("halo", 5)
+        # Riwayat sekarang berisi giliran dari cache, jadi kuncinya berbeda
+        fresh = await gemini_client.generate_response("halo", 5)
+        return first, cached, fresh
+
+    first, cached, fresh = asyncio.run(scenario())
+
+    assert first == cached == fresh
+    assert sum(model.calls for model in fake_backends.models.values()) == 2
+    rows = fake_backends.supabase.tables[supabase_manager.CHAT_HISTORY_TABLE]
+    assert [row["role"] for row in rows] == ["user", "model", "user", "model"]
+    assert len(pipeline._response_cache) == 2
+
+
+def test_streaming_delivers_partial_text_before_the_final_reply(fake_backends, monkeypatch):
+    monkeypatch.setattr(config, "STREAM_PARTIAL_UPDATE_INTERVAL", 0)
+    for model in fake_backends.models.values():
+        model.reply_text = "Balasan panjang yang dikirim dalam beberapa potongan teks."
+    partials = []
+
+    async def on_partial_text(text):
+        partials.append(text)
+
+    reply_text = asyncio.run(gemini_client.generate_response("halo", 6, on_partial_text=on_partial_text))
+
+    assert len(partials) == 3
+    assert all(reply_text.startswith(partial) for partial in partials)
+    assert partials[-1] == reply_text
+    rows = fake_backends.supabase.tables[supabase_manager.CHAT_HISTORY_TABLE]
+    assert rows[-1]["content"] == reply_text
+
+
+def test_streaming_middleware_throttles_callbacks_and_is_opt_in(monkeypatch):
+    monkeypatch.setattr(config, "STREAM_PARTIAL_UPDATE_INTERVAL", 60)
+    partials = []
+
+    async def on_partial_text(text):
+        partials.append(text)
+
+    async def fake_generate(request):
+        for text in ("a", "ab", "abc"):
+            await request.on_partial_text(text)
+        request.finish("abc")
+
+    async def no_stream(request):
+        assert not request.stream
+        request.finish("ok")
+
+    engine = pipeline.Pipeline([fake_generate], [pipeline.streaming_middleware])
+    request = make_request(on_partial_text=on_partial_text)
+    assert asyncio.run(engine.run(request)) == "abc"
+    assert request.stream and partials == ["a"]
+    assert request.on_partial_text is on_partial_text
+
+    plain = pipeline.Pipeline([no_stream], [pipeline.streaming_middleware])
+    assert asyncio.run(plain.run(make_request())) == "ok"
+    monkeypatch.setattr(config, "STREAMING_ENABLED", False)
+    assert asyncio.run(plain.run(make_request(on_partial_text=on_partial_text))) == "ok"
@@ -0,0 +1,72 @@
+import json
+import config
+import lifecycle
+import records
+import supabase_manager
+
+
+def test_roles_are_interned():
+    role = "".join(["us", "er"])
+    assert role is not records.ROLE_USER
+    assert records.intern_role(role) is records.ROLE_USER
+
+
+def test_to_sdk_history_without_images():
+    turns = [records.HistoryTurn(records.ROLE_USER, "halo"), records.HistoryTurn(records.ROLE_MODEL, "hai")]
+    assert records.to_sdk_history(turns) == [
+        {"role": "user", "parts": [{"text": "halo"}]},
+        {"role": "model", "parts": [{"text": "hai"}]},
+    ]
+
+
+def test_format_history_rows_orders_oldest_first_and_caps_images(monkeypatch):
+    monkeypatch.setattr(config, "CHAT_HISTORY_MAX_IMAGES", 3)
+    refs = [{"hash": str(i)} for i in range(5)]
+    rows = [  # Urutan terbaru dulu, seperti dari database
+        {"role": "model", "content": "jawaban", "image_refs": None},
+        {"role": "user", "content": "album baru", "image_refs": refs[:2]},
+        {"role": "user", "content": "album lama", "image_refs": refs[2:]},
+    ]
+
+    history = supabase_manager._format_history_rows(rows)
+
+    assert [turn.text for turn in history] == ["album lama", "album baru", "jawaban"]
+    # Gambar pesan terbaru diprioritaskan
+    assert history[1].images == (refs[0], refs[1])
+    assert history[0].images == (refs[2],)
+    assert history[2].images == ()
+
+
+def test_album_images_round_trip_through_json():
+    images = [records.AlbumImage("file-1", "uniq-1", "keterangan", 10), records.AlbumImage("file-2", message_id=11)]
+    restored = records.album_images_from_json(json.loads(json.dumps(images)))
+    assert restored == images
+    assert all(isinstance(image, records.AlbumImage) for image in restored)
+
+
+def test_album_images_from_old_dict_snapshot():
+    items = [{"file_id": "file-1", "file_unique_id": "uniq-1", "caption": None, "message_id": 10}]
+    assert records.album_images_from_json(items) == [records.AlbumImage("file-1", "uniq-1", None, 10)]
+
+
+def test_pending_album_snapshot_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "PENDING_ALBUMS_SNAPSHOT_PATH", str(tmp_path / "albums.json"))
+    album = [records.AlbumImage("file-1", "uniq-1", "caption", 10), records.AlbumImage("file-2", "uniq-2", None, 11)]
+    bot_data = {
+        "media_groups": {-100: {"555": list(album)}},
+        "recent_albums": {"-100_444": tuple(album)},
+    }
+
+    assert lifecycle.save_pending_albums(bot_data) == 1
+    restored_data = {}
+    assert lifecycle.load_pending_albums(restored_data) == [(-100, "555")]
+    assert restored_data["media_groups"] == {-100: {"555": album}}
+    assert restored_data["recent_albums"] == {"-100_444": tuple(album)}
+
+
+def test_to_sdk_history_drops_image_refs_without_a_resolver():
+    turns = [records.HistoryTurn(records.ROLE_USER, "lihat ini", ({"hash": "abc", "mime_type": "image/jpeg"},))]
+    assert records.to_sdk_history(turns) == [{"role": "user", "parts": [{"text": "lihat ini"}]}]
+
+    resolved = records.to_sdk_history(turns, lambda ref: {"inline_data": {"mime_type": ref["mime_type"], "data": b"x"}})
+    assert resolved[0]["parts"][1] == {"inline_data": {"mime_type": "image/jpeg", "data": b"x"}}
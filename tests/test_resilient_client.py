@@ -0,0 +1,173 @@
+import asyncio
+import pytest
+import config
+import resilient_client
+
+
+@pytest.fixture(autouse=True)
+def resilient_config(monkeypatch):
+    monkeypatch.setattr(resilient_client, "circuit_breakers", {})
+    monkeypatch.setattr(config, "GEMINI_MAX_RETRIES", 2)
+    monkeypatch.setattr(config, "GEMINI_RETRY_BASE_DELAY", 0.0)
+    monkeypatch.setattr(config, "GEMINI_HEDGE_ENABLED", False)
+    monkeypatch.setattr(config, "GEMINI_TOTAL_TIMEOUT_FACTOR", 1.5)
+    monkeypatch.setattr(config, "CIRCUIT_BREAKER_WINDOW", 60)
+    monkeypatch.setattr(config, "CIRCUIT_BREAKER_MIN_REQUESTS", 4)
+    monkeypatch.setattr(config, "CIRCUIT_BREAKER_ERROR_RATE", 0.5)
+    monkeypatch.setattr(config, "CIRCUIT_BREAKER_COOLDOWN", 30)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilient_client.time, "monotonic", lambda: now[0])
+    return now
+
+
+class ScriptedCalls:
+    """make_call palsu: setiap model menjalankan daftar hasil berurutan (nilai, exception, atau "hang")."""
+
+    def __init__(self, **scripts):
+        self.scripts = {model: list(results) for model, results in scripts.items()}
+        self.calls = []
+
+    def __call__(self, model_name: str):
+        self.calls.append(model_name)
+        outcome = self.scripts[model_name].pop(0) if len(self.scripts[model_name]) > 1 else self.scripts[model_name][0]
+        return self._run(outcome)
+
+    async def _run(self, outcome):
+        if outcome == "hang":
+            await asyncio.sleep(3600)
+        if isinstance(outcome, tuple):
+            delay, outcome = outcome
+            await asyncio.sleep(delay)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+def test_breaker_opens_half_opens_and_closes(clock):
+    breaker = resilient_client.CircuitBreaker("model")
+    for success in (True, False, True, False):
+        assert breaker.allow_request()
+        breaker.record(success)
+    assert breaker.state == "open"
+    assert not breaker.allow_request()
+
+    clock[0] += 31
+    assert breaker.allow_request()
+    assert breaker.state == "half_open"
+    assert not breaker.allow_request()  # Hanya satu permintaan percobaan
+    breaker.record(True)
+    assert breaker.state == "closed"
+
+
+def test_breaker_reopens_when_half_open_probe_fails(clock):
+    breaker = resilient_client.CircuitBreaker("model")
+    breaker._open(clock[0])
+    clock[0] += 31
+    assert breaker.allow_request()
+    breaker.record(False)
+    assert breaker.state == "open"
+
+
+def test_breaker_ignores_old_outcomes(clock):
+    breaker = resilient_client.CircuitBreaker("model")
+    for _ in range(3):
+        breaker.record(False)
+    clock[0] += 61
+    breaker.record(False)
+    assert breaker.state == "closed"
+
+
+def test_transient_errors_are_retried():
+    make_call = ScriptedCalls(a=[ConnectionError("putus"), ConnectionError("putus"), "ok"])
+    assert asyncio.run(resilient_client.call("a", make_call, timeout=1)) == "ok"
+    assert make_call.calls == ["a", "a", "a"]
+
+
+def test_exhausted_retries_fall_back():
+    make_call = ScriptedCalls(a=[ConnectionError("putus")], b=["cadangan"])
+    assert asyncio.run(resilient_client.call("a", make_call, fallback_model_name="b", timeout=1)) == "cadangan"
+    assert make_call.calls == ["a", "a", "a", "b"]
+
+
+def test_timeout_goes_to_fallback_without_same_model_retry():
+    make_call = ScriptedCalls(a=["hang"], b=["cadangan"])
+    assert asyncio.run(resilient_client.call("a", make_call, fallback_model_name="b", timeout=0.05)) == "cadangan"
+    assert make_call.calls == ["a", "b"]
+
+
+def test_total_deadline_bounds_timeouts_on_both_models():
+    make_call = ScriptedCalls(a=["hang"], b=["hang"])
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        with pytest.raises(asyncio.TimeoutError):
+            await resilient_client.call("a", make_call, fallback_model_name="b", timeout=0.1)
+        return loop.time() - started_at
+
+    # Timeout per percobaan 0.1 detik, total dibatasi 0.1 x 1.5
+    assert asyncio.run(scenario()) < 0.3
+    assert make_call.calls == ["a", "b"]
+
+
+def test_permanent_error_is_raised_and_neutral_for_breaker():
+    make_call = ScriptedCalls(a=[ValueError("argumen salah")], b=["cadangan"])
+    with pytest.raises(ValueError):
+        asyncio.run(resilient_client.call("a", make_call, fallback_model_name="b", timeout=1))
+    assert make_call.calls == ["a"]
+    breaker = resilient_client.get_circuit_breaker("a")
+    assert list(breaker.outcomes) == []
+
+
+def test_permanent_error_releases_half_open_slot(clock):
+    breaker = resilient_client.get_circuit_breaker("a")
+    breaker._open(clock[0])
+    clock[0] += 31
+    with pytest.raises(ValueError):
+        asyncio.run(resilient_client.call("a", ScriptedCalls(a=[ValueError("argumen salah")]), timeout=1))
+    assert breaker.state == "half_open"
+    assert breaker.allow_request()
+
+
+def test_open_circuit_falls_back_immediately(clock):
+    resilient_client.get_circuit_breaker("a")._open(clock[0])
+    make_call = ScriptedCalls(a=["tidak dipanggil"], b=["cadangan"])
+    assert asyncio.run(resilient_client.call("a", make_call, fallback_model_name="b", timeout=1)) == "cadangan"
+    assert make_call.calls == ["b"]
+
+
+def test_hedge_returns_faster_request_and_cancels_the_other(monkeypatch):
+    monkeypatch.setattr(config, "GEMINI_HEDGE_ENABLED", True)
+    monkeypatch.setattr(config, "GEMINI_HEDGE_DELAY", 0.02)
+    make_call = ScriptedCalls(a=["hang", (0.01, "hedge")])
+
+    async def scenario():
+        result = await resilient_client.call("a", make_call, timeout=1)
+        return result, [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+    result, leftover_tasks = asyncio.run(scenario())
+    assert result == "hedge"
+    assert make_call.calls == ["a", "a"]
+    assert leftover_tasks == []
+
+
+@pytest.mark.parametrize("cancel_after", [0.01, 0.05])
+def test_cancelled_caller_leaves_no_pending_attempts(monkeypatch, cancel_after):
+    # 0.01: dibatalkan saat menunggu hedge delay, 0.05: setelah hedge dikirim
+    monkeypatch.setattr(config, "GEMINI_HEDGE_ENABLED", True)
+    monkeypatch.setattr(config, "GEMINI_HEDGE_DELAY", 0.03)
+    make_call = ScriptedCalls(a=["hang"])
+
+    async def scenario():
+        task = asyncio.create_task(resilient_client.call("a", make_call, timeout=10))
+        await asyncio.sleep(cancel_after)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return [other for other in asyncio.all_tasks() if other is not asyncio.current_task()]
+
+    assert asyncio.run(scenario()) == []
+    assert not resilient_client.get_circuit_breaker("a").half_open_in_flight
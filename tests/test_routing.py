@@ -0,0 +1,27 @@
+import asyncio
+import gemini_client
+import pipeline
+import supabase_manager
+
+
+def test_classify_request_prefers_light_route_for_short_text():
+    assert gemini_client.classify_request("halo", 0, 0) == gemini_client.ROUTE_LIGHT
+    assert gemini_client.classify_request("halo", 1, 0) == gemini_client.ROUTE_STANDARD
+    assert gemini_client.classify_request("x" * 500, 0, 0) == gemini_client.ROUTE_STANDARD
+    assert gemini_client.classify_request("halo", 0, 0, command="td") == gemini_client.ROUTE_THINKING_LIGHT
+
+
+def test_follow_up_about_history_photo_uses_standard_route(fake_backends):
+    async def scenario():
+        image_ref = {"hash": "a" * 64, "mime_type": "image/jpeg"}
+        await supabase_manager.add_message_to_history(7, "user", "[Gambar] kucing", image_refs=[image_ref])
+        await supabase_manager.add_message_to_history(7, "model", "Itu kucing.")
+        request = pipeline.GenerationRequest(chat_id=7, prompt_parts=["warnanya apa?"], text_prompt_for_history="warnanya apa?")
+        await gemini_client.assemble_context_stage(request)
+        return request
+
+    request = asyncio.run(scenario())
+
+    assert request.num_images == 0
+    assert request.history[0].images
+    assert request.route == gemini_client.ROUTE_STANDARD
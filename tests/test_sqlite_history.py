@@ -0,0 +1,236 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+import sqlite_history
+
+
+@pytest.fixture
+def store(tmp_path):
+    history_store = sqlite_history.SQLiteHistoryStore(str(tmp_path / "history.sqlite3"))
+    yield history_store
+    history_store.close()
+
+
+def timestamp(second: int) -> str:
+    return f"2024-01-01T00:{second // 60:02d}:{second % 60:02d}+00:00"
+
+
+async def add_turns(store, chat_id: int, count: int) -> None:
+    for i in range(count):
+        await store.add_message(chat_id, "user" if i % 2 == 0 else "model", f"pesan {i}", None, timestamp(i))
+
+
+def test_recent_messages_newest_first_with_image_refs(store):
+    image_refs = [{"hash": "abc", "mime_type": "image/png"}]
+
+    async def scenario():
+        await add_turns(store, 1, 3)
+        await store.add_message(1, "user", "foto", image_refs, timestamp(10))
+        await store.add_message(2, "user", "chat lain", None, timestamp(11))
+        return await store.get_recent(1, 2)
+
+    rows = asyncio.run(scenario())
+    assert rows == [
+        {"role": "user", "content": "foto", "image_refs": image_refs},
+        {"role": "user", "content": "pesan 2", "image_refs": None},
+    ]
+
+
+def test_keyset_pages_cover_every_row_once(store):
+    async def scenario():
+        await add_turns(store, 1, 7)
+        pages = []
+        before = None
+        while True:
+            rows = await store.get_page(1, 3, before)
+            pages.append([row["content"] for row in rows])
+            if len(rows) < 3:
+                return pages
+            before = (rows[-1]["message_timestamp"], rows[-1]["id"])
+
+    assert asyncio.run(scenario()) == [
+        ["pesan 6", "pesan 5", "pesan 4"],
+        ["pesan 3", "pesan 2", "pesan 1"],
+        ["pesan 0"],
+    ]
+
+
+def test_delete_chat_only_touches_that_chat(store):
+    async def scenario():
+        await add_turns(store, 1, 2)
+        await add_turns(store, 2, 2)
+        deleted = await store.delete_chat(1)
+        return deleted, await store.get_recent(1, 10), await store.get_recent(2, 10)
+
+    deleted, chat_1, chat_2 = asyncio.run(scenario())
+    assert deleted == 2
+    assert chat_1 == []
+    assert len(chat_2) == 2
+
+
+def test_store_calls_do_not_block_the_event_loop(store):
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        ticker_task = asyncio.create_task(ticker())
+        await asyncio.sleep(0)
+        ticks_before = ticks
+        await asyncio.gather(*(store.add_message(1, "user", f"pesan {i}", None, timestamp(i)) for i in range(50)))
+        ticker_task.cancel()
+        return ticks - ticks_before
+
+    assert asyncio.run(scenario()) > 0
+
+
+def test_supabase_manager_api_on_sqlite_backend(store, monkeypatch):
+    import config
+    import records
+    import supabase_manager
+
+    monkeypatch.setattr(config, "HISTORY_BACKEND", "sqlite")
+    monkeypatch.setattr(config, "SQLITE_REPLICATE_TO_SUPABASE", False)
+    monkeypatch.setattr(sqlite_history, "_store", store)
+
+    async def scenario():
+        await supabase_manager.add_message_to_history(9, "user", "halo", image_refs=[{"hash": "abc"}])
+        await supabase_manager.add_message_to_history(9, "model", "hai")
+        history = await supabase_manager.get_chat_history(9)
+        reset = await supabase_manager.delete_chat_history_db(9)
+        return history, reset, await supabase_manager.get_chat_history(9)
+
+    history, reset, after_reset = asyncio.run(scenario())
+    assert history == [
+        records.HistoryTurn("user", "halo", ({"hash": "abc"},)),
+        records.HistoryTurn("model", "hai"),
+    ]
+    assert history[0].role is records.ROLE_USER
+    assert reset
+    assert after_reset == []
+
+
+def test_migrations_are_recorded_and_reapplied_only_once(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    sqlite_history.SQLiteHistoryStore(path).close()
+
+    import sqlite3
+    connection = sqlite3.connect(path)
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    # Simulasikan database dari versi sebelum tabel arsip ada
+    connection.execute("DROP TABLE chat_history_archive")
+    connection.execute("PRAGMA user_version=1")
+    connection.commit()
+    connection.close()
+
+    reopened = sqlite_history.SQLiteHistoryStore(path)
+    reopened_version = reopened._run(lambda: reopened._connection.execute("PRAGMA user_version").fetchone()[0])
+    archive_rows = reopened._run(lambda: reopened._connection.execute("SELECT COUNT(*) FROM chat_history_archive").fetchone()[0])
+    reopened.close()
+
+    assert version == len(sqlite_history.MIGRATIONS)
+    assert {"chat_history", "chat_history_archive"} <= tables
+    assert reopened_version == len(sqlite_history.MIGRATIONS)
+    assert archive_rows == 0
+
+
+def count_rows(store, table: str) -> int:
+    return store._run(lambda: store._connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0])
+
+
+@pytest.mark.parametrize("archive", [True, False])
+def test_prune_keeps_last_messages_of_every_chat_across_batches(store, monkeypatch, archive):
+    import config
+    monkeypatch.setattr(config, "HISTORY_RETENTION_BATCH_CHATS", 2)
+
+    async def scenario():
+        for chat_id in (-100, -5, 3, 8, 42):
+            await add_turns(store, chat_id, 6)
+        removed = await store.prune(4, None, archive, "2024-02-01T00:00:00+00:00")
+        return removed, {chat_id: await store.get_recent(chat_id, 10) for chat_id in (-100, 42)}
+
+    removed, recent = asyncio.run(scenario())
+    assert removed == 10
+    assert [row["content"] for row in recent[-100]] == ["pesan 5", "pesan 4", "pesan 3", "pesan 2"]
+    assert len(recent[42]) == 4
+    assert count_rows(store, "chat_history_archive") == (10 if archive else 0)
+
+
+def test_prune_removes_messages_older_than_cutoff(store, monkeypatch):
+    async def scenario():
+        await add_turns(store, 1, 6)
+        return await store.prune(100, timestamp(3), True, "2024-02-01T00:00:00+00:00"), await store.get_recent(1, 10)
+
+    removed, rows = asyncio.run(scenario())
+    assert removed == 3
+    assert [row["content"] for row in rows] == ["pesan 5", "pesan 4", "pesan 3"]
+
+
+def test_history_queries_run_between_prune_batches(store, monkeypatch):
+    import config
+    monkeypatch.setattr(config, "HISTORY_RETENTION_BATCH_CHATS", 1)
+
+    async def scenario():
+        for chat_id in range(10):
+            await add_turns(store, chat_id, 3)
+        prune_task = asyncio.create_task(store.prune(1, None, False, "2024-02-01T00:00:00+00:00"))
+        await asyncio.sleep(0)
+        rows = await store.get_recent(5, 10)
+        prune_done_first = prune_task.done()
+        return rows, prune_done_first, await prune_task
+
+    rows, prune_done_first, removed = asyncio.run(scenario())
+    assert rows
+    assert not prune_done_first
+    assert removed == 20
+
+
+class BatchedPruneRpc:
+    """Klien Supabase palsu untuk RPC prune_chat_history: setiap panggilan memakai satu hasil (removed, last_chat_id, finished)."""
+
+    def __init__(self, batches: list[tuple]):
+        self.batches = list(batches)
+        self.params = []
+
+    def rpc(self, function_name: str, params: dict):
+        assert function_name == "prune_chat_history"
+        self.params.append(params)
+        removed, last_chat_id, finished = self.batches.pop(0)
+        row = {"removed": removed, "last_chat_id": last_chat_id, "finished": finished}
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=[row]))
+
+
+def test_supabase_prune_follows_the_chat_cursor_until_finished(monkeypatch):
+    import config
+    import supabase_manager
+
+    rpc_client = BatchedPruneRpc([(3, 10, False), (3, 10, False), (1, 42, True)])
+    monkeypatch.setattr(config, "HISTORY_BACKEND", "supabase")
+    monkeypatch.setattr(config, "HISTORY_RETENTION_BATCH_ROWS", 3)
+    monkeypatch.setattr(config, "HISTORY_RETENTION_BATCH_CHATS", 50)
+    monkeypatch.setattr(config, "HISTORY_RETENTION_KEEP_LAST", 200)
+    monkeypatch.setattr(config, "HISTORY_RETENTION_MAX_AGE_DAYS", 30)
+    monkeypatch.setattr(supabase_manager, "supabase_client", rpc_client)
+
+    assert asyncio.run(supabase_manager.prune_chat_history()) == 7
+    assert rpc_client.params[0] == {
+        "keep_last": 200, "max_age": "30 days", "do_archive": config.HISTORY_ARCHIVE_ENABLED,
+        "p_limit": 3, "after_chat_id": None, "p_max_chats": 50,
+    }
+    assert [params["after_chat_id"] for params in rpc_client.params] == [None, 10, 10]
+    assert rpc_client.batches == []
+
+
+def test_replication_prune_uses_the_same_batch_loop(monkeypatch):
+    import supabase_manager
+
+    rpc_client = BatchedPruneRpc([(0, 50, False), (2, None, True)])
+    monkeypatch.setattr(supabase_manager, "supabase_client", rpc_client)
+
+    assert supabase_manager._supabase_prune(200, None) == 2
+    assert [params["after_chat_id"] for params in rpc_client.params] == [None, 50]
@@ -0,0 +1,68 @@
+import asyncio
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+import pytest
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop
+import config
+import startup
+
+
+class FakeMessage:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text):
+        self.replies.append(text)
+
+
+def make_update(message=None):
+    return SimpleNamespace(update_id=1, effective_message=message)
+
+
+def test_readiness_gate_holds_updates_until_ready(monkeypatch):
+    async def scenario():
+        monkeypatch.setattr(startup, "ready_event", asyncio.Event())
+        gate = startup.ReadinessGate(Update, startup.wait_until_ready)
+        update = Update(1)
+        gate_active_before = gate.check_update(update)
+
+        waiting = asyncio.create_task(startup.wait_until_ready(update, None))
+        await asyncio.sleep(0.01)
+        held = not waiting.done()
+        startup.ready_event.set()
+        await asyncio.wait_for(waiting, 1)
+        return gate_active_before, held, gate.check_update(update)
+
+    gate_active_before, held, gate_active_after = asyncio.run(scenario())
+
+    assert gate_active_before
+    assert held
+    assert not gate_active_after
+
+
+def test_update_is_dropped_with_a_reply_if_warm_up_times_out(monkeypatch):
+    monkeypatch.setattr(config, "STARTUP_READY_TIMEOUT", 0.01)
+    message = FakeMessage()
+
+    async def scenario():
+        monkeypatch.setattr(startup, "ready_event", asyncio.Event())
+        with pytest.raises(ApplicationHandlerStop):
+            await startup.wait_until_ready(make_update(message), None)
+
+    asyncio.run(scenario())
+    assert message.replies == ["Bot sedang bersiap, silakan coba lagi sebentar lagi."]
+
+
+def test_importing_modules_does_not_create_clients():
+    code = (
+        "import sys, supabase_manager, gemini_client; "
+        "assert supabase_manager.supabase_client is None; "
+        "assert gemini_client.gemini_model_base is None; "
+        "assert 'supabase' not in sys.modules and 'google.generativeai' not in sys.modules, sorted(sys.modules)"
+    )
+    root = os.path.dirname(os.path.abspath(startup.__file__))
+    result = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
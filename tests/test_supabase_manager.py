@@ -0,0 +1,37 @@
+import asyncio
+import pytest
+import config
+import fakes
+import supabase_manager
+
+
+@pytest.fixture
+def unmigrated_supabase(monkeypatch):
+    """Tabel chat_history Supabase tanpa kolom image_refs (migrations/001 belum dijalankan)."""
+    client = fakes.FakeSupabaseClient(missing_columns=("image_refs",))
+    monkeypatch.setattr(config, "HISTORY_BACKEND", "supabase")
+    monkeypatch.setattr(supabase_manager, "supabase_client", client)
+    monkeypatch.setattr(supabase_manager, "_image_refs_supported", True)
+    return client
+
+
+def test_history_works_without_the_image_refs_column(unmigrated_supabase, caplog):
+    async def scenario():
+        added = await supabase_manager.add_message_to_history(1, "user", "lihat foto", image_refs=[{"hash": "abc"}])
+        await supabase_manager.add_message_to_history(1, "model", "fotonya bagus")
+        return added, await supabase_manager.get_chat_history(1), await supabase_manager.get_chat_history_page(1)
+
+    added, history, (page_rows, _) = asyncio.run(scenario())
+
+    assert added
+    assert [(turn.role, turn.text, turn.images) for turn in history] == [("user", "lihat foto", ()), ("model", "fotonya bagus", ())]
+    assert [row["content"] for row in page_rows] == ["fotonya bagus", "lihat foto"]
+    assert "image_refs" not in unmigrated_supabase.tables[supabase_manager.CHAT_HISTORY_TABLE][0]
+    assert not supabase_manager._image_refs_supported
+    assert sum("migrations/001" in record.getMessage() for record in caplog.records) == 1
+
+
+def test_other_select_errors_are_not_retried(unmigrated_supabase):
+    unmigrated_supabase.missing_columns = {"role"}
+    assert asyncio.run(supabase_manager.get_chat_history(1)) == []
+    assert supabase_manager._image_refs_supported
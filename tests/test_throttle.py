@@ -0,0 +1,100 @@
+import pytest
+import config
+import throttle
+
+
+@pytest.fixture(autouse=True)
+def throttle_state(monkeypatch):
+    monkeypatch.setattr(throttle, "_windows", {})
+    monkeypatch.setattr(throttle, "_daily_tokens", {})
+    monkeypatch.setattr(throttle, "_notified_until", {})
+    monkeypatch.setattr(config, "THROTTLE_ENABLED", True)
+    monkeypatch.setattr(config, "ADMIN_USER_IDS", [1])
+    monkeypatch.setattr(config, "THROTTLE_LIMITS", {"text": {"user": (2, 60), "chat": (3, 60)}})
+    monkeypatch.setattr(config, "DAILY_TOKEN_QUOTA_PER_USER", 100)
+    monkeypatch.setattr(config, "DAILY_TOKEN_QUOTA_PER_CHAT", 1000)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [86400 * 20000 + 100.0]
+    monkeypatch.setattr(throttle.time, "time", lambda: now[0])
+    return now
+
+
+def test_user_window_allows_limit_then_rejects_until_oldest_expires(clock):
+    assert throttle.check_request("text", 10, 500) is None
+    clock[0] += 10
+    assert throttle.check_request("text", 10, 500) is None
+    assert throttle.check_request("text", 10, 500) == throttle.REASON_RATE
+
+    clock[0] += 50  # Permintaan pertama keluar dari jendela 60 detik
+    assert throttle.check_request("text", 10, 500) is None
+    assert throttle.check_request("text", 10, 500) == throttle.REASON_RATE
+
+
+def test_chat_window_is_shared_by_users(clock):
+    for user_id in (10, 11, 12):
+        assert throttle.check_request("text", user_id, 500) is None
+    assert throttle.check_request("text", 13, 500) == throttle.REASON_RATE
+    assert throttle.check_request("text", 13, 501) is None
+
+
+def test_rejected_requests_do_not_consume_the_window(clock):
+    for _ in range(2):
+        throttle.check_request("text", 10, 500)
+    throttle.check_request("text", 10, 500)
+    # Penolakan user 10 tidak ikut mengisi jendela chat
+    assert throttle.check_request("text", 11, 500) is None
+
+
+def test_admin_and_unknown_kind_are_not_limited(clock):
+    for _ in range(5):
+        assert throttle.check_request("text", 1, 500) is None
+        assert throttle.check_request("td", 10, 501) is None
+
+
+def test_daily_token_quota_resets_next_day(clock):
+    throttle.record_tokens(10, 500, 60)
+    assert throttle.check_request("text", 10, 500) is None
+    throttle.record_tokens(10, 500, 60)
+    clock[0] += 1
+    assert throttle.check_request("text", 10, 500) == throttle.REASON_QUOTA
+    assert throttle.check_request("text", 11, 500) is None  # Kuota chat masih tersisa
+
+    clock[0] += 86400
+    assert throttle.check_request("text", 10, 500) is None
+
+
+def test_chat_quota_applies_to_every_user(clock):
+    throttle.record_tokens(10, 500, 1000)
+    assert throttle.check_request("text", 11, 500) == throttle.REASON_QUOTA
+
+
+def test_rejection_message_sent_once_per_window_and_read_from_config(clock, monkeypatch):
+    monkeypatch.setattr(config, "THROTTLE_MESSAGES", {"rate": "Pelan-pelan ({kind}).", "quota": "Habis."})
+    assert throttle.rejection_message(throttle.REASON_RATE, "text", 10, 500) == "Pelan-pelan (text)."
+    assert throttle.rejection_message(throttle.REASON_RATE, "text", 10, 500) is None
+
+    # Teks baru setelah reload config langsung dipakai
+    monkeypatch.setattr(config, "THROTTLE_MESSAGES", {"rate": "Teks baru.", "quota": "Habis."})
+    clock[0] += 61
+    assert throttle.rejection_message(throttle.REASON_RATE, "text", 10, 500) == "Teks baru."
+
+
+def test_prune_and_state_round_trip(clock, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "THROTTLE_STATE_PATH", str(tmp_path / "throttle.json"))
+    throttle.check_request("text", 10, 500)
+    throttle.record_tokens(10, 500, 30)
+    assert throttle.save_state()
+
+    monkeypatch.setattr(throttle, "_windows", {})
+    monkeypatch.setattr(throttle, "_daily_tokens", {})
+    assert throttle.load_state()
+    assert throttle._tokens_used("user", 10) == 30
+    assert len(throttle._windows[("text", "user", 10)]) == 1
+
+    clock[0] += 86400
+    assert throttle.prune() == 4  # Dua jendela (user, chat) dan dua kuota harian
+    assert throttle._windows == {}
+    assert throttle._daily_tokens == {}
@@ -0,0 +1,73 @@
+import pytest
+import config
+import trigger_matcher
+
+
+@pytest.fixture(autouse=True)
+def triggers(monkeypatch):
+    monkeypatch.setattr(config, "GROUP_TRIGGER_COMMANDS", ["/ai", "/AIM", "/tanya"])
+    monkeypatch.setattr(trigger_matcher, "_bot_id", None)
+    monkeypatch.setattr(trigger_matcher, "_bot_username", None)
+    monkeypatch.setattr(trigger_matcher, "_pattern", None)
+    monkeypatch.setattr(trigger_matcher, "_triggers_by_lower", {})
+    trigger_matcher.set_bot_identity(999, "geminibot")
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("/ai apa kabar", ("/ai", "apa kabar")),
+    ("/ai@geminibot apa kabar", ("/ai", "apa kabar")),
+    ("/AI@GeminiBot apa kabar", ("/ai", "apa kabar")),
+    ("/Tanya   spasi di depan ", ("/tanya", "spasi di depan")),
+    ("/ai", ("/ai", "")),
+    ("/aim tujuan", ("/AIM", "tujuan")),
+    ("/ai baris satu\nbaris dua", ("/ai", "baris satu\nbaris dua")),
+])
+def test_trigger_matches(text, expected):
+    assert trigger_matcher.match(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "/ai@botlain apa kabar",
+    "/aix apa kabar",
+    "halo /ai",
+    "",
+    None,
+])
+def test_trigger_rejects(text):
+    assert trigger_matcher.match(text) is None
+
+
+def test_any_mention_accepted_before_bot_identity_is_known(monkeypatch):
+    monkeypatch.setattr(trigger_matcher, "_bot_username", None)
+    trigger_matcher.rebuild()
+    assert trigger_matcher.match("/ai@siapasaja halo") == ("/ai", "halo")
+
+
+def test_rebuild_picks_up_new_triggers(monkeypatch):
+    monkeypatch.setattr(config, "GROUP_TRIGGER_COMMANDS", ["/baru"])
+    trigger_matcher.rebuild()
+    assert trigger_matcher.match("/ai halo") is None
+    assert trigger_matcher.match("/baru@geminibot halo") == ("/baru", "halo")
+
+
+def make_message(chat_type: str, text: str, reply_from_id: int | None = None):
+    from datetime import datetime, timezone
+    from telegram import Chat, Message, User
+
+    chat = Chat(id=-100 if chat_type != Chat.PRIVATE else 5, type=chat_type)
+    reply = None
+    if reply_from_id is not None:
+        reply = Message(1, datetime.now(timezone.utc), chat, from_user=User(reply_from_id, "Bot", is_bot=True), text="balasan")
+    return Message(2, datetime.now(timezone.utc), chat, from_user=User(5, "User", is_bot=False), text=text, reply_to_message=reply)
+
+
+@pytest.mark.parametrize("chat_type, text, reply_from_id, expected", [
+    ("private", "halo", None, True),
+    ("supergroup", "halo semua", None, False),
+    ("supergroup", "/ai@geminibot halo", None, True),
+    ("group", "lanjut", 999, True),
+    ("group", "lanjut", 123, False),
+    ("channel", "/ai halo", None, False),
+])
+def test_addressed_to_bot_filter(chat_type, text, reply_from_id, expected):
+    assert trigger_matcher.ADDRESSED_TO_BOT.filter(make_message(chat_type, text, reply_from_id)) is expected
@@ -0,0 +1,94 @@
+import asyncio
+import json
+from types import SimpleNamespace
+import pytest
+import config
+import update_recorder
+
+
+@pytest.fixture(autouse=True)
+def recorder_config(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "UPDATE_RECORDER_SALT", "salt-tes")
+    monkeypatch.setattr(config, "UPDATE_RECORDER_REDACT", True)
+    monkeypatch.setattr(config, "UPDATE_RECORDER_PATH", str(tmp_path / "updates.jsonl"))
+    monkeypatch.setattr(update_recorder, "_salt", None)
+    monkeypatch.setattr(update_recorder, "_record_queue", None)
+    monkeypatch.setattr(update_recorder, "_writer_thread", None)
+
+
+def sample_update() -> dict:
+    return {
+        "update_id": 7,
+        "message": {
+            "message_id": 3,
+            "date": 1700000000,
+            "chat": {"id": -100123456, "type": "supergroup", "title": "Grup Rahasia"},
+            "from": {"id": 4242, "is_bot": False, "first_name": "Budi", "last_name": "Santoso", "username": "budis"},
+            "text": "/ai@geminibot nomor saya 0812",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 13}],
+            "author_signature": "Budi S.",
+            "forward_origin": {"type": "hidden_user", "date": 1700000000, "sender_user_name": "Ani Wijaya"},
+            "contact": {"phone_number": "+62812", "first_name": "Ani"},
+            "photo": [{"file_id": "AgACAgUAAx", "file_unique_id": "AQADx", "width": 90, "height": 90}],
+            "poll": {"id": "5", "question": "Siapa ketua?", "options": [{"text": "Budi", "voter_count": 1}]},
+            "users_shared": {"request_id": 1, "user_ids": [4242, 77], "users": [{"user_id": 77, "first_name": "Cici"}]},
+            "reply_to_message": {
+                "message_id": 2, "date": 1700000000, "chat": {"id": -100123456, "type": "supergroup"},
+                "from": {"id": 999, "is_bot": True, "first_name": "Gemini", "username": "geminibot"},
+                "text": "jawaban bot",
+            },
+        },
+    }
+
+
+def test_redact_removes_personal_data():
+    message = update_recorder.redact(sample_update())["message"]
+    serialized = json.dumps(message)
+
+    for secret in ("Budi", "Santoso", "budis", "Grup Rahasia", "Ani", "0812", "+62812", "Siapa", "Cici", "AgACAgUAAx", "AQADx"):
+        assert secret not in serialized
+    assert "contact" not in message
+    assert message["text"] == "/ai@geminibot xxxxx xxxx 0000"
+    assert message["author_signature"] == ""
+    assert message["forward_origin"]["sender_user_name"] == "User"
+    assert message["poll"]["question"] == "xxxxx xxxxx?"
+    assert message["poll"]["options"][0]["text"] == "xxxx"
+
+
+def test_redact_pseudonymizes_ids_consistently():
+    message = update_recorder.redact(sample_update())["message"]
+
+    assert message["chat"]["id"] < 0
+    assert message["chat"]["id"] != -100123456
+    assert message["from"]["id"] == update_recorder.pseudonymize_id(4242)
+    assert message["users_shared"]["user_ids"] == [update_recorder.pseudonymize_id(4242), update_recorder.pseudonymize_id(77)]
+    assert message["users_shared"]["users"][0]["user_id"] == update_recorder.pseudonymize_id(77)
+    assert message["photo"][0]["file_id"] == update_recorder.pseudonymize_file_id("AgACAgUAAx")
+    # User bot dibiarkan agar reply ke bot tetap dikenali saat replay
+    assert message["reply_to_message"]["from"]["id"] == 999
+    assert message["reply_to_message"]["from"]["username"] == "geminibot"
+
+
+def test_mask_text_keeps_utf16_length_and_command():
+    text = "/tanya Halo 😀 123"
+    masked = update_recorder.mask_text(text)
+    assert masked == "/tanya xxxx 😀 000"
+    assert len(masked.encode("utf-16-le")) == len(text.encode("utf-16-le"))
+
+
+def test_record_update_writes_in_background_and_close_flushes():
+    bot = SimpleNamespace(id=999, username="geminibot")
+    update = SimpleNamespace(update_id=7, to_dict=sample_update)
+
+    async def scenario():
+        for _ in range(3):
+            await update_recorder.record_update(update, SimpleNamespace(bot=bot))
+
+    asyncio.run(scenario())
+    assert update_recorder.close(timeout=5)
+
+    meta, entries = update_recorder.read_trace(config.UPDATE_RECORDER_PATH)
+    assert meta["bot_id"] == 999
+    assert meta["redacted"] is True
+    assert len(entries) == 3
+    assert entries[0]["update"]["message"]["chat"]["title"] == "Chat"
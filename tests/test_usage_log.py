@@ -0,0 +1,76 @@
+import json
+import sys
+from datetime import datetime, timezone
+import pytest
+import config
+import usage_log
+
+
+def ts(day: str, hour: int = 12) -> float:
+    return datetime.fromisoformat(f"{day}T{hour:02d}:00:00+00:00").timestamp()
+
+
+def entry(chat_id, day="2024-05-01", hour=12, **fields):
+    fields.setdefault("model", config.GEMINI_MODEL_NAME)
+    fields.setdefault("route", "standar")
+    return {"ts": ts(day, hour), "chat_id": chat_id, "input_tokens": 0, "output_tokens": 0, "thinking_tokens": 0, **fields}
+
+
+@pytest.mark.parametrize("values, fraction, expected", [
+    (list(range(1, 21)), 0.50, 10),
+    (list(range(1, 21)), 0.95, 19),
+    (list(range(10, 0, -1)), 0.95, 10),
+    ([7.5], 0.50, 7.5),
+    ([], 0.95, 0.0),
+])
+def test_percentile_uses_nearest_rank(values, fraction, expected):
+    assert usage_log.percentile(values, fraction) == expected
+
+
+def test_fallback_turns_are_priced_by_the_model_that_answered(monkeypatch):
+    monkeypatch.setattr(config, "MODEL_ROUTES", {
+        "murah": {"model": "model-murah", "fallback_model": "model-mahal", "input_price_per_1m": 1.0, "output_price_per_1m": 2.0},
+        "mahal": {"model": "model-mahal", "input_price_per_1m": 10.0, "output_price_per_1m": 20.0},
+    })
+    primary = entry(1, route="murah", model="model-murah", input_tokens=1_000_000, output_tokens=500_000)
+    fallback = dict(primary, model="model-mahal")
+    unknown_model = dict(primary, model="model-lain")
+
+    assert usage_log.estimate_cost(primary) == pytest.approx(2.0)
+    assert usage_log.estimate_cost(fallback) == pytest.approx(20.0)
+    # Model tanpa harga memakai harga route
+    assert usage_log.estimate_cost(unknown_model) == pytest.approx(2.0)
+
+
+def test_report_groups_days_and_orders_top_chats():
+    entries = [
+        entry(1, "2024-05-01", 1, input_tokens=100, output_tokens=10, latency=1.0),
+        entry(2, "2024-05-01", 23, input_tokens=500, output_tokens=50, thinking_tokens=20, latency=3.0, images=2),
+        entry(3, "2024-05-02", 0, input_tokens=50, latency=2.0),
+        entry(1, "2024-05-02", 8, cache_hit=True, latency=0.0),
+    ]
+
+    report = usage_log.build_report(entries, top=2)
+
+    assert [chat_id for chat_id, _ in report["top_chats"]] == [2, 1]
+    assert report["top_chats"][0][1] == {"turns": 1, "tokens": 570, "images": 2, "cost": pytest.approx(usage_log.estimate_cost(entries[1]))}
+    assert report["top_chats"][1][1]["turns"] == 2
+    assert list(report["days"]) == ["2024-05-01", "2024-05-02"]
+    assert report["days"]["2024-05-01"]["turns"] == 2
+    assert report["days"]["2024-05-01"]["input_tokens"] == 600
+    assert report["days"]["2024-05-02"]["cache_hits"] == 1
+    # Cache hit tidak ikut dalam latensi model
+    assert report["models"][config.GEMINI_MODEL_NAME]["count"] == 3
+    assert report["models"][config.GEMINI_MODEL_NAME]["p50"] == 2.0
+
+
+def test_report_cli_reads_daily_files(tmp_path, monkeypatch, capsys):
+    lines = [json.dumps(entry(7, "2024-05-01", input_tokens=42)), "bukan json", ""]
+    (tmp_path / "usage-2024-05-01.jsonl").write_text("\n".join(lines) + "\n", encoding="utf-8")
+    monkeypatch.setattr(sys, "argv", ["usage_log.py", "--log-dir", str(tmp_path), "--top", "5"])
+
+    usage_log.main()
+
+    output = capsys.readouterr().out
+    assert "2024-05-01" in output
+    assert any(line.split()[:3] == ["7", "1", "42"] for line in output.splitlines())
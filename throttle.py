@@ -0,0 +1,193 @@
+"""
+Pembatasan permintaan per user dan per chat, dicek di handler sebelum gemini_client dipanggil.
+
+- Rate limit sliding window per jenis permintaan ("text", "image", "td"), lihat config.THROTTLE_LIMITS.
+  Setiap kunci hanya menyimpan deque timestamp dengan panjang maksimal = batas permintaan.
+- Kuota token harian per user dan per chat (DAILY_TOKEN_QUOTA_PER_USER / _PER_CHAT),
+  dihitung dari usage_metadata setelah Gemini menjawab.
+- Pengguna yang terkena limit mendapat balasan penolakan yang sudah disiapkan, paling banyak
+  sekali per jendela waktu, tanpa memanggil Gemini.
+"""
+import json
+import logging
+import os
+import time
+from collections import deque
+import config
+
+logger = logging.getLogger(__name__)
+
+REASON_RATE = "rate"
+REASON_QUOTA = "quota"
+
+_windows = {}          # (kind, scope, id) -> deque timestamp permintaan yang diizinkan
+_daily_tokens = {}     # (scope, id) -> [hari, jumlah token]
+_notified_until = {}   # (reason, kind, user_id, chat_id) -> timestamp sampai kapan penolakan tidak dikirim ulang
+
+
+def _today() -> int:
+    return int(time.time() // 86400)
+
+
+def _is_exempt(user_id: int | None) -> bool:
+    return user_id is not None and user_id in config.ADMIN_USER_IDS
+
+
+def _check_window(key: tuple, max_requests: int, window: float, now: float) -> bool:
+    timestamps = _windows.get(key)
+    if timestamps is None or timestamps.maxlen != max_requests:
+        timestamps = deque(timestamps or (), maxlen=max_requests)
+        _windows[key] = timestamps
+    return len(timestamps) < max_requests or now - timestamps[0] >= window
+
+
+def _quota_for(scope: str) -> int | None:
+    return config.DAILY_TOKEN_QUOTA_PER_USER if scope == "user" else config.DAILY_TOKEN_QUOTA_PER_CHAT
+
+
+def _tokens_used(scope: str, scope_id: int) -> int:
+    entry = _daily_tokens.get((scope, scope_id))
+    if entry is None or entry[0] != _today():
+        return 0
+    return entry[1]
+
+
+def check_request(kind: str, user_id: int | None, chat_id: int) -> str | None:
+    """
+    Mengecek apakah permintaan jenis `kind` boleh diteruskan ke Gemini.
+    Jika boleh, permintaan langsung dicatat dan None dikembalikan; jika tidak, alasan penolakan (REASON_*).
+    """
+    if not config.THROTTLE_ENABLED or _is_exempt(user_id):
+        return None
+
+    scopes = [("chat", chat_id)]
+    if user_id is not None:
+        scopes.insert(0, ("user", user_id))
+
+    for scope, scope_id in scopes:
+        quota = _quota_for(scope)
+        if quota and _tokens_used(scope, scope_id) >= quota:
+            logger.info(f"Kuota token harian {scope} {scope_id} habis, permintaan {kind} ditolak.")
+            return REASON_QUOTA
+
+    now = time.time()
+    limits = config.THROTTLE_LIMITS.get(kind, {})
+    window_keys = []
+    for scope, scope_id in scopes:
+        limit = limits.get(scope)
+        if not limit:
+            continue
+        max_requests, window = limit
+        key = (kind, scope, scope_id)
+        if not _check_window(key, max_requests, window, now):
+            logger.info(f"Rate limit {kind} untuk {scope} {scope_id} tercapai ({max_requests}/{window} detik), permintaan ditolak.")
+            return REASON_RATE
+        window_keys.append(key)
+
+    for key in window_keys:
+        _windows[key].append(now)
+    return None
+
+
+def record_tokens(user_id: int | None, chat_id: int, tokens: int) -> None:
+    """Menambahkan pemakaian token ke kuota harian user dan chat."""
+    if not config.THROTTLE_ENABLED or not tokens:
+        return
+    today = _today()
+    for key in (("user", user_id), ("chat", chat_id)):
+        if key[1] is None:
+            continue
+        entry = _daily_tokens.get(key)
+        if entry is None or entry[0] != today:
+            _daily_tokens[key] = [today, tokens]
+        else:
+            entry[1] += tokens
+
+
+def rejection_message(reason: str, kind: str, user_id: int | None, chat_id: int) -> str | None:
+    """
+    Mengembalikan teks penolakan yang sudah disiapkan, atau None jika user ini baru saja diberi tahu
+    (agar spam tidak dibalas berulang kali).
+    """
+    now = time.time()
+    notify_key = (reason, kind, user_id, chat_id)
+    if _notified_until.get(notify_key, 0) > now:
+        return None
+
+    if reason == REASON_RATE:
+        limit = config.THROTTLE_LIMITS.get(kind, {}).get("user") or config.THROTTLE_LIMITS.get(kind, {}).get("chat")
+        _notified_until[notify_key] = now + (limit[1] if limit else 60)
+    else:
+        _notified_until[notify_key] = (_today() + 1) * 86400
+
+    # Dibaca dari config setiap kali agar teks baru langsung berlaku setelah reload
+    template = config.THROTTLE_MESSAGES.get(f"{reason}_{kind}") or config.THROTTLE_MESSAGES[reason]
+    return template.format(kind=kind)
+
+
+def prune() -> int:
+    """Membuang jendela dan kuota yang sudah kedaluwarsa agar memori tidak terus bertambah."""
+    now = time.time()
+    today = _today()
+    removed = 0
+    for key in list(_windows):
+        kind, scope, _ = key
+        limit = config.THROTTLE_LIMITS.get(kind, {}).get(scope)
+        timestamps = _windows[key]
+        if not limit or not timestamps or now - timestamps[-1] >= limit[1]:
+            del _windows[key]
+            removed += 1
+    for key in [key for key, entry in _daily_tokens.items() if entry[0] != today]:
+        del _daily_tokens[key]
+        removed += 1
+    for key in [key for key, until in _notified_until.items() if until <= now]:
+        del _notified_until[key]
+        removed += 1
+    return removed
+
+
+def save_state() -> bool:
+    """Menyimpan state ke config.THROTTLE_STATE_PATH (jika diatur) agar limit tetap berlaku setelah restart."""
+    path = config.THROTTLE_STATE_PATH
+    if not path or not config.THROTTLE_ENABLED:
+        return False
+    prune()
+    state = {
+        "windows": [[kind, scope, scope_id, list(timestamps)] for (kind, scope, scope_id), timestamps in _windows.items()],
+        "daily_tokens": [[scope, scope_id, day, tokens] for (scope, scope_id), (day, tokens) in _daily_tokens.items()],
+    }
+    try:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as state_file:
+            json.dump(state, state_file, separators=(",", ":"))
+        os.replace(temp_path, path)
+        return True
+    except OSError as e:
+        logger.error(f"Gagal menyimpan state throttle ke {path}: {e}")
+        return False
+
+
+def load_state() -> bool:
+    """Memuat state throttle dari config.THROTTLE_STATE_PATH (jika ada)."""
+    path = config.THROTTLE_STATE_PATH
+    if not path or not os.path.exists(path):
+        return False
+    try:
+        with open(path, encoding="utf-8") as state_file:
+            state = json.load(state_file)
+    except (OSError, ValueError) as e:
+        logger.error(f"Gagal membaca state throttle dari {path}: {e}")
+        return False
+
+    for kind, scope, scope_id, timestamps in state.get("windows", []):
+        limit = config.THROTTLE_LIMITS.get(kind, {}).get(scope)
+        if limit:
+            _windows[(kind, scope, scope_id)] = deque(timestamps, maxlen=limit[0])
+    for scope, scope_id, day, tokens in state.get("daily_tokens", []):
+        _daily_tokens[(scope, scope_id)] = [day, tokens]
+    prune()
+    logger.info(f"State throttle dimuat dari {path}: {len(_windows)} jendela, {len(_daily_tokens)} kuota harian.")
+    return True
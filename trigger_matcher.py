@@ -0,0 +1,80 @@
+"""
+Pencocok trigger command grup (misal "/ai", "/ask") yang dikompilasi sekali menjadi satu regex.
+
+Mendukung akhiran username bot seperti "/ai@namabot". ADDRESSED_TO_BOT adalah filter
+MessageHandler, jadi pesan grup yang bukan untuk bot ditolak saat pengecekan filter,
+sebelum coroutine handler dijadwalkan.
+"""
+import logging
+import re
+from telegram import Message
+from telegram.constants import ChatType
+from telegram.ext import filters
+import config
+
+logger = logging.getLogger(__name__)
+
+GROUP_CHAT_TYPES = (ChatType.GROUP, ChatType.SUPERGROUP)
+
+_pattern = None
+_triggers_by_lower = {}
+_bot_id = None
+_bot_username = None
+
+
+def build_pattern(triggers: list[str], bot_username: str | None = None) -> re.Pattern:
+    """
+    Membuat regex `^(trigger)(@username)?(spasi|akhir)(sisa teks)`.
+    Jika username bot belum diketahui, akhiran @apa_saja diterima.
+    """
+    alternatives = "|".join(re.escape(trigger) for trigger in sorted(triggers, key=len, reverse=True))
+    mention = f"@{re.escape(bot_username)}" if bot_username else r"@\w+"
+    return re.compile(rf"^({alternatives})(?:{mention})?(?:\s+|$)(.*)", re.IGNORECASE | re.DOTALL)
+
+
+def rebuild() -> None:
+    """Mengompilasi ulang regex dari config.GROUP_TRIGGER_COMMANDS (saat startup dan setelah reload config)."""
+    global _pattern, _triggers_by_lower
+    triggers = [trigger for trigger in config.GROUP_TRIGGER_COMMANDS if trigger]
+    _triggers_by_lower = {trigger.lower(): trigger for trigger in triggers}
+    _pattern = build_pattern(triggers, _bot_username) if triggers else None
+    logger.info(f"Trigger grup dikompilasi: {triggers} (username bot: {_bot_username or 'belum diketahui'}).")
+
+
+def set_bot_identity(bot_id: int, bot_username: str | None) -> None:
+    """Diisi di post_init setelah get_me, agar reply ke bot dan akhiran @username bisa dicek."""
+    global _bot_id, _bot_username
+    _bot_id = bot_id
+    _bot_username = bot_username
+    rebuild()
+
+
+def match(text: str | None) -> tuple[str, str] | None:
+    """Mengembalikan (trigger sesuai config, teks setelah trigger) atau None jika bukan trigger."""
+    if not text or _pattern is None:
+        return None
+    trigger_match = _pattern.match(text)
+    if trigger_match is None:
+        return None
+    trigger, rest = trigger_match.groups()
+    return _triggers_by_lower.get(trigger.lower(), trigger), rest.strip()
+
+
+def is_reply_to_bot(message: Message) -> bool:
+    reply = message.reply_to_message
+    return bool(reply and reply.from_user and _bot_id is not None and reply.from_user.id == _bot_id)
+
+
+class AddressedToBotFilter(filters.MessageFilter):
+    """Lolos untuk private chat, reply ke bot, atau pesan grup yang diawali trigger command."""
+
+    def filter(self, message: Message) -> bool:
+        chat_type = message.chat.type
+        if chat_type == ChatType.PRIVATE:
+            return True
+        if chat_type not in GROUP_CHAT_TYPES:
+            return False
+        return is_reply_to_bot(message) or match(message.text) is not None
+
+
+ADDRESSED_TO_BOT = AddressedToBotFilter(name="ADDRESSED_TO_BOT")
@@ -0,0 +1,215 @@
+"""
+Perekam update Telegram untuk direplay (benchmarks/replay_updates.py).
+
+Setiap update ditulis sebagai satu baris JSON {"ts": ..., "update": {...}} ke config.UPDATE_RECORDER_PATH.
+Baris pertama setiap sesi rekaman berisi {"meta": {...}} dengan id dan username bot.
+
+Jika UPDATE_RECORDER_REDACT aktif, data pribadi dihapus sebelum ditulis:
+- id user dan chat diganti pseudonim yang konsisten (hash dengan salt), tanda negatif id grup dipertahankan
+- nama, username, judul chat, dan tanda tangan penulis diganti placeholder
+- teks, caption, dan pertanyaan polling disamarkan per karakter (huruf -> "x", angka -> "0") dengan panjang yang sama,
+  jadi offset entity tetap valid; token pertama yang diawali "/" (command/trigger) dipertahankan
+- file_id diganti pseudonim, kontak, lokasi, dan nomor telepon dibuang
+User bot (is_bot=True) tidak disamarkan agar reply ke bot tetap dikenali saat replay.
+
+Redaksi dan penulisan ke disk dilakukan thread latar belakang (seperti usage_log.py),
+jadi handler hanya memasukkan update ke antrian.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from telegram import Update
+from telegram.ext import CallbackContext, TypeHandler
+import config
+
+logger = logging.getLogger(__name__)
+
+NAME_KEYS = {
+    "first_name": "User", "last_name": "", "username": "user", "title": "Chat", "bio": "", "description": "",
+    "sender_user_name": "User", "author_signature": "",
+}
+ID_KEYS = {"id", "chat_id", "user_id", "sender_chat_id", "migrate_to_chat_id", "migrate_from_chat_id", "user_ids", "chat_ids"}
+FILE_ID_KEYS = {"file_id", "file_unique_id", "thumbnail_file_id"}
+TEXT_KEYS = {"text", "caption", "question", "explanation"}
+DROPPED_KEYS = {"contact", "location", "venue", "phone_number", "email", "shipping_address", "order_info", "invite_link", "url"}
+
+_record_queue: queue.Queue | None = None
+_writer_thread: threading.Thread | None = None
+_dropped_updates = 0
+_salt = None
+
+
+def _get_salt() -> bytes:
+    global _salt
+    if _salt is None:
+        # Tanpa UPDATE_RECORDER_SALT, pseudonim hanya konsisten di dalam satu proses
+        _salt = (config.UPDATE_RECORDER_SALT or "").encode() or os.urandom(16)
+    return _salt
+
+
+def pseudonymize_id(value: int) -> int:
+    digest = hmac.new(_get_salt(), str(abs(value)).encode(), hashlib.sha256).digest()
+    pseudonym = int.from_bytes(digest[:6], "big") % 10**12 + 1
+    return -pseudonym if value < 0 else pseudonym
+
+
+def pseudonymize_file_id(value: str) -> str:
+    return "f" + hmac.new(_get_salt(), value.encode(), hashlib.sha256).hexdigest()[:31]
+
+
+def mask_text(text: str) -> str:
+    """Menyamarkan teks dengan panjang UTF-16 yang sama; command/trigger di awal teks dipertahankan."""
+    head = ""
+    if text.startswith("/"):
+        head = text.split(None, 1)[0]
+    masked = []
+    for char in text[len(head):]:
+        if char.isdigit():
+            masked.append("0")
+        elif char.isalpha() and ord(char) <= 0xFFFF:
+            masked.append("x")
+        else:
+            masked.append(char)
+    return head + "".join(masked)
+
+
+def redact(data):
+    """Menghapus data pribadi dari dict update (rekursif, termasuk reply_to_message)."""
+    if isinstance(data, list):
+        return [redact(item) for item in data]
+    if not isinstance(data, dict):
+        return data
+    if data.get("is_bot") is True:
+        return data
+
+    redacted = {}
+    for key, value in data.items():
+        if key in DROPPED_KEYS:
+            continue
+        if key in ID_KEYS and isinstance(value, int) and not isinstance(value, bool):
+            redacted[key] = pseudonymize_id(value)
+        elif key in ID_KEYS and isinstance(value, list):
+            # Misal users_shared.user_ids
+            redacted[key] = [pseudonymize_id(item) if isinstance(item, int) and not isinstance(item, bool) else redact(item) for item in value]
+        elif key in NAME_KEYS and isinstance(value, str):
+            redacted[key] = NAME_KEYS[key]
+        elif key in FILE_ID_KEYS and isinstance(value, str):
+            redacted[key] = pseudonymize_file_id(value)
+        elif key in TEXT_KEYS and isinstance(value, str):
+            redacted[key] = mask_text(value)
+        else:
+            redacted[key] = redact(value)
+    return redacted
+
+
+def _open_record_file(meta: dict):
+    path = config.UPDATE_RECORDER_PATH
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    record_file = open(path, "a", encoding="utf-8")
+    record_file.write(json.dumps({"meta": meta}) + "\n")
+    logger.info(f"Perekam update aktif, menulis ke {path} (redaksi: {meta['redacted']}).")
+    return record_file
+
+
+def _writer_worker(meta: dict) -> None:
+    try:
+        record_file = _open_record_file(meta)
+    except OSError as e:
+        logger.error(f"Gagal membuka file rekaman {config.UPDATE_RECORDER_PATH}, update tidak akan direkam: {e}")
+        record_file = None
+
+    while True:
+        batch = [_record_queue.get()]
+        while len(batch) < 200:
+            try:
+                batch.append(_record_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            if record_file is not None:
+                lines = []
+                for entry in batch:
+                    if entry is None:
+                        continue
+                    ts, data = entry
+                    if meta["redacted"]:
+                        data = redact(data)
+                    lines.append(json.dumps({"ts": ts, "update": data}, ensure_ascii=False) + "\n")
+                record_file.write("".join(lines))
+                record_file.flush()
+        except Exception as e:
+            logger.error(f"Gagal menulis {len(batch)} update ke file rekaman: {e}")
+        finally:
+            for _ in batch:
+                _record_queue.task_done()
+        if None in batch:
+            # Sinyal berhenti dari close()
+            if record_file is not None:
+                record_file.close()
+            return
+
+
+async def record_update(update: Update, context: CallbackContext) -> None:
+    """Handler group -2: memasukkan update ke antrian rekaman sebelum handler lain berjalan (tidak pernah memblokir)."""
+    global _record_queue, _writer_thread, _dropped_updates
+    try:
+        if _writer_thread is None:
+            meta = {"bot_id": context.bot.id, "bot_username": context.bot.username, "started_at": time.time(), "redacted": config.UPDATE_RECORDER_REDACT}
+            _record_queue = queue.Queue(maxsize=config.UPDATE_RECORDER_QUEUE_SIZE)
+            _writer_thread = threading.Thread(target=_writer_worker, args=(meta,), name="update-recorder", daemon=True)
+            _writer_thread.start()
+        _record_queue.put_nowait((time.time(), update.to_dict()))
+    except queue.Full:
+        _dropped_updates += 1
+        if _dropped_updates % 100 == 1:
+            logger.warning(f"Antrian perekam update penuh, {_dropped_updates} update dibuang sejauh ini.")
+    except Exception as e:
+        logger.error(f"Gagal merekam update {update.update_id}: {e}")
+
+
+def install(application) -> None:
+    application.add_handler(TypeHandler(Update, record_update), group=-2)
+
+
+def close(timeout: float | None = None) -> bool:
+    """Menulis sisa antrian lalu menutup file rekaman. Mengembalikan False jika timeout."""
+    global _record_queue, _writer_thread
+    if _writer_thread is None:
+        return True
+    try:
+        _record_queue.put(None, timeout=timeout)
+    except queue.Full:
+        return False
+    _writer_thread.join(timeout)
+    finished = not _writer_thread.is_alive()
+    _record_queue = None
+    _writer_thread = None
+    return finished
+
+
+def read_trace(path: str) -> tuple[dict, list[dict]]:
+    """Membaca file rekaman. Mengembalikan (meta sesi pertama, daftar {"ts", "update"})."""
+    meta = {}
+    entries = []
+    with open(path, encoding="utf-8") as trace_file:
+        for line in trace_file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warning(f"Baris rusak dilewati di {path}.")
+                continue
+            if "meta" in record:
+                meta = meta or record["meta"]
+            else:
+                entries.append(record)
+    return meta, entries
@@ -0,0 +1,216 @@
+"""
+Pencatatan pemakaian per giliran (token input/output/thinking, jumlah gambar, model, latensi, cache hit).
+
+Setiap giliran ditulis sebagai satu baris JSON ke file harian `usage-YYYY-MM-DD.jsonl` di
+config.USAGE_LOG_DIR. Penulisan dilakukan thread latar belakang, jadi handler tidak pernah menunggu disk.
+
+Laporan dari log:
+    python usage_log.py --days 7 --top 10
+"""
+import argparse
+import glob
+import json
+import logging
+import math
+import os
+import queue
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+import config
+
+logger = logging.getLogger(__name__)
+
+_log_queue: queue.Queue | None = None
+_writer_thread: threading.Thread | None = None
+_dropped_entries = 0
+
+
+def _log_path(day: str) -> str:
+    return os.path.join(config.USAGE_LOG_DIR, f"usage-{day}.jsonl")
+
+
+def _write_batch(batch: list[dict]) -> None:
+    lines_by_day = defaultdict(list)
+    for entry in batch:
+        day = datetime.fromtimestamp(entry["ts"], timezone.utc).strftime("%Y-%m-%d")
+        lines_by_day[day].append(json.dumps(entry, separators=(",", ":"), ensure_ascii=False))
+    os.makedirs(config.USAGE_LOG_DIR, exist_ok=True)
+    for day, lines in lines_by_day.items():
+        with open(_log_path(day), "a", encoding="utf-8") as log_file:
+            log_file.write("\n".join(lines) + "\n")
+
+
+def _writer_worker():
+    while True:
+        batch = [_log_queue.get()]
+        while len(batch) < config.USAGE_LOG_BATCH_SIZE:
+            try:
+                batch.append(_log_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            _write_batch(batch)
+        except Exception as e:
+            logger.error(f"Gagal menulis {len(batch)} catatan pemakaian: {e}")
+        finally:
+            for _ in batch:
+                _log_queue.task_done()
+
+
+def record(entry: dict) -> None:
+    """Menambahkan satu catatan pemakaian ke antrian tulis (tidak pernah memblokir)."""
+    global _log_queue, _writer_thread, _dropped_entries
+    if not config.USAGE_LOG_ENABLED:
+        return
+    if _writer_thread is None:
+        _log_queue = queue.Queue(maxsize=config.USAGE_LOG_QUEUE_SIZE)
+        _writer_thread = threading.Thread(target=_writer_worker, name="usage-log-writer", daemon=True)
+        _writer_thread.start()
+    try:
+        _log_queue.put_nowait(entry)
+    except queue.Full:
+        _dropped_entries += 1
+        if _dropped_entries % 100 == 1:
+            logger.warning(f"Antrian log pemakaian penuh, {_dropped_entries} catatan dibuang sejauh ini.")
+
+
+def flush(timeout: float | None = None) -> bool:
+    """Menunggu semua catatan di antrian tertulis ke disk. Mengembalikan False jika timeout."""
+    if _log_queue is None:
+        return True
+    done = threading.Event()
+
+    def wait_queue():
+        _log_queue.join()
+        done.set()
+
+    threading.Thread(target=wait_queue, daemon=True).start()
+    return done.wait(timeout)
+
+
+# Laporan
+
+def read_entries(days: int | None = None, log_dir: str | None = None):
+    """Membaca catatan pemakaian dari file harian (opsional hanya `days` hari terakhir)."""
+    log_dir = log_dir or config.USAGE_LOG_DIR
+    first_day = None
+    if days:
+        first_day = (datetime.now(timezone.utc) - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    for path in sorted(glob.glob(os.path.join(log_dir, "usage-*.jsonl"))):
+        day = os.path.basename(path)[len("usage-"):-len(".jsonl")]
+        if first_day and day < first_day:
+            continue
+        with open(path, encoding="utf-8") as log_file:
+            for line in log_file:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logger.warning(f"Baris rusak dilewati di {path}.")
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """Persentil dengan metode nearest-rank."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def _model_prices() -> dict:
+    """Harga per model dari MODEL_ROUTES (model utama setiap route); route pertama yang menyebut model dipakai."""
+    prices = {}
+    for route_config in config.MODEL_ROUTES.values():
+        if route_config.get("model") and "input_price_per_1m" in route_config:
+            prices.setdefault(route_config["model"], route_config)
+    return prices
+
+
+def estimate_cost(entry: dict, model_prices: dict | None = None) -> float:
+    """
+    Perkiraan biaya satu giliran dengan harga model yang benar-benar menjawab (termasuk fallback).
+    Jika model tidak punya harga di MODEL_ROUTES, harga route dipakai.
+    """
+    if model_prices is None:
+        model_prices = _model_prices()
+    price_config = model_prices.get(entry.get("model")) or config.MODEL_ROUTES.get(entry.get("route") or "", {})
+    output_tokens = entry.get("output_tokens", 0) + entry.get("thinking_tokens", 0)
+    return (
+        entry.get("input_tokens", 0) * price_config.get("input_price_per_1m", 0.0)
+        + output_tokens * price_config.get("output_price_per_1m", 0.0)
+    ) / 1_000_000
+
+
+def build_report(entries, top: int = 10) -> dict:
+    """Menghitung chat termahal, latensi per model (p50/p95), dan token per hari."""
+    chats = defaultdict(lambda: {"turns": 0, "tokens": 0, "images": 0, "cost": 0.0})
+    latencies_by_model = defaultdict(list)
+    days = defaultdict(lambda: {"turns": 0, "input_tokens": 0, "output_tokens": 0, "thinking_tokens": 0, "cache_hits": 0, "cost": 0.0})
+    model_prices = _model_prices()
+
+    for entry in entries:
+        tokens = entry.get("input_tokens", 0) + entry.get("output_tokens", 0) + entry.get("thinking_tokens", 0)
+        cost = estimate_cost(entry, model_prices)
+
+        chat = chats[entry.get("chat_id")]
+        chat["turns"] += 1
+        chat["tokens"] += tokens
+        chat["images"] += entry.get("images", 0)
+        chat["cost"] += cost
+
+        if not entry.get("cache_hit") and entry.get("latency") is not None:
+            latencies_by_model[entry.get("model") or "-"].append(entry["latency"])
+
+        day = days[datetime.fromtimestamp(entry["ts"], timezone.utc).strftime("%Y-%m-%d")]
+        day["turns"] += 1
+        day["input_tokens"] += entry.get("input_tokens", 0)
+        day["output_tokens"] += entry.get("output_tokens", 0)
+        day["thinking_tokens"] += entry.get("thinking_tokens", 0)
+        day["cache_hits"] += 1 if entry.get("cache_hit") else 0
+        day["cost"] += cost
+
+    top_chats = sorted(chats.items(), key=lambda item: item[1]["tokens"], reverse=True)[:top]
+    models = {
+        model: {
+            "count": len(latencies),
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "max": max(latencies),
+        }
+        for model, latencies in latencies_by_model.items()
+    }
+    return {"top_chats": top_chats, "models": models, "days": dict(sorted(days.items()))}
+
+
+def print_report(report: dict) -> None:
+    print("Chat dengan token terbanyak:")
+    print(f"  {'chat_id':>16} {'giliran':>8} {'token':>12} {'gambar':>7} {'biaya USD':>10}")
+    for chat_id, chat in report["top_chats"]:
+        print(f"  {chat_id!s:>16} {chat['turns']:>8} {chat['tokens']:>12} {chat['images']:>7} {chat['cost']:>10.4f}")
+
+    print("\nLatensi per model (detik, tanpa cache hit):")
+    print(f"  {'model':<40} {'jumlah':>7} {'p50':>8} {'p95':>8} {'maks':>8}")
+    for model, stats in sorted(report["models"].items()):
+        print(f"  {model:<40} {stats['count']:>7} {stats['p50']:>8.2f} {stats['p95']:>8.2f} {stats['max']:>8.2f}")
+
+    print("\nToken per hari (UTC):")
+    print(f"  {'hari':<10} {'giliran':>8} {'input':>12} {'output':>12} {'thinking':>10} {'cache':>6} {'biaya USD':>10}")
+    for day, stats in report["days"].items():
+        print(f"  {day:<10} {stats['turns']:>8} {stats['input_tokens']:>12} {stats['output_tokens']:>12} "
+              f"{stats['thinking_tokens']:>10} {stats['cache_hits']:>6} {stats['cost']:>10.4f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Laporan pemakaian Gemini dari log pemakaian per giliran.")
+    parser.add_argument("--days", type=int, default=None, help="Hanya N hari terakhir (default: semua)")
+    parser.add_argument("--top", type=int, default=10, help="Jumlah chat termahal yang ditampilkan")
+    parser.add_argument("--log-dir", default=None, help=f"Folder log (default: {config.USAGE_LOG_DIR})")
+    args = parser.parse_args()
+    print_report(build_report(read_entries(args.days, args.log_dir), top=args.top))
+
+
+if __name__ == "__main__":
+    main()